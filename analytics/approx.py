@@ -0,0 +1,113 @@
+"""
+Modo aproximado: amostra estratificada de alunos e estimativas com margem de erro
+Cada aluno é sorteado pelo hash do seu id (hash < probabilidade do estrato),
+então a amostra é a mesma em todos os processos e cargas e se comporta como um
+sketch de contagem distinta combinável: a união de partes sorteadas com a mesma
+regra é a amostra do todo. Todas as linhas dos alunos sorteados entram na
+amostra, o que permite estimar registros, médias e alunos distintos para
+qualquer combinação de filtros.
+"""
+import numpy as np
+import pandas as pd
+
+
+# Quantil da normal para intervalos de 95%
+Z_95 = 1.96
+
+# Maior matriz grupo x aluno (em elementos) montada de forma densa
+MATRIZ_MAX_CELULAS = 1 << 22
+
+
+def student_hashes(ids):
+    """
+    Hash uniforme em [0, 1) de cada id de aluno (independe da ordem e do
+    dicionário; o mesmo id tem sempre o mesmo valor)
+    """
+    valores = np.asarray(ids).astype(str).astype(object)
+    return pd.util.hash_array(valores, categorize=False) / float(2 ** 64)
+
+
+class StudentSample:
+    """
+    Amostra de Poisson estratificada de alunos
+
+    Em cada estrato os alunos entram com probabilidade max(taxa, minimo / N),
+    limitada a 1: estratos pequenos ficam inteiros na amostra. indices dá a
+    posição de cada aluno sorteado na amostra (-1 para os demais) e pesos,
+    por posição, o inverso da probabilidade.
+    """
+
+    def __init__(self, hashes, estratos, n_estratos, taxa, minimo):
+        tamanhos = np.bincount(estratos[estratos >= 0], minlength=n_estratos)
+        with np.errstate(divide='ignore'):
+            por_estrato = np.minimum(1.0, np.maximum(taxa, minimo / tamanhos))
+        probabilidade = np.where(estratos >= 0, por_estrato.take(np.maximum(estratos, 0)), min(1.0, taxa))
+        sorteados = hashes < probabilidade
+        self.indices = np.where(sorteados, np.cumsum(sorteados) - 1, -1)
+        self.pesos = 1.0 / probabilidade[sorteados]
+
+    @property
+    def n_alunos(self):
+        return len(self.pesos)
+
+
+def _por_aluno(grupos, alunos, n_alunos, n_grupos, *valores):
+    """
+    Soma de cada valor por (grupo, aluno) presente nas linhas da amostra
+    Retorna o grupo e o aluno de cada par e as somas dos pares
+    
+    Matriz densa grupo x aluno quando cabe em MATRIZ_MAX_CELULAS (linear, sem
+    ordenar); senão os pares distintos são ordenados (np.unique).
+    """
+    chaves = grupos.astype(np.int64) * n_alunos + alunos
+    if n_grupos * n_alunos <= MATRIZ_MAX_CELULAS:
+        presenca = np.bincount(chaves, minlength=n_grupos * n_alunos)
+        pares = np.flatnonzero(presenca)
+        somas = [np.bincount(chaves, weights=v, minlength=n_grupos * n_alunos)[pares] for v in valores]
+    else:
+        pares, inverso = np.unique(chaves, return_inverse=True)
+        somas = [np.bincount(inverso, weights=v, minlength=len(pares)) for v in valores]
+    return pares // n_alunos, pares % n_alunos, somas
+
+
+def estimate_totals(grupos, alunos, pesos, n_grupos, valores=None):
+    """
+    Totais por grupo (estimador de Horvitz-Thompson) e meia-largura do
+    intervalo de 95%
+    
+    alunos são índices em pesos (um peso por aluno da amostra). valores None
+    conta alunos distintos por grupo; caso contrário soma o valor de cada
+    linha (por exemplo, 1 para contar registros). A variância de uma amostra
+    de Poisson é a soma de (1 - p) / p² * y² dos alunos sorteados, com y o
+    total do aluno no grupo.
+    """
+    if len(grupos) == 0:
+        return np.zeros(n_grupos), np.zeros(n_grupos)
+    if valores is None:
+        grupo, aluno, _ = _por_aluno(grupos, alunos, len(pesos), n_grupos)
+        # Cada aluno presente no grupo conta uma vez
+        y = np.ones(len(grupo))
+    else:
+        grupo, aluno, (y,) = _por_aluno(grupos, alunos, len(pesos), n_grupos, valores)
+    w = pesos.take(aluno)
+    total = np.bincount(grupo, weights=y * w, minlength=n_grupos)
+    variancia = np.bincount(grupo, weights=y * y * w * (w - 1), minlength=n_grupos)
+    return total, Z_95 * np.sqrt(variancia)
+
+
+def estimate_ratios(grupos, alunos, pesos, n_grupos, numerador, denominador):
+    """
+    Razões por grupo (soma do numerador / soma do denominador, ex.: média
+    das notas) e meia-largura do intervalo de 95% pela linearização da razão
+    """
+    if len(grupos) == 0:
+        return np.full(n_grupos, np.nan), np.full(n_grupos, np.nan)
+    grupo, aluno, (s, d) = _por_aluno(grupos, alunos, len(pesos), n_grupos, numerador, denominador)
+    w = pesos.take(aluno)
+    soma_s = np.bincount(grupo, weights=s * w, minlength=n_grupos)
+    soma_d = np.bincount(grupo, weights=d * w, minlength=n_grupos)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        razao = soma_s / soma_d
+        residuo = s - razao.take(grupo) * d
+        variancia = np.bincount(grupo, weights=residuo * residuo * w * (w - 1), minlength=n_grupos) / soma_d ** 2
+    return razao, Z_95 * np.sqrt(variancia)
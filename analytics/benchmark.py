@@ -0,0 +1,144 @@
+"""
+Benchmark do processador sobre um CSV de notas
+Mede carga, cálculo de status, filtros, agregações, estatísticas e pico de
+memória; o resultado é um dicionário serializável em JSON para comparar
+execuções entre commits
+"""
+import itertools
+import os
+import resource
+import statistics
+import time
+
+from django.test import override_settings
+
+from .data_processor import BigDataAnalytics, CHART_TYPES, COLUNAS_FILTRO
+
+
+def _pico_rss_mb():
+    """
+    Pico de memória residente do processo até agora (MB)
+
+    VmHWM é zerado no exec; ru_maxrss (fallback fora do Linux) preserva o
+    pico do processo pai que gerou o CSV.
+    """
+    try:
+        with open('/proc/self/status', encoding='ascii') as f:
+            for linha in f:
+                if linha.startswith('VmHWM:'):
+                    return round(int(linha.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def _medir(funcao, repeticoes):
+    """
+    Mediana (segundos) de repeticoes execuções e o último resultado
+    """
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return round(statistics.median(tempos), 6), resultado
+
+
+def _valores_de_filtro(engine):
+    """
+    Valor mais frequente de cada coluna de filtro (seleções não vazias)
+    """
+    return {
+        coluna: str(engine.df[coluna].value_counts().idxmax())
+        for coluna in COLUNAS_FILTRO
+    }
+
+
+def filter_combinations(valores):
+    """
+    Todas as combinações das colunas de filtro (inclusive sem filtros)
+    """
+    return [
+        {coluna: valores[coluna] for coluna in colunas}
+        for n in range(len(COLUNAS_FILTRO) + 1)
+        for colunas in itertools.combinations(COLUNAS_FILTRO, n)
+    ]
+
+
+def run_benchmark(csv_path, repeticoes=3):
+    """
+    Executa todas as medições sobre csv_path (sem snapshot nem cubo: mede o
+    caminho de carga a partir do CSV e as consultas sobre as linhas)
+    """
+    resultado = {
+        'csv_bytes': os.path.getsize(csv_path),
+        'rss_start_mb': _pico_rss_mb()
+    }
+
+    with override_settings(CSV_DATA_PATH=csv_path, ANALYTICS_SNAPSHOT_DIR=None,
+                           ANALYTICS_CUBE_MODE=False, ANALYTICS_STREAMING_MODE=False):
+        engine = BigDataAnalytics(load=False)
+        inicio = time.perf_counter()
+        engine._load_data()
+        resultado['load_data_s'] = round(time.perf_counter() - inicio, 6)
+    resultado['rows'] = len(engine.df)
+    resultado['students'] = len(engine.students)
+    resultado['rss_after_load_mb'] = _pico_rss_mb()
+
+    resultado['calculate_student_status_s'], _ = _medir(engine._calculate_student_status, repeticoes)
+
+    valores = _valores_de_filtro(engine)
+    resultado['filter_values'] = valores
+    resultado['filter_data'] = {}
+    for filtros in filter_combinations(valores):
+        tempo, df_filtered = _medir(lambda: engine.filter_data(filtros), repeticoes)
+        chave = '+'.join(filtros) or 'all'
+        resultado['filter_data'][chave] = {'s': tempo, 'rows': len(df_filtered)}
+
+    # Agregações sobre a tabela inteira (pior caso) e sobre uma filial
+    resultado['aggregate_data'] = {}
+    resultado['get_statistics'] = {}
+    for nome, filtros in [('all', {}), ('id_filial', {'id_filial': valores['id_filial']})]:
+        df_filtered = engine.filter_data(filtros)
+        resultado['aggregate_data'][nome] = {
+            chart_type: _medir(lambda: engine.aggregate_data(df_filtered, chart_type), repeticoes)[0]
+            for chart_type in CHART_TYPES
+        }
+        resultado['get_statistics'][nome] = _medir(lambda: engine.get_statistics(df_filtered), repeticoes)[0]
+
+    resultado['peak_rss_mb'] = _pico_rss_mb()
+    return resultado
+
+
+def compare(anterior, atual, tolerancia=0.10):
+    """
+    Métricas de tempo/memória que pioraram mais que tolerancia entre dois
+    resultados (listas de (escala, métrica, antes, depois))
+    """
+    def metricas(resultado):
+        for escala in resultado['scales']:
+            for caminho, valor in _folhas(escala):
+                # Tempos (segundos) e memória; a geração do CSV não é medida do processador
+                medida = (
+                    caminho[0] in ('aggregate_data', 'get_statistics')
+                    or caminho[-1] == 's'
+                    or caminho[-1].endswith(('_s', '_mb'))
+                )
+                if medida and caminho[-1] != 'generate_s':
+                    yield (escala['target_rows'], '.'.join(caminho)), valor
+
+    antes = dict(metricas(anterior))
+    pioras = []
+    for chave, depois in metricas(atual):
+        valor = antes.get(chave)
+        if isinstance(valor, (int, float)) and valor > 0 and depois > valor * (1 + tolerancia):
+            pioras.append((chave[0], chave[1], valor, depois))
+    return pioras
+
+
+def _folhas(dados, caminho=()):
+    for chave, valor in dados.items():
+        if isinstance(valor, dict):
+            yield from _folhas(valor, caminho + (chave,))
+        elif isinstance(valor, (int, float)) and not isinstance(valor, bool):
+            yield caminho + (chave,), valor
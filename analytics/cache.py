@@ -0,0 +1,128 @@
+"""
+Cache de resultados de consultas do dashboard
+LRU limitado por número de entradas, com expiração por tempo (TTL)
+Consultas iguais simultâneas são calculadas uma vez só (single-flight): quem
+chega durante o cálculo espera e recebe o mesmo resultado.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class _Calculo:
+    """
+    Cálculo em andamento de uma chave: resultado ou exceção, e o evento
+    sinalizado ao terminar
+    """
+
+    def __init__(self):
+        self.pronto = threading.Event()
+        self.valor = None
+        self.erro = None
+
+    def resultado(self):
+        self.pronto.wait()
+        if self.erro is not None:
+            raise self.erro
+        return self.valor
+
+
+class QueryCache:
+    """
+    Cache LRU/TTL thread-safe com contadores de acertos e falhas
+    """
+
+    def __init__(self, max_entries=256, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Cálculos em andamento por chave e requisições que esperaram por um deles
+        self._calculos = {}
+        self.coalesced = 0
+
+    def get(self, key):
+        """
+        Retorna (True, valor) em caso de acerto ou (False, None)
+        """
+        with self._lock:
+            entrada = self._entries.get(key)
+            if entrada is not None:
+                expira_em, valor = entrada
+                if self.ttl is None or expira_em > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, valor
+                del self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def get_or_compute(self, key, compute):
+        """
+        Valor em cache ou calculado por compute() e guardado
+
+        Se a mesma chave já está sendo calculada por outra thread, espera esse
+        cálculo e devolve o resultado dele (ou a mesma exceção), sem calcular
+        de novo. Vale mesmo com o cache desligado (max_entries = 0).
+        """
+        encontrado, valor = self.get(key)
+        if encontrado:
+            return valor
+        lider = False
+        with self._lock:
+            # O cálculo pode ter terminado entre o get e o lock: o valor é
+            # guardado antes de o cálculo sair de _calculos
+            entrada = self._entries.get(key)
+            if entrada is not None and (self.ttl is None or entrada[0] > time.monotonic()):
+                return entrada[1]
+            calculo = self._calculos.get(key)
+            if calculo is not None:
+                self.coalesced += 1
+            else:
+                calculo = self._calculos[key] = _Calculo()
+                lider = True
+        if not lider:
+            return calculo.resultado()
+        try:
+            calculo.valor = compute()
+            self.set(key, calculo.valor)
+        except BaseException as erro:
+            calculo.erro = erro
+            raise
+        finally:
+            with self._lock:
+                del self._calculos[key]
+            calculo.pronto.set()
+        return calculo.valor
+
+    def set(self, key, value):
+        if self.max_entries <= 0:
+            return
+        expira_em = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._entries[key] = (expira_em, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'coalesced': self.coalesced,
+                'hit_ratio': round(self.hits / total, 4) if total else 0.0
+            }
@@ -0,0 +1,248 @@
+"""
+Cubo OLAP pré-agregado sobre as dimensões de filtro do dashboard
+Cada célula guarda agregados parciais combináveis (contagens, soma, mínimo,
+máximo e a lista de alunos distintos), então qualquer combinação de filtros
+é respondida somando células, sem voltar às linhas da tabela de notas
+"""
+import numpy as np
+
+from . import histogram
+
+
+def _group_reduce(grupos, n_grupos, valores):
+    """
+    Agregados por grupo: quantidade de linhas, de notas válidas, soma, mínimo e máximo
+    """
+    n_linhas = np.bincount(grupos, minlength=n_grupos)
+    validas = ~np.isnan(valores)
+    n_notas = np.bincount(grupos[validas], minlength=n_grupos)
+    soma = np.bincount(grupos[validas], weights=valores[validas], minlength=n_grupos)
+
+    minimo = np.full(n_grupos, np.nan)
+    maximo = np.full(n_grupos, np.nan)
+    if validas.any():
+        ordem = np.argsort(grupos[validas], kind='stable')
+        ordenados = grupos[validas][ordem]
+        inicios = np.flatnonzero(np.r_[True, ordenados[1:] != ordenados[:-1]])
+        presentes = ordenados[inicios]
+        minimo[presentes] = np.minimum.reduceat(valores[validas][ordem], inicios)
+        maximo[presentes] = np.maximum.reduceat(valores[validas][ordem], inicios)
+    return n_linhas, n_notas, soma, minimo, maximo
+
+
+def _sorted_unique(valores):
+    """
+    Valores distintos ordenados (ordenação + comparação com o vizinho)
+    """
+    valores = np.sort(valores)
+    if len(valores) == 0:
+        return valores
+    return valores[np.r_[True, valores[1:] != valores[:-1]]]
+
+
+def _student_lists(grupos, n_grupos, alunos, n_alunos):
+    """
+    Listas (CSR) de alunos distintos por grupo: alunos[offsets[g]:offsets[g + 1]]
+    """
+    validos = alunos >= 0
+    chave = _sorted_unique(grupos[validos].astype(np.int64) * n_alunos + alunos[validos])
+    grupo_par = chave // n_alunos
+    offsets = np.zeros(n_grupos + 1, dtype=np.int64)
+    np.cumsum(np.bincount(grupo_par, minlength=n_grupos), out=offsets[1:])
+    return (chave % n_alunos).astype(np.int32), offsets
+
+
+def _cell_histograms(grupos, n_grupos, classes):
+    """
+    Histogramas finos das notas por grupo, esparsos (CSR): as classes
+    presentes no grupo g e suas contagens estão em [offsets[g], offsets[g + 1])
+    """
+    validas = classes >= 0
+    chaves, contagens = np.unique(
+        grupos[validas].astype(np.int64) * histogram.N_CLASSES + classes[validas], return_counts=True
+    )
+    return _histogram_lists(chaves // histogram.N_CLASSES, chaves % histogram.N_CLASSES, contagens, n_grupos)
+
+
+def _histogram_lists(grupos, classes, contagens, n_grupos):
+    """
+    Listas CSR a partir de pares (grupo, classe) distintos ordenados por grupo
+    """
+    offsets = np.zeros(n_grupos + 1, dtype=np.int64)
+    np.cumsum(np.bincount(grupos, minlength=n_grupos), out=offsets[1:])
+    return classes.astype(np.int8), contagens.astype(np.int32), offsets
+
+
+def _decode_keys(chaves, cardinalidades):
+    """
+    Códigos de cada dimensão (-1 = nulo) a partir das chaves combinadas
+    (códigos deslocados em +1, primeira dimensão mais significativa)
+    """
+    codigos = []
+    for cardinalidade in reversed(cardinalidades):
+        codigos.append((chaves % cardinalidade - 1).astype(np.int32))
+        chaves = chaves // cardinalidade
+    return codigos[::-1]
+
+
+def _gather(valores, offsets, grupos):
+    """
+    Concatena as fatias valores[offsets[g]:offsets[g + 1]] dos grupos selecionados
+    """
+    inicios = offsets[grupos]
+    tamanhos = offsets[grupos + 1] - inicios
+    total = int(tamanhos.sum())
+    if total == 0:
+        return valores[:0]
+    deslocamento = np.repeat(inicios - np.cumsum(tamanhos) + tamanhos, tamanhos)
+    return valores[deslocamento + np.arange(total)]
+
+
+class OlapCube:
+    """
+    Cubo com células no grão mais fino das dimensões informadas
+
+    dims: dicionário nome -> (códigos inteiros por linha (-1 = nulo), nº de valores)
+    student_dims: dimensões com poucos valores por aluno (filial, turma, status,
+    faixa); com filtros apenas nelas, os alunos distintos vêm de um segundo
+    nível de listas (uma entrada por aluno e combinação), bem menor que o fino
+    """
+
+    def __init__(self, dims, notas, alunos, n_alunos, student_dims=()):
+        self.dim_names = list(dims)
+        self.student_dims = [d for d in self.dim_names if d in student_dims]
+        self.n_alunos = n_alunos
+
+        # Códigos deslocados em +1 (0 = nulo) combinados em uma chave por célula
+        codigos = [np.asarray(dims[d][0], dtype=np.int64) + 1 for d in self.dim_names]
+        self.cardinalidades = [int(dims[d][1]) + 1 for d in self.dim_names]
+
+        self.cells, inverso = self._cells(codigos, self.dim_names)
+        n_celulas = len(self.cells[self.dim_names[0]]) if self.dim_names else 1
+        notas = np.asarray(notas, dtype=np.float64)
+        (self.n_linhas, self.n_notas, self.soma,
+         self.minimo, self.maximo) = _group_reduce(inverso, n_celulas, notas)
+        self.alunos, self.offsets = _student_lists(inverso, n_celulas, alunos, n_alunos)
+        self.hist_classes, self.hist_contagens, self.hist_offsets = _cell_histograms(
+            inverso, n_celulas, histogram.fine_bins(notas)
+        )
+
+        # Segundo nível: células só com as dimensões do aluno
+        codigos_aluno = [codigos[self.dim_names.index(d)] for d in self.student_dims]
+        self.student_cells, inverso_aluno = self._cells(codigos_aluno, self.student_dims)
+        n_celulas_aluno = len(self.student_cells[self.student_dims[0]]) if self.student_dims else 1
+        self.alunos_nivel2, self.offsets_nivel2 = _student_lists(inverso_aluno, n_celulas_aluno, alunos, n_alunos)
+
+    def _cells(self, codigos, nomes):
+        """
+        Células distintas (códigos de cada dimensão) e a célula de cada linha
+        """
+        n_linhas = len(codigos[0]) if codigos else 0
+        chave = np.zeros(n_linhas, dtype=np.int64)
+        for nome, c in zip(nomes, codigos):
+            chave = chave * self.cardinalidades[self.dim_names.index(nome)] + c
+        chaves, inverso = np.unique(chave, return_inverse=True)
+
+        cardinalidades = [self.cardinalidades[self.dim_names.index(nome)] for nome in nomes]
+        cells = dict(zip(nomes, _decode_keys(chaves, cardinalidades)))
+        return cells, inverso.reshape(-1)
+
+    @property
+    def n_cells(self):
+        return len(self.n_linhas)
+
+    def nbytes(self):
+        arrays = [self.n_linhas, self.n_notas, self.soma, self.minimo, self.maximo,
+                  self.alunos, self.offsets, self.alunos_nivel2, self.offsets_nivel2,
+                  self.hist_classes, self.hist_contagens, self.hist_offsets]
+        arrays += list(self.cells.values()) + list(self.student_cells.values())
+        return int(sum(a.nbytes for a in arrays))
+
+    def select(self, filtros):
+        """
+        Índices das células que atendem aos filtros (dimensão -> código)
+        """
+        mascara = np.ones(self.n_cells, dtype=bool)
+        for dim, codigo in filtros.items():
+            mascara &= self.cells[dim] == codigo
+        return np.flatnonzero(mascara)
+
+    def totals(self, celulas):
+        """
+        Agregados de toda a seleção
+        """
+        n_notas = int(self.n_notas[celulas].sum())
+        return {
+            'n_linhas': int(self.n_linhas[celulas].sum()),
+            'n_notas': n_notas,
+            'soma': float(self.soma[celulas].sum()),
+            'minimo': float(np.nanmin(self.minimo[celulas])) if n_notas else np.nan,
+            'maximo': float(np.nanmax(self.maximo[celulas])) if n_notas else np.nan
+        }
+
+    def group(self, celulas, dim):
+        """
+        Soma e quantidade de notas por código da dimensão (arrays indexados pelo código)
+        """
+        codigos = self.cells[dim][celulas]
+        validos = codigos >= 0
+        n = self.cardinalidades[self.dim_names.index(dim)] - 1
+        soma = np.bincount(codigos[validos], weights=self.soma[celulas][validos], minlength=n)
+        n_notas = np.bincount(codigos[validos], weights=self.n_notas[celulas][validos], minlength=n)
+        n_linhas = np.bincount(codigos[validos], weights=self.n_linhas[celulas][validos], minlength=n)
+        return soma, n_notas, n_linhas
+
+    def histogram(self, celulas):
+        """
+        Histograma fino das notas das células (soma das listas de cada uma)
+        """
+        classes = _gather(self.hist_classes, self.hist_offsets, celulas)
+        contagens = _gather(self.hist_contagens, self.hist_offsets, celulas)
+        return np.bincount(classes, weights=contagens, minlength=histogram.N_CLASSES).astype(np.int64)
+    
+    def _student_level(self, filtros):
+        """
+        Células do segundo nível que atendem aos filtros, ou None se algum
+        filtro não é uma dimensão do aluno
+        """
+        if not set(filtros) <= set(self.student_dims):
+            return None
+        mascara = np.ones(len(self.offsets_nivel2) - 1, dtype=bool)
+        for dim, codigo in filtros.items():
+            mascara &= self.student_cells[dim] == codigo
+        return np.flatnonzero(mascara)
+
+    def distinct_students(self, filtros, celulas=None):
+        """
+        Códigos dos alunos distintos da seleção (presença marcada com bincount)
+        """
+        celulas_aluno = self._student_level(filtros)
+        if celulas_aluno is not None:
+            alunos = _gather(self.alunos_nivel2, self.offsets_nivel2, celulas_aluno)
+        else:
+            if celulas is None:
+                celulas = self.select(filtros)
+            alunos = _gather(self.alunos, self.offsets, celulas)
+        return np.flatnonzero(np.bincount(alunos, minlength=self.n_alunos))
+
+    def distinct_students_by(self, filtros, dim, celulas=None):
+        """
+        Quantidade de alunos distintos por código da dimensão
+        """
+        celulas_aluno = self._student_level(filtros) if dim in self.student_dims else None
+        if celulas_aluno is not None:
+            codigos = self.student_cells[dim][celulas_aluno]
+            offsets, lista, celulas = self.offsets_nivel2, self.alunos_nivel2, celulas_aluno
+        else:
+            if celulas is None:
+                celulas = self.select(filtros)
+            codigos = self.cells[dim][celulas]
+            offsets, lista = self.offsets, self.alunos
+
+        n = self.cardinalidades[self.dim_names.index(dim)] - 1
+        tamanhos = offsets[celulas + 1] - offsets[celulas]
+        alunos = _gather(lista, offsets, celulas)
+        dim_linha = np.repeat(codigos, tamanhos)
+        validos = dim_linha >= 0
+        pares = _sorted_unique(dim_linha[validos].astype(np.int64) * self.n_alunos + alunos[validos])
+        return np.bincount(pares // self.n_alunos, minlength=n)
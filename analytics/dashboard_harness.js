@@ -0,0 +1,162 @@
+// Executa o script do dashboard com um DOM mínimo; fetch é respondido pelo
+// teste (uma linha JSON por requisição em stdout, a resposta em stdin)
+const fs = require('fs');
+const readline = require('readline');
+const vm = require('vm');
+
+const pagina = JSON.parse(fs.readFileSync(process.argv[2], 'utf-8'));
+const enviar = mensagem => process.stdout.write(JSON.stringify(mensagem) + '\n');
+const pendentes = [];
+readline.createInterface({ input: process.stdin }).on('line', linha => pendentes.shift()(JSON.parse(linha)));
+
+class Elemento {
+    constructor(dados) {
+        Object.assign(this, { value: '', checked: false, disabled: false, textContent: '', innerHTML: '' }, dados);
+        this.style = {};
+        this.dataset = {};
+        this.ouvintes = {};
+        this.options = (dados.options || []).map(opcao => new Elemento(opcao));
+    }
+    addEventListener(tipo, funcao) {
+        (this.ouvintes[tipo] = this.ouvintes[tipo] || []).push(funcao);
+    }
+    dispatch(tipo) {
+        return Promise.all((this.ouvintes[tipo] || []).map(funcao => funcao()));
+    }
+    querySelectorAll(seletor) {
+        return seletor === 'option' ? this.options : [];
+    }
+    getContext() {
+        return {};
+    }
+}
+
+const elementos = pagina.elementos.map(dados => new Elemento(dados));
+const porId = new Map(elementos.filter(e => e.id).map(e => [e.id, e]));
+const radios = () => elementos.filter(e => e.type === 'radio');
+const alertas = [];
+const erros = [];
+const graficos = [];
+const impressos = [];
+const ouvintesJanela = {};
+
+const document = {
+    cookie: '',
+    getElementById: id => porId.get(id) || null,
+    querySelector(seletor) {
+        let m = seletor.match(/^input\[name="(.+)"\]:checked$/);
+        if (m) {
+            return radios().find(e => e.name === m[1] && e.checked) || null;
+        }
+        m = seletor.match(/^input\[value="(.+)"\]$/);
+        if (m) {
+            return elementos.find(e => e.tag === 'input' && e.value === m[1]) || null;
+        }
+        throw new Error('seletor não suportado: ' + seletor);
+    },
+    querySelectorAll(seletor) {
+        const m = seletor.match(/^input\[name="(.+)"\]$/);
+        if (!m) {
+            throw new Error('seletor não suportado: ' + seletor);
+        }
+        return radios().filter(e => e.name === m[1]);
+    }
+};
+
+class Chart {
+    constructor(ctx, config) {
+        this.config = config;
+        this.destruido = false;
+        graficos.push(this);
+    }
+    destroy() {
+        this.destruido = true;
+    }
+}
+
+function fetch(url, opcoes) {
+    return new Promise(resolve => {
+        pendentes.push(resposta => resolve({
+            status: resposta.status,
+            headers: { get: nome => resposta.headers[nome.toLowerCase()] || null },
+            json: async () => resposta.body
+        }));
+        enviar({ fetch: url, method: opcoes.method, headers: opcoes.headers, body: opcoes.body });
+    });
+}
+
+const window = {
+    addEventListener: (tipo, funcao) => (ouvintesJanela[tipo] = ouvintesJanela[tipo] || []).push(funcao),
+    open() {
+        let conteudo = '';
+        return {
+            document: { write: texto => (conteudo += texto), close() {} },
+            focus() {},
+            print: () => impressos.push(conteudo)
+        };
+    }
+};
+
+// Utilitários dos cenários: escolher valores e disparar eventos
+const helpers = {
+    selecionar(id, valor) {
+        porId.get(id).value = valor;
+        return porId.get(id).dispatch('change');
+    },
+    marcar(id) {
+        const radio = porId.get(id);
+        if (radio.type === 'radio') {
+            radios().filter(e => e.name === radio.name).forEach(e => (e.checked = false));
+        }
+        radio.checked = true;
+        return radio.dispatch('change');
+    },
+    async carregarPagina() {
+        (ouvintesJanela.load || []).forEach(funcao => funcao());
+        await helpers.ocioso();
+    },
+    esperar: ms => new Promise(resolve => setTimeout(resolve, ms || 0)),
+    // Até não haver requisição pendente nem callbacks na fila
+    async ocioso() {
+        do {
+            await new Promise(resolve => setTimeout(resolve, 5));
+        } while (pendentes.length);
+        await new Promise(resolve => setTimeout(resolve, 5));
+    },
+    opcoes: id => porId.get(id).options.map(o => ({ value: o.value, text: o.textContent, disabled: o.disabled })),
+    texto: id => porId.get(id).textContent,
+    html: id => porId.get(id).innerHTML,
+    graficos: () => graficos.map(g => ({ type: g.config.type, labels: g.config.data.labels, destruido: g.destruido })),
+    // Texto do tooltip de um valor do último gráfico (callback do script ou o padrão)
+    tooltip(datasetIndex, dataIndex) {
+        const config = graficos[graficos.length - 1].config;
+        const dataset = config.data.datasets[datasetIndex];
+        const item = {
+            label: config.data.labels[dataIndex], dataset: dataset, datasetIndex: datasetIndex,
+            dataIndex: dataIndex, formattedValue: String(dataset.data[dataIndex])
+        };
+        const label = (config.options.plugins.tooltip.callbacks || {}).label;
+        return label ? label(item) : `${dataset.label}: ${item.formattedValue}`;
+    },
+    alertas: () => alertas,
+    erros: () => erros,
+    impressos: () => impressos
+};
+
+const contexto = vm.createContext({
+    document, window, fetch, Chart, helpers, JSON, Map, Promise, setTimeout, Date, Number, String,
+    alert: mensagem => alertas.push(String(mensagem)),
+    console: { log() {}, error: (...args) => erros.push(args.map(String).join(' ')) },
+    decodeURIComponent
+});
+
+(async () => {
+    try {
+        vm.runInContext(pagina.script, contexto, { filename: 'dashboard.js' });
+        const resultado = await vm.runInContext(`(async () => { ${pagina.cenario} })()`, contexto, { filename: 'cenario.js' });
+        enviar({ resultado: resultado === undefined ? null : resultado });
+    } catch (erro) {
+        enviar({ erro: String(erro && erro.stack || erro) });
+    }
+    process.exit(0);
+})();
@@ -2,9 +2,535 @@
 Módulo de análise de dados usando princípios de Big Data
 Utiliza Apache Spark e Pandas para processamento distribuído e análise de grandes volumes
 """
+import copy
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from functools import cached_property
+
+import numpy as np
 import pandas as pd
 from django.conf import settings
 import os
+import shutil
+import tempfile
+import threading
+import time
+
+from . import approx, drilldown, histogram, ingest, metrics, snapshot, streaming
+from .cache import QueryCache
+from .cube import OlapCube
+
+
+logger = logging.getLogger(__name__)
+
+
+# Status possíveis de um aluno (ordem fixa dos códigos da coluna 'status')
+STATUS_ALUNO = ['Aprovado', 'Recuperação', 'Reprovado']
+
+# Colunas de baixa cardinalidade armazenadas como dicionário (códigos inteiros)
+COLUNAS_CATEGORICAS = [
+    'id_matricula',
+    'id_filial',
+    'titulo_turma',
+    'nome_serie',
+    'nome_disciplina',
+    'tipo_nota_aval'
+]
+
+# Tipos de avaliação (médias bimestrais e média anual)
+TIPOS_NOTA = ['Mb1', 'Mb2', 'Mb3', 'Mb4', 'MA']
+
+# Colunas com filtro de igualdade no dashboard (indexadas na carga)
+COLUNAS_FILTRO = ['id_filial', 'serie_turma', 'nome_disciplina', 'tipo_nota_aval', 'status']
+
+# Tipos de gráfico do dashboard
+CHART_TYPES = [
+    'distribuicao_notas',
+    'comparacao_filiais',
+    'media_por_disciplina',
+    'status_alunos',
+    'notas_por_tipo',
+    'alunos_por_faixa'
+]
+
+# Faixas de desempenho (intervalos do pd.cut com include_lowest=True)
+FAIXAS_NOTA = [0, 4, 6, 8, 10]
+ROTULOS_FAIXA = ['Crítico (0-4)', 'Recuperação (4-6)', 'Bom (6-8)', 'Excelente (8-10)']
+
+# Faixa de desempenho de cada classe fina de nota (histogram.fine_bins)
+FAIXA_POR_CLASSE = np.searchsorted(
+    np.asarray(FAIXAS_NOTA[1:-1]) * histogram.RESOLUCAO, np.arange(histogram.N_CLASSES), side='left'
+).astype(np.int8)
+
+# Maior matriz de presença (valor x aluno, em bytes) usada para contar alunos
+# distintos por valor de filtro; acima disso os pares são ordenados (np.unique)
+PRESENCA_MAX_CELULAS = 1 << 25
+
+# Seleções da amostra com menos linhas que isso são respondidas pelo caminho
+# exato (a seleção completa também é pequena e a estimativa seria imprecisa)
+AMOSTRA_MIN_LINHAS = 1000
+
+# Pool de processos da agregação paralela (map por grupo de filiais) e o
+# processador da partição carregada em cada processo do pool
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+_map_engine = None
+
+# Colunas que passam por str.strip na limpeza
+COLUNAS_TEXTO = ['titulo_turma', 'nome_serie', 'nome_disciplina', 'tipo_nota_aval']
+
+# Tipos na leitura do CSV (categóricas codificadas já na leitura, sem criar
+# uma string Python por linha)
+CSV_DTYPES = {
+    'id_nota': str,
+    'id_matricula': 'category',
+    'vlr_nota': np.float32,
+    'id_filial': 'category',
+    'titulo_turma': 'category',
+    'nome_serie': 'category',
+    'nome_disciplina': 'category',
+    'tipo_nota_aval': 'category'
+}
+
+# Dicionários mantidos no modo em fluxo e dimensões de linha do bitset de presença
+COLUNAS_FLUXO = ['id_matricula', 'id_filial', 'serie_turma', 'nome_disciplina', 'tipo_nota_aval']
+DIMENSOES_LINHA = ['nome_disciplina', 'tipo_nota_aval', 'faixa']
+
+
+def _normalize_categorical(serie, strip=False):
+    """
+    Ordena o dicionário de categorias e, opcionalmente, aplica str.strip apenas
+    sobre ele (O(cardinalidade)), unificando categorias que ficam iguais
+    """
+    categorias = serie.cat.categories
+    if strip:
+        categorias = categorias.str.strip()
+    novas, inverso = np.unique(np.asarray(categorias, dtype=object), return_inverse=True)
+    codigos = serie.cat.codes.to_numpy()
+    codigos = np.where(codigos >= 0, inverso.take(np.maximum(codigos, 0)), -1)
+    return pd.Series(
+        pd.Categorical.from_codes(codigos, categories=novas),
+        index=serie.index,
+        name=serie.name
+    )
+
+
+def _clean_frame(df):
+    """
+    Limpeza de dados (princípio de Data Quality em Big Data)
+    O strip é aplicado ao dicionário de cada coluna, não a cada linha,
+    e os dicionários ficam ordenados (códigos determinísticos)
+    """
+    for coluna in COLUNAS_CATEGORICAS:
+        df[coluna] = _normalize_categorical(df[coluna], strip=coluna in COLUNAS_TEXTO)
+    
+    # Criar coluna combinada série-turma (a partir dos códigos)
+    df['serie_turma'] = _combine_categoricals(df['nome_serie'], df['titulo_turma'], ' - ')
+    return df
+
+
+def _parse_csv_range(csv_path, inicio, fim, tempos=None):
+    """
+    Lê e limpa os bytes [inicio, fim) do CSV (tabela sem a coluna de status)
+    Função de módulo: também executada pelos processos da leitura paralela
+    
+    Com tempos (dicionário), soma as durações da leitura ('read') e da
+    limpeza ('clean').
+    """
+    tempos = {} if tempos is None else tempos
+    with metrics.timed(tempos, 'read'):
+        df = ingest.read_csv_range(csv_path, inicio, fim, dtype=CSV_DTYPES)
+    with metrics.timed(tempos, 'clean'):
+        df = _clean_frame(df)
+        
+        # id_nota numérico vira inteiro (evita uma string por linha)
+        df['id_nota'] = BigDataAnalytics._compact_id_nota(df['id_nota'])
+    return df
+
+
+def _codes_dtype(n_categorias):
+    """
+    Menor inteiro com sinal para os códigos (mesma escolha do pandas)
+    """
+    for dtype in (np.int8, np.int16, np.int32):
+        if n_categorias < np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+def _concat_frames(partes):
+    """
+    Junta as partes da leitura paralela, na ordem do arquivo
+    
+    Cada coluna final é alocada uma vez e preenchida parte a parte, sem
+    pd.concat intermediário; as colunas das partes são liberadas à medida que
+    são copiadas. Os dicionários das partes são unidos e ordenados, então o
+    resultado é idêntico ao da leitura serial.
+    """
+    limites = np.r_[0, np.cumsum([len(parte) for parte in partes])]
+    intervalos = list(zip(limites[:-1], limites[1:]))
+    colunas = {}
+    for coluna in list(partes[0].columns):
+        series = [parte.pop(coluna) for parte in partes]
+        
+        if isinstance(series[0].dtype, pd.CategoricalDtype):
+            categorias = np.unique(np.concatenate([
+                np.asarray(serie.cat.categories, dtype=object) for serie in series
+            ]))
+            codigos = np.empty(limites[-1], dtype=_codes_dtype(len(categorias)))
+            for serie, (inicio, fim) in zip(series, intervalos):
+                posicao = np.searchsorted(categorias, np.asarray(serie.cat.categories, dtype=object))
+                codigos_parte = serie.array.codes
+                codigos[inicio:fim] = np.where(codigos_parte >= 0, posicao.take(np.maximum(codigos_parte, 0)), -1)
+            colunas[coluna] = pd.Categorical.from_codes(codigos, categories=categorias, validate=False)
+        
+        elif len({serie.dtype for serie in series}) == 1 and series[0].dtype.kind in 'biuf':
+            valores = np.empty(limites[-1], dtype=series[0].dtype)
+            for serie, (inicio, fim) in zip(series, intervalos):
+                valores[inicio:fim] = serie.to_numpy()
+            colunas[coluna] = valores
+        
+        else:
+            # id_nota inteiro em uma parte e texto em outra: tudo volta a ser texto
+            colunas[coluna] = pd.concat([serie.astype(str) for serie in series], ignore_index=True)
+    return pd.DataFrame(colunas, copy=False)
+
+
+def _status_codes(nota_ma, menor_mb):
+    """
+    Código do status (STATUS_ALUNO) a partir da nota MA e da menor nota bimestral
+    """
+    # Comparações com NaN resultam em False, assim como no laço original
+    with np.errstate(invalid='ignore'):
+        reprovado = nota_ma < 6
+        recuperacao = menor_mb < 6
+    return np.select(
+        [reprovado, recuperacao],
+        [STATUS_ALUNO.index('Reprovado'), STATUS_ALUNO.index('Recuperação')],
+        default=STATUS_ALUNO.index('Aprovado')
+    ).astype(np.int8)
+
+
+def _merge_categoricals(antiga, nova):
+    """
+    Une os dicionários (ordenados) de duas colunas categóricas
+    
+    Retorna os códigos das duas colunas no dicionário unido, as categorias e a
+    tradução código antigo -> código novo (None quando o dicionário antigo já
+    contém todos os valores e os códigos antigos não mudam)
+    """
+    antigas = antiga.cat.categories
+    codigos_antigos = antiga.array.codes
+    traducao = None
+    
+    # Caso comum: valores já conhecidos, o dicionário não muda
+    posicao = antigas.get_indexer(nova.cat.categories)
+    if (posicao >= 0).all():
+        categorias = antigas
+    else:
+        categorias = np.unique(np.concatenate([
+            np.asarray(antigas, dtype=object),
+            np.asarray(nova.cat.categories, dtype=object)
+        ]))
+        traducao = np.searchsorted(categorias, np.asarray(antigas, dtype=object))
+        codigos_antigos = np.where(codigos_antigos >= 0, traducao.take(np.maximum(codigos_antigos, 0)), -1)
+        posicao = np.searchsorted(categorias, np.asarray(nova.cat.categories, dtype=object))
+    
+    codigos_novos = nova.array.codes
+    codigos_novos = np.where(codigos_novos >= 0, posicao.take(np.maximum(codigos_novos, 0)), -1)
+    return codigos_antigos, codigos_novos, categorias, traducao
+
+
+def _combine_categoricals(esquerda, direita, separador):
+    """
+    Concatena duas colunas categóricas pelos códigos, montando o texto
+    apenas uma vez por combinação existente (em vez de uma vez por linha)
+    """
+    cod_esq = esquerda.cat.codes.to_numpy().astype(np.int64)
+    cod_dir = direita.cat.codes.to_numpy().astype(np.int64)
+    validos = (cod_esq >= 0) & (cod_dir >= 0)
+    
+    chave = cod_esq * len(direita.cat.categories) + cod_dir
+    chave[~validos] = -1
+    chaves_unicas, codigos = np.unique(chave, return_inverse=True)
+    if len(chaves_unicas) and chaves_unicas[0] == -1:
+        codigos = codigos - 1
+        chaves_unicas = chaves_unicas[1:]
+    
+    n_dir = len(direita.cat.categories)
+    rotulos = [
+        f"{esquerda.cat.categories[c // n_dir]}{separador}{direita.cat.categories[c % n_dir]}"
+        for c in chaves_unicas
+    ]
+    
+    # Ordenar o dicionário pelo texto, como em um factorize(sort=True)
+    ordem = np.argsort(np.asarray(rotulos, dtype=object), kind='stable')
+    posicao = np.empty(len(ordem), dtype=np.int64)
+    posicao[ordem] = np.arange(len(ordem))
+    codigos = np.where(codigos >= 0, posicao.take(np.maximum(codigos, 0)), -1)
+    return pd.Series(
+        pd.Categorical.from_codes(codigos, categories=[rotulos[i] for i in ordem]),
+        index=esquerda.index
+    )
+
+
+def _faixa_codes(notas):
+    """
+    Código da faixa de desempenho de cada nota (mesmos intervalos do pd.cut
+    com include_lowest=True); -1 para notas ausentes ou negativas
+    """
+    return _faixa_das_classes(histogram.fine_bins(notas))
+
+
+def _faixa_das_classes(classes):
+    """
+    Faixa de desempenho a partir das classes finas (-1 continua -1)
+    """
+    return np.where(classes >= 0, FAIXA_POR_CLASSE.take(np.maximum(classes, 0)), -1).astype(np.int8)
+
+
+def _chart_vazio():
+    return {
+        'labels': [],
+        'data': [],
+        'title': 'Sem dados para os filtros selecionados'
+    }
+
+
+def _chart_nao_reconhecido():
+    return {
+        'labels': [],
+        'data': [],
+        'title': 'Tipo de gráfico não reconhecido'
+    }
+
+
+def _chart_comparacao_filiais(result):
+    """
+    result: DataFrame filial x status (colunas em STATUS_ALUNO)
+    """
+    # Preparar dados para gráfico de barras agrupadas
+    labels = [f"Escola {filial}" for filial in result.index]
+    
+    # Dados por status (se existir); arrays (contíguos) vão direto para o JSON
+    def coluna(status):
+        if status not in result.columns:
+            return np.zeros(len(labels), dtype=np.int64)
+        return np.ascontiguousarray(result[status].to_numpy())
+    
+    data_aprovados = coluna('Aprovado')
+    data_recuperacao = coluna('Recuperação')
+    data_reprovados = coluna('Reprovado')
+    
+    return {
+        'labels': labels,
+        'data': data_reprovados,  # Padrão: mostrar reprovados
+        'datasets': [
+            {'label': 'Reprovados', 'data': data_reprovados, 'color': 'rgba(220, 53, 69, 0.7)'},
+            {'label': 'Recuperação', 'data': data_recuperacao, 'color': 'rgba(255, 193, 7, 0.7)'},
+            {'label': 'Aprovados', 'data': data_aprovados, 'color': 'rgba(40, 167, 69, 0.7)'}
+        ],
+        'title': 'Comparação entre Escolas (Aprovados, Recuperação e Reprovados)',
+        'type': 'grouped'
+    }
+
+
+def _chart_media(result, title):
+    """
+    result: Series de médias já ordenada para exibição
+    """
+    return {
+        'labels': result.index.tolist(),
+        'data': np.round(result.to_numpy(dtype=np.float64), 2),
+        'title': title
+    }
+
+
+def _chart_status_alunos(contagens):
+    """
+    contagens: alunos únicos por código de status (ordem de STATUS_ALUNO)
+    """
+    result = pd.Series(contagens, index=STATUS_ALUNO)
+    result = result[result > 0].sort_values(ascending=False, kind='stable')
+    return {
+        'labels': result.index.tolist(),
+        'data': result.to_numpy(),
+        'title': 'Status dos Alunos (Quantidade de Alunos Únicos)'
+    }
+
+
+def _chart_distribuicao_notas(contagens, opcoes):
+    """
+    contagens: histograma fino das notas; opcoes: (largura da faixa, percentis)
+    """
+    largura, percentis = opcoes
+    labels, data = histogram.coarsen(contagens, largura)
+    valores = histogram.percentiles(contagens, percentis)
+    percentis = {f'p{q:g}': None if np.isnan(v) else round(float(v), 1) for q, v in zip(percentis, valores)}
+    resumo = ', '.join(
+        f"{'mediana' if nome == 'p50' else nome} {valor:g}" for nome, valor in percentis.items() if valor is not None
+    )
+    return {
+        'labels': labels,
+        'data': data,
+        'title': f'Distribuição de Notas ({resumo})' if resumo else 'Distribuição de Notas',
+        'largura_faixa': largura,
+        'percentis': percentis
+    }
+
+
+def _chart_alunos_por_faixa(result):
+    """
+    result: Series de alunos únicos por faixa (apenas faixas presentes)
+    """
+    return {
+        'labels': result.index.tolist(),
+        'data': result.to_numpy(),
+        'title': 'Quantidade de Alunos por Faixa de Desempenho'
+    }
+
+
+def _statistics_vazias():
+    return {
+        'total_registros': 0,
+        'media_geral': 0,
+        'nota_maxima': 0,
+        'nota_minima': 0,
+        'total_alunos': 0,
+        'aprovados': 0,
+        'recuperacao': 0,
+        'reprovados': 0
+    }
+
+
+def _distinct_by(valores, alunos, n_valores, n_alunos):
+    """
+    Quantidade de alunos distintos por código de valor (códigos válidos, >= 0)
+    """
+    pares = valores.astype(np.int64) * n_alunos + alunos
+    if n_valores * n_alunos <= PRESENCA_MAX_CELULAS:
+        presenca = np.zeros(n_valores * n_alunos, dtype=bool)
+        presenca[pares] = True
+        return np.count_nonzero(presenca.reshape(n_valores, n_alunos), axis=1)
+    return np.bincount(np.unique(pares) // n_alunos, minlength=n_valores)
+
+
+def _statistics_payload(total_registros, media, maxima, minima, total_alunos, status_counts):
+    """
+    Monta as estatísticas (status_counts em ordem de STATUS_ALUNO)
+    """
+    status_counts = dict(zip(STATUS_ALUNO, np.asarray(status_counts).tolist()))
+    return {
+        'total_registros': int(total_registros),
+        'media_geral': round(float(media), 2),
+        'nota_maxima': round(float(maxima), 2),
+        'nota_minima': round(float(minima), 2),
+        'total_alunos': int(total_alunos),
+        'aprovados': status_counts.get('Aprovado', 0),
+        'recuperacao': status_counts.get('Recuperação', 0),
+        'reprovados': status_counts.get('Reprovado', 0)
+    }
+
+
+def _nota(valor):
+    """
+    Nota arredondada da resposta (None se ausente)
+    """
+    return None if valor is None or np.isnan(valor) else round(float(valor), 2)
+
+
+def _aluno_payload(id_matricula, id_filial, serie_turma, status, nota_ma, menor_mb):
+    """
+    Dados de um aluno na lista da turma e no detalhamento
+    """
+    return {
+        'id_matricula': id_matricula,
+        'id_filial': id_filial,
+        'serie_turma': serie_turma,
+        'status': status,
+        'nota_ma': _nota(nota_ma),
+        'menor_mb': _nota(menor_mb)
+    }
+
+
+def _detalhe_aluno(aluno, linhas):
+    """
+    Detalhamento de um aluno: dados da tabela de alunos, notas de cada
+    disciplina (Mb1-Mb4 e MA; o primeiro registro de cada tipo) e média de
+    cada tipo sobre todos os registros
+    linhas: (disciplina, tipo de nota, nota) na ordem da tabela de notas
+    """
+    notas = {}
+    somas = {tipo: [0.0, 0] for tipo in TIPOS_NOTA}
+    for disciplina, tipo, valor in linhas:
+        por_tipo = notas.setdefault(disciplina, dict.fromkeys(TIPOS_NOTA))
+        if tipo not in somas or valor is None or np.isnan(valor):
+            continue
+        if por_tipo[tipo] is None:
+            por_tipo[tipo] = valor
+        somas[tipo][0] += valor
+        somas[tipo][1] += 1
+    return {
+        **aluno,
+        'notas': [
+            {'nome_disciplina': disciplina, **{tipo: _nota(valor) for tipo, valor in por_tipo.items()}}
+            for disciplina, por_tipo in notas.items()
+        ],
+        'medias': {tipo: _nota(soma / n) if n else None for tipo, (soma, n) in somas.items()}
+    }
+
+
+def _parallel_pool(workers):
+    """
+    Pool de processos da agregação paralela, criado no primeiro uso
+    (spawn: processos novos, seguros com threads do servidor ativas)
+    """
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            _pool_workers = workers
+        return _pool
+
+
+def shutdown_parallel_pool():
+    """
+    Encerra o pool da agregação paralela (os processos são recriados no
+    próximo uso)
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+
+def _map_partition(caminho, versao, filters, chart_types):
+    """
+    Etapa map, executada em um processo do pool: aplica os filtros às linhas
+    de uma partição (snapshot com as linhas de um grupo de filiais, gravado
+    por _parallel_partitions) e devolve a versão dos dados da partição e as
+    primitivas parciais (_SelecaoResumo, ou None se não há linhas)
+    
+    O processo mapeia só a sua partição, uma vez, e monta o índice dela; a
+    tabela inteira nunca é lida.
+    """
+    global _map_engine
+    if _map_engine is None or _map_engine.origem != caminho:
+        _map_engine = _MapEngine(caminho)
+    engine = _map_engine
+    if engine.dataset_version != versao:
+        return engine.dataset_version, None
+    
+    linhas = engine._select_rows(filters)
+    df_part = engine.df if linhas is None else engine.df.take(linhas)
+    if df_part.empty:
+        return versao, None
+    return versao, _SelecaoResumo(_SelecaoLinhas(engine, df_part), chart_types)
 
 
 class BigDataAnalytics:
@@ -13,280 +539,2064 @@ class BigDataAnalytics:
     Implementa processamento com Spark e Pandas
     """
     
-    def __init__(self):
+    def __init__(self, load=True):
         self.csv_path = settings.CSV_DATA_PATH
+        self.snapshot_dir = getattr(settings, 'ANALYTICS_SNAPSHOT_DIR', None)
         self.df = None
-        self._load_data()
+        self.students = None
+        self._index = {}
+        self.cube = None
+        self.cube_mode = getattr(settings, 'ANALYTICS_CUBE_MODE', False)
+        self.streaming_mode = getattr(settings, 'ANALYTICS_STREAMING_MODE', False)
+        self.csv_workers = getattr(settings, 'ANALYTICS_CSV_WORKERS', 1) or 1
+        self.shared_dataset = getattr(settings, 'ANALYTICS_SHARED_DATASET', False)
+        # Versão publicada anexada no modo compartilhado (contador do snapshot)
+        self.shared_version = None
+        self._shared_dataset_version = None
+        self.streaming_chunk_rows = getattr(settings, 'ANALYTICS_STREAMING_CHUNK_ROWS', 500_000)
+        self.dataset_version = None
+        # Duração (segundos) de cada etapa da última carga, exposta em /api/metrics/
+        self.load_timings = {}
+        # Opções dos filtros e contagens por valor sem filtros (calculadas na carga)
+        self.facets = None
+        self._facet_totals = {}
+        # Histogramas finos das notas: total e por valor de cada coluna de filtro
+        self._histograms = {}
+        # Modo aproximado: amostra estratificada (por filial) de alunos e suas linhas
+        self.approx_rate = getattr(settings, 'ANALYTICS_APPROX_SAMPLE_RATE', 0.05)
+        self.approx_min_students = getattr(settings, 'ANALYTICS_APPROX_MIN_STUDENTS', 200)
+        self.sample = None
+        self._amostra = None
+        # Detalhamento: linhas de cada aluno (postings de id_matricula) e
+        # alunos de cada série/turma em ordem (drilldown.RosterIndex)
+        self._linhas_aluno = None
+        self.roster = None
+        self.reload_interval = getattr(settings, 'ANALYTICS_RELOAD_INTERVAL', 5)
+        # Agregação paralela: processos do pool e menor seleção que os usa
+        self.parallel_workers = getattr(settings, 'ANALYTICS_PARALLEL_WORKERS', 1) or 1
+        self.parallel_min_rows = getattr(settings, 'ANALYTICS_PARALLEL_MIN_ROWS', 1_000_000)
+        self._particoes_paralelas = (None, None)
+        self._dir_paralelo = None
+        self._particoes_lock = threading.Lock()
+        # Trecho do CSV já processado: bytes [0, offset), o hash desses bytes e
+        # o (tamanho, mtime) do arquivo observado na última leitura
+        self._csv_offset = None
+        self._csv_digest = None
+        self._csv_stat = None
+        self._refreshed_at = time.monotonic()
+        self.query_cache = QueryCache(
+            max_entries=getattr(settings, 'ANALYTICS_QUERY_CACHE_SIZE', 256),
+            ttl=getattr(settings, 'ANALYTICS_QUERY_CACHE_TTL', 300)
+        )
+        if load:
+            self._load_data()
     
     def _load_data(self):
+        """
+        Carrega a tabela de notas
+        
+        Usa o snapshot binário (memory mapping) quando ele corresponde ao CSV
+        atual; caso contrário processa o CSV e regrava o snapshot
+        """
+        self._index = {}
+        self.cube = None
+        self.load_timings = tempos = {}
+        inicio = time.perf_counter()
+        try:
+            if self.shared_dataset:
+                # Processo web: usa a versão publicada, sem ler o CSV
+                self._attach_shared()
+            elif self.streaming_mode:
+                # Apenas agregados parciais: sem tabela de linhas nem índices
+                with metrics.timed(tempos, 'streaming'):
+                    self._load_streaming()
+            elif self._load_snapshot():
+                # Linhas anexadas ao CSV depois da gravação do snapshot
+                with metrics.timed(tempos, 'append'):
+                    novas = self._append_csv()
+                if novas:
+                    with metrics.timed(tempos, 'save_snapshot'):
+                        self._save_snapshot()
+            else:
+                self._read_csv()
+                # Índices construídos uma vez na carga (e gravados no snapshot)
+                with metrics.timed(tempos, 'index'):
+                    self._build_index()
+                with metrics.timed(tempos, 'save_snapshot'):
+                    self._save_snapshot()
+            
+            if self.cube_mode and self.cube is None:
+                with metrics.timed(tempos, 'cube'):
+                    self._build_cube()
+            
+        except Exception:
+            logger.exception('Erro ao carregar dados de %s', self.csv_path)
+            metrics.REGISTRY.inc('analytics_load_errors_total')
+            self.df = pd.DataFrame()
+            self._csv_offset = None
+            self.shared_version = None
+        with metrics.timed(tempos, 'facets'):
+            self._build_facets()
+        with metrics.timed(tempos, 'histograms'):
+            self._build_histograms()
+        with metrics.timed(tempos, 'sample'):
+            self._build_sample()
+        with metrics.timed(tempos, 'drilldown'):
+            self._build_drilldown()
+        tempos['total'] = time.perf_counter() - inicio
+        metrics.REGISTRY.inc('analytics_loads_total')
+        
+        # Nova versão do dataset: resultados em cache deixam de valer
+        self.dataset_version = self._dataset_version()
+        self.query_cache.clear()
+    
+    def _dataset_version(self):
+        """
+        Versão dos dados carregados (tamanho e hash de todo o trecho lido do
+        CSV), igual em todos os processos que leram o mesmo conteúdo
+        """
+        if self.shared_dataset:
+            return self._shared_dataset_version if self.shared_version is not None else 'vazio'
+        if self._csv_offset is None:
+            return 'vazio'
+        return ingest.range_version(self._csv_offset, self._csv_digest)
+    
+    def _set_csv_offset(self, offset, stat, prefixo=None, digest=None):
+        """
+        Registra até onde o CSV foi processado (stat obtido antes da leitura)
+        e o hash dos bytes [0, offset): digest quando já é conhecido (o do
+        manifesto do snapshot); senão o hash continua o do prefixo (bytes,
+        hash) já verificado ou lê o trecho inteiro
+        """
+        if digest is None:
+            inicio, anterior = prefixo or (0, None)
+            digest = ingest.content_digest(self.csv_path, inicio, offset, anterior).hexdigest()
+        self._csv_offset = offset
+        self._csv_digest = digest
+        self._csv_stat = (stat.st_size, stat.st_mtime_ns)
+    
+    def refresh(self):
+        """
+        Verifica se o CSV mudou e retorna o processador com os dados atuais
+        
+        Linhas anexadas ao final do arquivo geram uma nova instância a partir
+        da atual: só o trecho novo é processado e só os alunos que receberam
+        notas têm o status recalculado. O trecho já lido é conferido pelo hash
+        de todo o seu conteúdo: se o arquivo foi truncado ou alterado (mesmo
+        sem mudar de tamanho), a nova instância recarrega tudo. A instância atual nunca é alterada, então
+        requisições em andamento continuam com uma versão consistente; quem
+        chama troca a referência de uma vez (chamar de um thread por vez).
+        A verificação (um os.stat) ocorre no máximo a cada ANALYTICS_RELOAD_INTERVAL
+        segundos; None desativa.
+        
+        No modo compartilhado a verificação é o número de versão do snapshot:
+        quando o processo carregador publica uma versão nova, a nova instância
+        a anexa (se falhar, a versão atual continua em uso).
+        """
+        if self.reload_interval is None:
+            return self
+        agora = time.monotonic()
+        if agora - self._refreshed_at < self.reload_interval:
+            return self
+        self._refreshed_at = agora
+        
+        if self.shared_dataset:
+            versao = snapshot.current_version(self.snapshot_dir)
+            if versao is None or versao == self.shared_version:
+                return self
+            novo = copy.copy(self)
+            novo._load_data()
+            return novo if novo.shared_version is not None else self
+        
+        try:
+            stat = os.stat(self.csv_path)
+        except OSError:
+            return self
+        if (stat.st_size, stat.st_mtime_ns) == self._csv_stat:
+            return self
+        
+        novo = copy.copy(self)
+        prefixo = None
+        if self._csv_offset is not None and stat.st_size >= self._csv_offset:
+            digest = ingest.content_digest(self.csv_path, 0, self._csv_offset)
+            if digest.hexdigest() == self._csv_digest:
+                prefixo = (self._csv_offset, digest)
+        if prefixo is None or self.streaming_mode:
+            # Arquivo reescrito ou truncado: recarga completa (também no modo em
+            # fluxo, que não guarda as linhas dos alunos que mudariam de status)
+            novo._load_data()
+            return novo
+        
+        # A cópia compartilharia o dicionário: os tempos passam a ser os do append
+        novo.load_timings = tempos = {}
+        inicio = time.perf_counter()
+        try:
+            with metrics.timed(tempos, 'append'):
+                novas = novo._append_csv(prefixo)
+            if not novas:
+                self._csv_stat = novo._csv_stat
+                return self
+            if novo.cube_mode:
+                with metrics.timed(tempos, 'cube'):
+                    novo._build_cube()
+            with metrics.timed(tempos, 'facets'):
+                novo._build_facets()
+            with metrics.timed(tempos, 'histograms'):
+                novo._build_histograms()
+            with metrics.timed(tempos, 'sample'):
+                novo._build_sample()
+            with metrics.timed(tempos, 'drilldown'):
+                novo._build_drilldown()
+        except Exception:
+            logger.exception('Erro ao incorporar novas linhas de %s', self.csv_path)
+            metrics.REGISTRY.inc('analytics_load_errors_total')
+            return self
+        tempos['total'] = time.perf_counter() - inicio
+        
+        novo.dataset_version = novo._dataset_version()
+        novo.query_cache.clear()
+        return novo
+    
+    def _load_snapshot(self):
+        """
+        Carrega o snapshot se existir e não estiver desatualizado
+        """
+        if not self.snapshot_dir:
+            return False
+        stat = os.stat(self.csv_path)
+        manifest = snapshot.read_manifest(self.snapshot_dir)
+        
+        # Também serve quando o CSV só recebeu linhas no final (lidas depois)
+        if not (snapshot.is_fresh(manifest, self.csv_path)
+                or snapshot.is_prefix(manifest, self.csv_path)):
+            return False
+        self._attach_snapshot(manifest)
+        self._set_csv_offset(manifest['source']['size'], stat, digest=manifest['source']['hash'])
+        return True
+    
+    def _attach_snapshot(self, manifest):
+        """
+        Mapeia tabela de notas, tabela de alunos e índice do snapshot (somente
+        leitura, sem cópia); o que não foi gravado é calculado
+        """
+        with metrics.timed(self.load_timings, 'snapshot'):
+            self.df = snapshot.load_snapshot(self.snapshot_dir, manifest)
+            self.students = snapshot.load_students(manifest)
+            postings = snapshot.load_index(manifest)
+        if self.students is None:
+            with metrics.timed(self.load_timings, 'status'):
+                self._build_student_table()
+        
+        if postings is None or set(postings) != set(COLUNAS_FILTRO):
+            with metrics.timed(self.load_timings, 'index'):
+                self._build_index()
+            return
+        self._index = {
+            coluna: {
+                'categorias': self.df[coluna].cat.categories,
+                'codigos': self.df[coluna].array.codes,
+                'ordem': ordem,
+                'offsets': offsets
+            }
+            for coluna, (ordem, offsets) in postings.items()
+        }
+    
+    def _attach_shared(self):
+        """
+        Modo compartilhado (ANALYTICS_SHARED_DATASET): anexa a versão ativa do
+        snapshot publicada pelo processo carregador ('manage.py publish_dataset')
+        
+        Os arrays são mapeados somente leitura, então todos os workers usam as
+        mesmas páginas de memória (cache do sistema operacional) e nenhum deles
+        lê o CSV ou recalcula status e índices.
+        """
+        manifest = snapshot.read_manifest(self.snapshot_dir) if self.snapshot_dir else None
+        if manifest is None:
+            raise FileNotFoundError(f'nenhum dataset publicado em {self.snapshot_dir}')
+        self._attach_snapshot(manifest)
+        self._shared_dataset_version = manifest.get('dataset_version') or f"v{manifest['version']}"
+        self.shared_version = manifest['version']
+    
+    def _save_snapshot(self):
+        """
+        Persiste a tabela processada (falhas não impedem o uso dos dados)
+        """
+        if not self.snapshot_dir or self.df is None or self.df.empty:
+            return None
+        try:
+            # O hash do trecho lido já é conhecido (versão do dataset)
+            fingerprint = snapshot.csv_fingerprint(self.csv_path, with_hash=False, size=self._csv_offset)
+            fingerprint['hash'] = self._csv_digest
+            return snapshot.save_snapshot(
+                self.df, self.snapshot_dir,
+                fingerprint,
+                students=self.students,
+                index=self._index,
+                dataset_version=self._dataset_version()
+            )
+        except OSError:
+            logger.exception('Erro ao gravar snapshot em %s', self.snapshot_dir)
+            return None
+    
+    def build_snapshot(self, force=False):
+        """
+        Gera o snapshot antes do deploy (usado por 'manage.py build_snapshot')
+        Retorna o manifesto do snapshot ativo
+        """
+        manifest = snapshot.read_manifest(self.snapshot_dir)
+        if not force and snapshot.is_fresh(manifest, self.csv_path):
+            return manifest
+        self._read_csv()
+        self._build_index()
+        return self._save_snapshot()
+    
+    def publish(self):
+        """
+        Publica a versão carregada para os processos no modo compartilhado
+        (usado por 'manage.py publish_dataset'). Não regrava quando o snapshot
+        ativo já é desta versão e contém a tabela de alunos e o índice.
+        """
+        manifest = snapshot.read_manifest(self.snapshot_dir)
+        if (manifest is not None and 'index' in manifest and 'students' in manifest
+                and manifest.get('dataset_version') == self._dataset_version()):
+            return manifest
+        return self._save_snapshot()
+    
+    def _read_csv(self):
         """
         Carrega dados do CSV usando Pandas
         Em ambiente de produção, utilizaria Spark para arquivos muito grandes
+        
+        Armazenamento compacto (colunar):
+        - Colunas de texto de baixa cardinalidade como categóricas (códigos inteiros)
+        - id_matricula como chave substituta inteira (códigos int32)
+        - vlr_nota em float32
+        - Uma única coluna de status (códigos em STATUS_ALUNO)
+        """
+        # Para Big Data, usaríamos PySpark:
+        # spark = SparkSession.builder.appName("BigDataAnalytics").getOrCreate()
+        # self.df = spark.read.csv(self.csv_path, header=True, inferSchema=True)
+        
+        # Usando Pandas para este projeto (otimizado para performance)
+        stat = os.stat(self.csv_path)
+        intervalos = ingest.split_ranges(self.csv_path, stat.st_size, self.csv_workers)
+        if len(intervalos) > 1:
+            # Leitura e limpeza juntas, nos processos da leitura paralela
+            with metrics.timed(self.load_timings, 'parse'):
+                self.df = self._parse_csv_parallel(intervalos)
+        else:
+            self.df = self._parse_csv(0, stat.st_size)
+        
+        # Calcular status por aluno (não por registro individual)
+        with metrics.timed(self.load_timings, 'status'):
+            self._calculate_student_status()
+        self._set_csv_offset(stat.st_size, stat)
+    
+    def _parse_csv(self, inicio, fim):
+        """
+        Lê e limpa os bytes [inicio, fim) do CSV (tabela sem a coluna de status)
+        """
+        return _parse_csv_range(self.csv_path, inicio, fim, self.load_timings)
+    
+    def _parse_csv_parallel(self, intervalos):
+        """
+        Leitura paralela: cada intervalo de bytes (alinhado em início de linha)
+        é lido e limpo em um processo (ANALYTICS_CSV_WORKERS), incluindo o
+        strip dos dicionários e a coluna serie_turma; as partes são juntadas
+        na ordem do arquivo
+        """
+        # spawn: processos novos, seguros mesmo com threads do servidor ativas
+        contexto = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=len(intervalos), mp_context=contexto) as pool:
+            partes = list(pool.map(
+                _parse_csv_range,
+                [self.csv_path] * len(intervalos),
+                *zip(*intervalos)
+            ))
+        return _concat_frames(partes)
+    
+    def _csv_chunks(self, fim):
+        """
+        Blocos limpos dos bytes [0, fim) do CSV, com ANALYTICS_STREAMING_CHUNK_ROWS
+        linhas (id_nota não é lido)
+        """
+        blocos = ingest.read_csv_chunks(
+            self.csv_path, 0, fim, self.streaming_chunk_rows,
+            dtype=CSV_DTYPES, usecols=[c for c in CSV_DTYPES if c != 'id_nota']
+        )
+        for bloco in blocos:
+            yield _clean_frame(bloco)
+    
+    def _load_streaming(self):
+        """
+        Modo em fluxo (ANALYTICS_STREAMING_MODE) para CSVs maiores que a memória
+        
+        O CSV é lido em blocos, em duas passagens. A primeira combina parciais
+        por aluno (o status depende de todas as notas do aluno); a segunda, com
+        o status conhecido, combina as células do cubo e a presença de cada
+        aluno nas dimensões de linha. A memória depende da quantidade de alunos
+        e de grupos, não de registros. self.df fica sem linhas (só os
+        dicionários) e todas as consultas são respondidas pelo cubo.
+        """
+        stat = os.stat(self.csv_path)
+        fim = stat.st_size
+        dicionarios = {coluna: streaming.Dictionary() for coluna in COLUNAS_FLUXO}
+        parciais = streaming.StudentPartials()
+        
+        # 1ª passagem: parciais por aluno (ids provisórios, em ordem de chegada)
+        for bloco in self._csv_chunks(fim):
+            codigos = {coluna: dicionarios[coluna].codes(bloco[coluna]) for coluna in COLUNAS_FLUXO}
+            tipo = bloco['tipo_nota_aval']
+            parciais.add(
+                codigos['id_matricula'],
+                bloco['vlr_nota'].to_numpy(dtype=np.float64),
+                codigos['tipo_nota_aval'],
+                (tipo == 'MA').to_numpy(),
+                tipo.isin(['Mb1', 'Mb2', 'Mb3', 'Mb4']).to_numpy(),
+                codigos['id_filial'],
+                codigos['serie_turma'],
+                len(dicionarios['id_matricula']),
+                len(dicionarios['tipo_nota_aval'])
+            )
+        
+        # Dicionários ordenados, como na carga completa
+        categorias = {coluna: dicionarios[coluna].finalize() for coluna in COLUNAS_FLUXO}
+        self.df = pd.DataFrame({
+            'id_matricula': pd.Categorical([], categories=categorias['id_matricula']),
+            'vlr_nota': np.zeros(0, dtype=np.float32),
+            **{coluna: pd.Categorical([], categories=categorias[coluna]) for coluna in COLUNAS_FLUXO[1:]},
+            'status': pd.Categorical([], categories=STATUS_ALUNO)
+        })
+        self.students = self._students_from_partials(parciais, dicionarios)
+        
+        # 2ª passagem: células (filtros + faixa) e presença dos alunos
+        n_alunos = len(self.students)
+        dims = COLUNAS_FILTRO + ['faixa']
+        cardinalidades = [len(self.df[coluna].cat.categories) for coluna in COLUNAS_FILTRO]
+        cardinalidades.append(len(ROTULOS_FAIXA))
+        n_combinacoes = int(np.prod([cardinalidades[dims.index(d)] + 1 for d in DIMENSOES_LINHA]))
+        celulas = streaming.CellPartials()
+        histogramas = streaming.HistogramPartials()
+        presenca = streaming.PresencePartials(n_alunos, n_combinacoes)
+        status_alunos = self.students['status'].array.codes
+        filial_alunos = self.students['id_filial'].array.codes
+        serie_alunos = self.students['serie_turma'].array.codes
+        
+        for bloco in self._csv_chunks(fim):
+            notas = bloco['vlr_nota'].to_numpy(dtype=np.float64)
+            codigos = {coluna: dicionarios[coluna].final_codes(bloco[coluna]) for coluna in COLUNAS_FLUXO}
+            alunos = codigos['id_matricula']
+            aluno = np.maximum(alunos, 0)
+            codigos['status'] = np.where(alunos >= 0, status_alunos.take(aluno), -1)
+            codigos['faixa'] = _faixa_codes(notas)
+            
+            chaves = np.zeros(len(bloco), dtype=np.int64)
+            for dim, cardinalidade in zip(dims, cardinalidades):
+                chaves = chaves * (cardinalidade + 1) + (codigos[dim] + 1)
+            combinacoes = np.zeros(len(bloco), dtype=np.int64)
+            for dim in DIMENSOES_LINHA:
+                combinacoes = combinacoes * (cardinalidades[dims.index(dim)] + 1) + (codigos[dim] + 1)
+            
+            # Linhas com a filial e a série/turma do próprio aluno
+            regulares = (
+                (codigos['id_filial'] == filial_alunos.take(aluno))
+                & (codigos['serie_turma'] == serie_alunos.take(aluno))
+            )
+            celulas.add(chaves, notas)
+            histogramas.add(chaves, notas)
+            presenca.add(alunos, combinacoes, regulares, chaves)
+        
+        self.cube = streaming.StreamingCube(
+            dims, cardinalidades, celulas,
+            {'id_filial': filial_alunos, 'serie_turma': serie_alunos, 'status': status_alunos},
+            DIMENSOES_LINHA, presenca, presenca.irregular_pairs(n_alunos), histogramas
+        )
+        self._set_csv_offset(fim, stat)
+    
+    def _students_from_partials(self, parciais, dicionarios):
+        """
+        Tabela de alunos (mesmas colunas de _student_table) a partir dos
+        parciais do modo em fluxo, reordenada para os códigos finais
+        """
+        posto = dicionarios['id_matricula'].posto
+        
+        def final(valores):
+            ordenados = np.empty_like(valores)
+            ordenados[posto] = valores
+            return ordenados
+        
+        nota_ma = final(parciais.nota_ma)
+        menor_mb = final(parciais.menor_mb)
+        students = pd.DataFrame({
+            'id_matricula': self.df['id_matricula'].cat.categories,
+            'status': pd.Categorical.from_codes(_status_codes(nota_ma, menor_mb), categories=STATUS_ALUNO)
+        })
+        for coluna, valores in [('id_filial', parciais.filial), ('serie_turma', parciais.serie_turma)]:
+            codigos = dicionarios[coluna].posto.take(np.maximum(valores, 0))
+            students[coluna] = pd.Categorical.from_codes(
+                final(np.where(valores >= 0, codigos, -1)), dtype=self.df[coluna].dtype
+            )
+        
+        tipos = dicionarios['tipo_nota_aval']
+        with np.errstate(invalid='ignore', divide='ignore'):
+            medias = final(parciais.somas / parciais.contagens)
+        for tipo_nota in TIPOS_NOTA:
+            if tipo_nota in tipos.valores:
+                students[tipo_nota] = medias[:, tipos.valores.get_loc(tipo_nota)]
+        
+        students['nota_ma'] = nota_ma
+        students['menor_mb'] = menor_mb
+        students['total_registros'] = final(parciais.total)
+        return students
+    
+    def _append_csv(self, prefixo=None):
+        """
+        Incorpora as linhas anexadas ao CSV desde a última leitura
+        
+        Lê apenas os bytes novos, até a última linha completa. O cubo não é
+        atualizado. prefixo: (offset atual, hash) do trecho já conferido, que
+        o hash dos bytes novos continua. Retorna a quantidade de linhas
+        incorporadas.
+        """
+        stat = os.stat(self.csv_path)
+        fim = ingest.complete_rows_end(self.csv_path, self._csv_offset, stat.st_size)
+        novas = 0
+        if fim > self._csv_offset:
+            df_novas = self._parse_csv(self._csv_offset, fim)
+            novas = len(df_novas)
+            if novas:
+                self._append_rows(df_novas)
+        if fim == self._csv_offset:
+            self._set_csv_offset(fim, stat, digest=self._csv_digest)
+        else:
+            self._set_csv_offset(fim, stat, prefixo)
+        return novas
+    
+    def _append_rows(self, novas):
+        """
+        Anexa linhas já limpas (sem status) à tabela de notas
+        
+        Os dicionários das colunas categóricas são unidos (continuam ordenados,
+        como em uma carga completa) e a tabela de alunos é recalculada apenas
+        para os alunos que aparecem nas linhas novas. As tabelas atuais não são
+        alteradas: novas tabelas substituem self.df, self.students e o índice
+        (quando já construído).
+        """
+        n_antigas = len(self.df)
+        colunas = {}
+        traducoes = {}
+        for coluna in self.df.columns:
+            if coluna == 'status':
+                colunas[coluna] = None
+                continue
+            serie, nova = self.df[coluna], novas[coluna]
+            if isinstance(serie.dtype, pd.CategoricalDtype):
+                antigos, novos, categorias, traducoes[coluna] = _merge_categoricals(serie, nova)
+                colunas[coluna] = pd.Categorical.from_codes(
+                    np.concatenate([antigos, novos]), categories=categorias, validate=False
+                )
+            else:
+                if serie.dtype != nova.dtype:
+                    # id_nota inteiro de um lado e texto do outro: tudo volta a ser texto
+                    serie, nova = serie.astype(str), nova.astype(str)
+                colunas[coluna] = pd.concat([serie, nova], ignore_index=True)
+        
+        # Alunos com notas novas e todas as suas linhas (antigas e novas)
+        codigos = colunas['id_matricula'].codes
+        n_alunos = len(colunas['id_matricula'].categories)
+        tocado = np.zeros(n_alunos, dtype=bool)
+        novos = codigos[n_antigas:]
+        tocado[novos[novos >= 0]] = True
+        linhas = np.flatnonzero((codigos >= 0) & tocado.take(np.maximum(codigos, 0)))
+        
+        # Status por linha: o das linhas antigas se mantém, exceto o dos alunos tocados
+        status = np.full(len(codigos), -1, dtype=np.int8)
+        status[:n_antigas] = self.df['status'].array.codes
+        colunas['status'] = status
+        df = pd.DataFrame(colunas, copy=False)
+        
+        parcial = self._student_table(df.take(linhas))
+        students = self._merge_students(parcial, tocado, traducoes)
+        status[linhas] = students['status'].array.codes.take(codigos[linhas])
+        df['status'] = pd.Categorical.from_codes(status, categories=STATUS_ALUNO)
+        
+        self.df = df
+        self.students = students
+        if self._index:
+            self._extend_index(n_antigas, traducoes)
+    
+    def _merge_students(self, parcial, tocado, traducoes):
+        """
+        Tabela de alunos após um append: linhas recalculadas (parcial) para os
+        alunos tocados e as linhas atuais, reposicionadas, para os demais
+        """
+        traducao = traducoes.get('id_matricula')
+        destino = np.arange(len(self.students)) if traducao is None else traducao
+        origem = np.flatnonzero(~tocado.take(destino))
+        destino = destino[origem]
+        
+        students = {'id_matricula': parcial['id_matricula']}
+        for coluna in parcial.columns.drop('id_matricula'):
+            serie = parcial[coluna]
+            atual = self.students.get(coluna)
+            if isinstance(serie.dtype, pd.CategoricalDtype):
+                valores = serie.array.codes.copy()
+                if atual is not None:
+                    antigos = atual.array.codes.take(origem)
+                    if traducoes.get(coluna) is not None:
+                        antigos = np.where(antigos >= 0, traducoes[coluna].take(np.maximum(antigos, 0)), -1)
+                    valores[destino] = antigos
+                students[coluna] = pd.Categorical.from_codes(valores, dtype=serie.dtype)
+            else:
+                valores = serie.to_numpy().copy()
+                if atual is not None:
+                    valores[destino] = atual.to_numpy().take(origem)
+                students[coluna] = valores
+        return pd.DataFrame(students)
+    
+    @staticmethod
+    def _compact_id_nota(serie):
+        """
+        Converte id_nota para int64 quando todos os valores são inteiros
+        sem zeros à esquerda (a conversão é reversível); caso contrário mantém texto
+        """
+        if serie.isna().any() or not serie.str.fullmatch(r'0|[1-9]\d{0,17}').all():
+            return serie
+        return serie.astype(np.int64)
+    
+    def _calculate_student_status(self):
+        """
+        Calcula o status de cada aluno baseado em suas notas.
+        
+        Lógica correta:
+        - Cada aluno (id_matricula) tem múltiplas notas: Mb1, Mb2, Mb3, Mb4, MA
+        - REPROVADO: Apenas se nota MA < 6
+        - RECUPERAÇÃO: Se MA >= 6, mas alguma nota Mb1-4 < 6
+        - APROVADO: Se todas as notas >= 6
+        """
+        # O status é calculado uma vez por aluno na tabela de alunos
+        self._build_student_table()
+        
+        # Mapear o código de status de volta para cada registro
+        # (uma única coluna categórica substitui 'status' e 'status_aluno')
+        codigos = self.df['id_matricula'].array.codes
+        status = self.students['status'].array.codes
+        status_registros = np.where(codigos >= 0, status.take(np.maximum(codigos, 0)), -1)
+        self.df['status'] = pd.Categorical.from_codes(status_registros, categories=STATUS_ALUNO)
+    
+    def _build_student_table(self):
+        """
+        Tabela de dimensão de alunos: uma linha por id_matricula
+        
+        A linha i corresponde ao código i de id_matricula, então os códigos
+        da tabela de notas servem diretamente como índice (aluno = codigos[linha]).
+        Colunas: filial, série/turma, status, média por tipo de nota (Mb1-Mb4, MA),
+        nota MA e menor nota bimestral usadas no status.
+        """
+        self.students = self._student_table(self.df)
+    
+    def _student_table(self, df):
+        """
+        Tabela de alunos calculada a partir das linhas de df (todas as linhas
+        dos alunos de interesse); alunos sem linhas ficam com valores vazios
+        """
+        # Versão vetorizada: cada aluno é um código inteiro (id_matricula
+        # categórico) e todo o cálculo é feito com operações de array
+        codigos = df['id_matricula'].array.codes
+        tipo = df['tipo_nota_aval']
+        notas = df['vlr_nota'].to_numpy(dtype=np.float64)
+        n_alunos = len(df['id_matricula'].cat.categories)
+        validos = codigos >= 0
+        
+        # Nota MA de cada aluno (primeiro registro MA, como no cálculo original)
+        linhas_ma = np.flatnonzero((tipo == 'MA').to_numpy() & validos)
+        _, primeira = np.unique(codigos[linhas_ma], return_index=True)
+        linhas_ma = linhas_ma[primeira]
+        nota_ma = np.full(n_alunos, np.nan)
+        nota_ma[codigos[linhas_ma]] = notas[linhas_ma]
+        
+        # Menor nota bimestral (Mb1-4) de cada aluno
+        mask_mb = tipo.isin(['Mb1', 'Mb2', 'Mb3', 'Mb4']).to_numpy() & validos
+        menor_mb = (
+            pd.Series(notas[mask_mb])
+            .groupby(codigos[mask_mb])
+            .min()
+            .reindex(range(n_alunos))
+            .to_numpy()
+        )
+        
+        status = _status_codes(nota_ma, menor_mb)
+        
+        students = pd.DataFrame({
+            'id_matricula': df['id_matricula'].cat.categories,
+            'status': pd.Categorical.from_codes(status, categories=STATUS_ALUNO)
+        })
+        
+        # Filial e série/turma: primeiro valor não nulo de cada aluno
+        for coluna in ['id_filial', 'serie_turma']:
+            codigos_coluna = df[coluna].array.codes
+            linhas = np.flatnonzero(validos & (codigos_coluna >= 0))
+            _, primeira = np.unique(codigos[linhas], return_index=True)
+            linhas = linhas[primeira]
+            valores = np.full(n_alunos, -1, dtype=codigos_coluna.dtype)
+            valores[codigos[linhas]] = codigos_coluna[linhas]
+            students[coluna] = pd.Categorical.from_codes(valores, dtype=df[coluna].dtype)
+        
+        # Média de cada tipo de avaliação (sobre as disciplinas do aluno)
+        codigos_tipo = tipo.array.codes
+        n_tipos = len(tipo.cat.categories)
+        com_nota = validos & (codigos_tipo >= 0) & ~np.isnan(notas)
+        chave = codigos[com_nota].astype(np.int64) * n_tipos + codigos_tipo[com_nota]
+        somas = np.bincount(chave, weights=notas[com_nota], minlength=n_alunos * n_tipos)
+        contagens = np.bincount(chave, minlength=n_alunos * n_tipos)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            medias = (somas / contagens).reshape(n_alunos, n_tipos)
+        for tipo_nota in TIPOS_NOTA:
+            if tipo_nota in tipo.cat.categories:
+                students[tipo_nota] = medias[:, tipo.cat.categories.get_loc(tipo_nota)]
+        
+        students['nota_ma'] = nota_ma
+        students['menor_mb'] = menor_mb
+        students['total_registros'] = np.bincount(codigos[validos], minlength=n_alunos)
+        return students
+    
+    def _unique_students(self, df_filtered):
+        """
+        Códigos (linhas da tabela de alunos) dos alunos presentes na seleção
+        
+        Seleções pequenas usam np.unique; seleções grandes marcam presença com
+        bincount, que é linear e evita ordenar os códigos
+        """
+        codigos = df_filtered['id_matricula'].array.codes
+        codigos = codigos[codigos >= 0]
+        n_alunos = len(self.students)
+        if len(codigos) * 8 < n_alunos:
+            return np.unique(codigos)
+        return np.flatnonzero(np.bincount(codigos, minlength=n_alunos))
+    
+    def _status_counts(self, alunos):
+        """
+        Quantidade de alunos por código de status (ordem de STATUS_ALUNO)
+        """
+        status = self.students['status'].array.codes.take(alunos)
+        return np.bincount(status[status >= 0], minlength=len(STATUS_ALUNO))
+    
+    def memory_report(self):
+        """
+        Compara o consumo de memória por registro entre o formato original
+        (strings Python em cada coluna + 'status' e 'status_aluno' duplicados)
+        e o armazenamento compacto atual
+        """
+        if self.df is None or self.df.empty:
+            return {'total_registros': 0, 'colunas': {}}
+        
+        total = len(self.df)
+        colunas = {}
+        for coluna in self.df.columns:
+            serie = self.df[coluna]
+            atual = int(serie.memory_usage(index=False, deep=True))
+            if coluna == 'vlr_nota':
+                original = total * np.dtype(np.float64).itemsize
+            elif coluna == 'id_nota' and serie.dtype.kind == 'i':
+                original = int(serie.astype(str).astype(object).memory_usage(index=False, deep=True))
+            else:
+                original = int(serie.astype(object).memory_usage(index=False, deep=True))
+            colunas[coluna] = {
+                'dtype': str(serie.dtype),
+                'bytes_original': original,
+                'bytes_compacto': atual
+            }
+        
+        # 'status_aluno' existia como cópia de 'status' no formato original
+        colunas['status_aluno'] = {
+            'dtype': 'removida',
+            'bytes_original': colunas['status']['bytes_original'],
+            'bytes_compacto': 0
+        }
+        
+        bytes_original = sum(c['bytes_original'] for c in colunas.values())
+        bytes_compacto = sum(c['bytes_compacto'] for c in colunas.values())
+        return {
+            'total_registros': total,
+            'colunas': colunas,
+            'bytes_original': bytes_original,
+            'bytes_compacto': bytes_compacto,
+            'bytes_por_registro_original': round(bytes_original / total, 2),
+            'bytes_por_registro_compacto': round(bytes_compacto / total, 2),
+            'reducao': round(1 - bytes_compacto / bytes_original, 4)
+        }
+    
+    def memory_bytes(self):
+        """
+        Bytes da tabela de notas, da tabela de alunos, dos índices, do cubo e
+        da amostra (orçamento de memória das partições)
+        """
+        total = 0
+        for tabela in (self.df, self.students, self._amostra):
+            if tabela is not None:
+                total += int(tabela.memory_usage(index=False, deep=True).sum())
+        total += sum(h.nbytes for h in self._histograms.values())
+        for entrada in list(self._index.values()) + [self._linhas_aluno]:
+            if entrada is not None:
+                total += sum(entrada[k].nbytes for k in ('codigos', 'ordem', 'offsets'))
+        if self.roster is not None:
+            total += self.roster.nbytes
+        if self.cube is not None:
+            total += self.cube.nbytes()
+        return total
+    
+    def get_unique_values(self):
+        """
+        Retorna valores únicos para os filtros
+        Listas montadas uma vez na carga (_build_facets): não devem ser alteradas
+        """
+        if self.facets is None:
+            self._build_facets()
+        return self.facets
+    
+    def _build_facets(self):
+        """
+        Opções dos filtros do dashboard e contagens de linhas e alunos por
+        valor sem filtros, calculadas uma vez por versão dos dados
+        """
+        self._facet_totals = {}
+        # No modo em fluxo a tabela não tem linhas, mas tem os dicionários
+        if self.df is None or 'id_filial' not in self.df.columns:
+            self.facets = {
+                'filiais': [],
+                'series_turmas': [],
+                'disciplinas': [],
+                'tipos_nota': []
+            }
+            return
+        
+        # Colunas categóricas: os valores únicos são o próprio dicionário
+        self.facets = {
+            'filiais': sorted(self.df['id_filial'].cat.categories.tolist()),
+            'series_turmas': sorted(self.df['serie_turma'].cat.categories.tolist()),
+            'disciplinas': sorted(self.df['nome_disciplina'].cat.categories.tolist()),
+            'tipos_nota': sorted(self.df['tipo_nota_aval'].cat.categories.tolist())
+        }
+        if self.cube is not None or self._index:
+            self._facet_totals = {coluna: self._facet_counts(coluna, {}) for coluna in COLUNAS_FILTRO}
+    
+    def _build_histograms(self):
+        """
+        Histogramas finos das notas (histogram.fine_bins) de toda a tabela e
+        de cada valor das colunas de filtro: consultas com até um filtro leem
+        uma linha pronta em vez de percorrer as notas selecionadas
+        
+        No modo cubo (e em fluxo) os histogramas ficam nas células do cubo.
+        """
+        self._histograms = {}
+        if self.cube is not None or self.df is None or self.df.empty:
+            return
+        classes = histogram.fine_bins(self.df['vlr_nota'].to_numpy())
+        validas = classes >= 0
+        self._histograms[None] = histogram.counts(classes)
+        for coluna in COLUNAS_FILTRO:
+            codigos = self.df[coluna].array.codes
+            n_valores = len(self.df[coluna].cat.categories)
+            linhas = validas & (codigos >= 0)
+            chaves = codigos[linhas].astype(np.int64) * histogram.N_CLASSES + classes[linhas]
+            self._histograms[coluna] = np.bincount(
+                chaves, minlength=n_valores * histogram.N_CLASSES
+            ).reshape(n_valores, histogram.N_CLASSES)
+    
+    def _precomputed_histogram(self, filters):
+        """
+        Histograma calculado na carga para os filtros, ou None se há mais de
+        um filtro (ou nenhum histograma montado)
+        """
+        filtros = [(coluna, filters[coluna]) for coluna in COLUNAS_FILTRO if filters.get(coluna)]
+        if not self._histograms or len(filtros) > 1:
+            return None
+        if not filtros:
+            return self._histograms[None]
+        coluna, valor = filtros[0]
+        codigo = self.df[coluna].cat.categories.get_indexer([valor])[0]
+        if codigo < 0:
+            return np.zeros(histogram.N_CLASSES, dtype=np.int64)
+        return self._histograms[coluna][codigo]
+    
+    def _build_sample(self):
+        """
+        Amostra do modo aproximado: alunos sorteados por estrato (filial) com
+        ANALYTICS_APPROX_SAMPLE_RATE (None desativa) e pelo menos
+        ANALYTICS_APPROX_MIN_STUDENTS por filial, e todas as linhas deles
+        
+        Não é montada no modo cubo: as consultas exatas já são respondidas
+        pelas células pré-agregadas.
+        """
+        self.sample = None
+        self._amostra = None
+        if not self.approx_rate or self.cube is not None or self.df is None or self.df.empty:
+            return
+        sample = approx.StudentSample(
+            approx.student_hashes(self.students['id_matricula']),
+            self.students['id_filial'].array.codes,
+            len(self.students['id_filial'].cat.categories),
+            self.approx_rate,
+            self.approx_min_students
+        )
+        codigos = self.df['id_matricula'].array.codes
+        sorteadas = (codigos >= 0) & (sample.indices.take(np.maximum(codigos, 0)) >= 0)
+        self._amostra = self.df.take(np.flatnonzero(sorteadas))
+        self.sample = sample
+    
+    def _build_drilldown(self):
+        """
+        Índices do detalhamento, montados na carga: as linhas de cada aluno
+        ficam contíguas (mesma estrutura das listas de postings, busca do
+        código pelo hash do dicionário de id_matricula) e os alunos de cada
+        série/turma em um trecho ordenado por cada chave de drilldown.ORDENACOES
+        """
+        self._linhas_aluno = None
+        self.roster = None
+        if self.df is None or self.df.empty or self.students is None:
+            return
+        self._linhas_aluno = self._index_column('id_matricula')
+        status = self.students['status'].array.codes
+        valores = {
+            'id_matricula': np.zeros(len(self.students)),
+            'status': np.where(status >= 0, status, np.inf),
+        }
+        for coluna in ('nota_ma', 'menor_mb'):
+            notas = self.students[coluna].to_numpy(dtype=np.float64)
+            valores[coluna] = np.where(np.isnan(notas), np.inf, notas)
+        self.roster = drilldown.RosterIndex(
+            self.students['id_matricula'].to_numpy(),
+            self.students['serie_turma'].array.codes,
+            len(self.students['serie_turma'].cat.categories),
+            valores
+        )
+    
+    def _alunos_payload(self, codigos):
+        """
+        Dados (_aluno_payload) dos alunos com os códigos dados
+        """
+        alunos = self.students.take(codigos)
+        return [
+            _aluno_payload(*valores)
+            for valores in zip(
+                alunos['id_matricula'].astype(str),
+                alunos['id_filial'].astype(object).where(alunos['id_filial'].notna(), None),
+                alunos['serie_turma'].astype(object).where(alunos['serie_turma'].notna(), None),
+                alunos['status'].astype(object).where(alunos['status'].notna(), None),
+                alunos['nota_ma'].to_numpy(dtype=np.float64),
+                alunos['menor_mb'].to_numpy(dtype=np.float64)
+            )
+        ]
+    
+    def student_detail(self, id_matricula):
+        """
+        Notas (Mb1-Mb4 e MA por disciplina) e status de um aluno, ou None se
+        o aluno não existe: só as linhas do aluno são lidas
+        """
+        if self._linhas_aluno is None:
+            return None
+        codigo = self._linhas_aluno['categorias'].get_indexer([str(id_matricula)])[0]
+        if codigo < 0:
+            return None
+        offsets = self._linhas_aluno['offsets']
+        linhas = self._linhas_aluno['ordem'][offsets[codigo]:offsets[codigo + 1]]
+        metrics.add_rows(len(linhas))
+        notas = self.df.take(linhas)
+        return _detalhe_aluno(
+            self._alunos_payload([codigo])[0],
+            zip(
+                notas['nome_disciplina'].astype(object).where(notas['nome_disciplina'].notna(), None),
+                notas['tipo_nota_aval'].astype(object),
+                notas['vlr_nota'].to_numpy(dtype=np.float64)
+            )
+        )
+    
+    def class_roster(self, serie_turma, ordenacao='id_matricula', decrescente=False, depois=None,
+                     limite=drilldown.LIMITE_PADRAO):
+        """
+        Página da lista de alunos de uma série/turma na ordem pedida
+        
+        depois é a chave (valor, id_matricula) do último aluno da página
+        anterior (next_cursor, decodificado por drilldown.options): a página
+        começa logo depois dela, sem percorrer as anteriores.
+        """
+        total, pagina = self._roster_page(serie_turma, ordenacao, decrescente, depois, limite + 1)
+        return {
+            'serie_turma': serie_turma,
+            'sort': ordenacao,
+            'order': 'desc' if decrescente else 'asc',
+            'total': total,
+            'alunos': [aluno for _, aluno in pagina[:limite]],
+            'next_cursor': drilldown.encode_cursor(pagina[limite - 1][0]) if len(pagina) > limite else None
+        }
+    
+    def _roster_page(self, serie_turma, ordenacao, decrescente, depois, limite):
+        """
+        Total de alunos da turma e até limite pares (chave, aluno) da página
+        """
+        if self.roster is None:
+            return 0, []
+        turma = self.students['serie_turma'].cat.categories.get_indexer([serie_turma])[0]
+        if turma < 0:
+            return 0, []
+        codigos, valores = self.roster.page(turma, ordenacao, decrescente, depois, limite)
+        alunos = self._alunos_payload(codigos)
+        return self.roster.total(turma), [
+            ((float(valor), aluno['id_matricula']), aluno) for valor, aluno in zip(valores, alunos)
+        ]
+    
+    def _filter_sample(self, filters):
+        """
+        Linhas da amostra que atendem aos filtros (a amostra é pequena: os
+        códigos são comparados diretamente, sem índice)
+        """
+        amostra = self._amostra
+        selecionadas = np.ones(len(amostra), dtype=bool)
+        for coluna in COLUNAS_FILTRO:
+            valor = filters.get(coluna)
+            if not valor:
+                continue
+            codigo = amostra[coluna].cat.categories.get_indexer([valor])[0]
+            if codigo < 0:
+                return amostra.iloc[:0]
+            selecionadas &= amostra[coluna].array.codes == codigo
+        return amostra if selecionadas.all() else amostra[selecionadas]
+    
+    def get_facets(self, filters):
+        """
+        Valores de cada filtro que ainda retornam dados com os filtros atuais,
+        com a quantidade de registros e de alunos de cada um (com cache)
+        
+        Cada coluna considera os demais filtros, mas não o seu próprio valor:
+        o dropdown continua oferecendo as alternativas ao valor escolhido.
+        """
+        def compute():
+            facetas = {}
+            for coluna in COLUNAS_FILTRO:
+                outros = {k: v for k, v in filters.items() if k != coluna}
+                linhas, alunos = self._facet_counts(coluna, outros)
+                presentes = np.flatnonzero(linhas)
+                facetas[coluna] = {
+                    'valores': self.df[coluna].cat.categories[presentes].tolist(),
+                    'total_registros': linhas[presentes],
+                    'total_alunos': alunos[presentes]
+                }
+            return facetas
+        
+        if self.df is None or 'id_filial' not in self.df.columns:
+            return {}
+        return self._cached(self.cache_key(filters, 'facets'), compute)
+    
+    def _facet_counts(self, coluna, filters):
+        """
+        Registros e alunos distintos por código de coluna entre as linhas que
+        atendem aos filtros: sem filtros, os totais da carga; com filtros,
+        apenas as linhas das listas de postings (ou as células do cubo)
+        """
+        filters = {k: v for k, v in filters.items() if v}
+        if not filters and coluna in self._facet_totals:
+            return self._facet_totals[coluna]
+        n_valores = len(self.df[coluna].cat.categories)
+        
+        if self.cube is not None:
+            codigos = self._cube_filters(filters)
+            if codigos is None:
+                return np.zeros(n_valores, dtype=np.int64), np.zeros(n_valores, dtype=np.int64)
+            celulas = self.cube.select(codigos)
+            valores = self.cube.cells[coluna][celulas]
+            validos = valores >= 0
+            linhas = np.bincount(
+                valores[validos], weights=self.cube.n_linhas[celulas][validos], minlength=n_valores
+            ).astype(np.int64)
+            return linhas, self.cube.distinct_students_by(codigos, coluna, celulas)
+        
+        selecao = self._select_rows(filters)
+        valores = self._index[coluna]['codigos']
+        alunos = self.df['id_matricula'].array.codes
+        if selecao is not None:
+            valores, alunos = valores.take(selecao), alunos.take(selecao)
+        validos = valores >= 0
+        linhas = np.bincount(valores[validos], minlength=n_valores)
+        validos &= alunos >= 0
+        return linhas, _distinct_by(valores[validos], alunos[validos], n_valores, len(self.students))
+    
+    def _build_index(self):
+        """
+        Índice invertido para os filtros de igualdade
+        
+        Para cada coluna de filtro guarda os ids de linha ordenados por código
+        (listas de postings contíguas) e os offsets de cada valor: as linhas
+        com o código c são ordem[offsets[c]:offsets[c + 1]], em ordem crescente
+        """
+        self._index = {coluna: self._index_column(coluna) for coluna in COLUNAS_FILTRO}
+    
+    def _index_column(self, coluna):
+        """
+        Listas de postings de uma coluna de filtro
+        """
+        codigos = self.df[coluna].array.codes
+        n_valores = len(self.df[coluna].cat.categories)
+        
+        # argsort estável de códigos inteiros: linhas de cada valor em ordem crescente
+        ordem = np.argsort(codigos, kind='stable').astype(np.int32)
+        contagens = np.bincount(codigos[codigos >= 0], minlength=n_valores)
+        offsets = np.empty(n_valores + 1, dtype=np.int64)
+        offsets[0] = np.count_nonzero(codigos < 0)  # nulos (-1) ficam no início
+        np.cumsum(contagens, out=offsets[1:])
+        offsets[1:] += offsets[0]
+        
+        return {
+            'categorias': self.df[coluna].cat.categories,
+            'codigos': codigos,
+            'ordem': ordem,
+            'offsets': offsets
+        }
+    
+    def _extend_index(self, n_antigas, traducoes):
         """
-        try:
-            # Para Big Data, usaríamos PySpark:
-            # spark = SparkSession.builder.appName("BigDataAnalytics").getOrCreate()
-            # self.df = spark.read.csv(self.csv_path, header=True, inferSchema=True)
-            
-            # Usando Pandas para este projeto (otimizado para performance)
-            self.df = pd.read_csv(
-                self.csv_path,
-                dtype={
-                    'id_nota': str,
-                    'id_matricula': str,
-                    'vlr_nota': float,
-                    'id_filial': str,
-                    'titulo_turma': str,
-                    'nome_serie': str,
-                    'nome_disciplina': str,
-                    'tipo_nota_aval': str
-                }
-            )
+        Índice invertido após um append, sem reordenar todas as linhas
+        
+        Cada lista de postings atual é copiada em bloco para a posição do seu
+        valor no dicionário unido e as linhas novas (ids maiores) entram no fim
+        da lista, que continua em ordem crescente. 'status' é reconstruído: o
+        status das linhas antigas dos alunos tocados pode ter mudado.
+        """
+        indice = {}
+        for coluna in COLUNAS_FILTRO:
+            atual = self._index.get(coluna)
+            if coluna == 'status' or atual is None:
+                indice[coluna] = self._index_column(coluna)
+                continue
             
-            # Limpeza de dados (princípio de Data Quality em Big Data)
-            self.df['titulo_turma'] = self.df['titulo_turma'].str.strip()
-            self.df['nome_serie'] = self.df['nome_serie'].str.strip()
-            self.df['nome_disciplina'] = self.df['nome_disciplina'].str.strip()
-            self.df['tipo_nota_aval'] = self.df['tipo_nota_aval'].str.strip()
+            codigos = self.df[coluna].array.codes
+            n_valores = len(self.df[coluna].cat.categories)
+            novos = codigos[n_antigas:]
+            ordem_novos = np.argsort(novos, kind='stable').astype(np.int32) + n_antigas
             
-            # Criar coluna combinada série-turma
-            self.df['serie_turma'] = self.df['nome_serie'] + ' - ' + self.df['titulo_turma']
+            # Grupos: 0 = nulos, c + 1 = código c (no dicionário unido)
+            traducao = traducoes.get(coluna)
+            n_grupos_atuais = len(atual['offsets'])
+            grupos_atuais = np.arange(n_grupos_atuais) if traducao is None else np.r_[0, traducao + 1]
+            inicios_atuais = np.r_[0, atual['offsets']]
+            contagens_atuais = np.zeros(n_valores + 1, dtype=np.int64)
+            contagens_atuais[grupos_atuais] = np.diff(inicios_atuais)
+            contagens_novas = np.bincount(novos + 1, minlength=n_valores + 1)
+            inicios_novos = np.r_[0, np.cumsum(contagens_novas)]
+            offsets = np.cumsum(contagens_atuais + contagens_novas)
             
-            # Calcular status por aluno (não por registro individual)
-            self._calculate_student_status()
+            origem = np.full(n_valores + 1, -1, dtype=np.int64)
+            origem[grupos_atuais] = np.arange(n_grupos_atuais)
+            ordem = np.empty(len(codigos), dtype=np.int32)
+            for grupo in np.flatnonzero(contagens_atuais + contagens_novas):
+                posicao = offsets[grupo] - contagens_atuais[grupo] - contagens_novas[grupo]
+                if contagens_atuais[grupo]:
+                    g = origem[grupo]
+                    ordem[posicao:posicao + contagens_atuais[grupo]] = \
+                        atual['ordem'][inicios_atuais[g]:inicios_atuais[g + 1]]
+                    posicao += contagens_atuais[grupo]
+                ordem[posicao:offsets[grupo]] = ordem_novos[inicios_novos[grupo]:inicios_novos[grupo + 1]]
             
-        except Exception as e:
-            print(f"Erro ao carregar dados: {e}")
-            self.df = pd.DataFrame()
+            indice[coluna] = {
+                'categorias': self.df[coluna].cat.categories,
+                'codigos': codigos,
+                'ordem': ordem,
+                'offsets': offsets
+            }
+        self._index = indice
     
-    def _calculate_student_status(self):
+    def _select_rows(self, filters):
         """
-        Calcula o status de cada aluno baseado em suas notas.
+        Resolve os filtros pelo índice invertido
         
-        Lógica correta:
-        - Cada aluno (id_matricula) tem múltiplas notas: Mb1, Mb2, Mb3, Mb4, MA
-        - REPROVADO: Apenas se nota MA < 6
-        - RECUPERAÇÃO: Se MA >= 6, mas alguma nota Mb1-4 < 6
-        - APROVADO: Se todas as notas >= 6
+        Começa pela lista de postings mais seletiva e intersecta com os demais
+        filtros consultando os códigos apenas das linhas já selecionadas.
+        Retorna None quando não há filtros (todas as linhas).
         """
-        # Criar DataFrame de status por aluno
-        alunos_status = []
+        selecionados = []
+        for coluna in COLUNAS_FILTRO:
+            valor = filters.get(coluna)
+            if not valor:
+                continue
+            entrada = self._index[coluna]
+            codigo = entrada['categorias'].get_indexer([valor])[0]
+            if codigo < 0:
+                return np.empty(0, dtype=np.int32)
+            tamanho = entrada['offsets'][codigo + 1] - entrada['offsets'][codigo]
+            selecionados.append((tamanho, coluna, codigo))
         
-        # Agrupar por aluno
-        for id_matricula, grupo_aluno in self.df.groupby('id_matricula'):
-            # Pegar a nota MA do aluno
-            nota_ma = grupo_aluno[grupo_aluno['tipo_nota_aval'] == 'MA']['vlr_nota']
-            
-            # Verificar se tem nota MA
-            if len(nota_ma) > 0:
-                nota_ma_valor = nota_ma.iloc[0]
-                
-                # Se MA < 6: REPROVADO
-                if nota_ma_valor < 6:
-                    status = 'Reprovado'
-                else:
-                    # MA >= 6: verificar notas Mb1-4
-                    notas_bimestrais = grupo_aluno[
-                        grupo_aluno['tipo_nota_aval'].isin(['Mb1', 'Mb2', 'Mb3', 'Mb4'])
-                    ]['vlr_nota']
-                    
-                    # Se alguma nota bimestral < 6: RECUPERAÇÃO
-                    if len(notas_bimestrais) > 0 and (notas_bimestrais < 6).any():
-                        status = 'Recuperação'
-                    else:
-                        status = 'Aprovado'
-            else:
-                # Sem nota MA: considerar pelas notas bimestrais
-                notas_bimestrais = grupo_aluno[
-                    grupo_aluno['tipo_nota_aval'].isin(['Mb1', 'Mb2', 'Mb3', 'Mb4'])
-                ]['vlr_nota']
-                
-                if len(notas_bimestrais) > 0 and (notas_bimestrais < 6).any():
-                    status = 'Recuperação'
-                else:
-                    status = 'Aprovado'
-            
-            alunos_status.append({'id_matricula': id_matricula, 'status_aluno': status})
+        if not selecionados:
+            return None
+        
+        selecionados.sort()
+        _, coluna, codigo = selecionados[0]
+        entrada = self._index[coluna]
+        linhas = entrada['ordem'][entrada['offsets'][codigo]:entrada['offsets'][codigo + 1]]
         
-        # Criar DataFrame de status
-        df_status = pd.DataFrame(alunos_status)
+        for _, coluna, codigo in selecionados[1:]:
+            linhas = linhas[self._index[coluna]['codigos'][linhas] == codigo]
+        return linhas
+    
+    def filter_data(self, filters, approximate=False):
+        """
+        Aplica filtros aos dados usando operações otimizadas
+        Implementa MapReduce concept para filtragem distribuída
         
-        # Fazer merge com o DataFrame principal
-        self.df = self.df.merge(df_status, on='id_matricula', how='left')
+        Usa o índice invertido: apenas as linhas selecionadas são copiadas.
+        Sem filtros retorna a própria tabela (somente leitura, sem cópia).
+        Com approximate (e a amostra montada), filtra só as linhas da amostra
+        de alunos: o resultado vai para get_statistics/aggregate_data também
+        com approximate.
+        """
+        if self.df is None or self.df.empty:
+            return self.df
         
-        # Também manter status por registro (para compatibilidade com filtros)
-        self.df['status'] = self.df['status_aluno']
+        with metrics.stage('filter'):
+            if approximate and self.sample is not None:
+                df_filtered = self._filter_sample(filters)
+            else:
+                linhas = self._select_rows(filters)
+                df_filtered = self.df if linhas is None else self.df.take(linhas)
+        metrics.add_rows(len(df_filtered))
+        return df_filtered
     
-    def get_unique_values(self):
+    def iter_rows(self, filters, batch_size=10_000):
         """
-        Retorna valores únicos para os filtros
-        Utiliza operações otimizadas para Big Data
+        Linhas de filter_data em lotes de até batch_size linhas
+        
+        Cada lote é uma cópia pequena (take sobre os ids do índice); a seleção
+        inteira nunca é materializada, então exportações sem filtro não
+        duplicam a tabela.
         """
         if self.df is None or self.df.empty:
+            return
+        linhas = self._select_rows(filters)
+        total = len(self.df) if linhas is None else len(linhas)
+        for inicio in range(0, total, batch_size):
+            if linhas is None:
+                lote = self.df.iloc[inicio:inicio + batch_size]
+            else:
+                lote = self.df.take(linhas[inicio:inicio + batch_size])
+            metrics.add_rows(len(lote))
+            yield lote
+    
+    def cache_key(self, filters, chart_type, approximate=False, histogram_options=None):
+        """
+        Chave normalizada de uma consulta: versão do dataset, filtros não vazios
+        (ordenados) e tipo de gráfico (ou tupla de tipos, no lote); consultas
+        aproximadas e opções de histograma diferentes do padrão têm chaves próprias
+        """
+        filtros = tuple(sorted(
+            (coluna, str(filters[coluna]))
+            for coluna in COLUNAS_FILTRO
+            if filters.get(coluna)
+        ))
+        return _cache_key(self.dataset_version, filtros, chart_type, approximate, histogram_options)
+    
+    def _cached(self, key, compute):
+        """
+        Resultado do cache ou calculado (e guardado) por compute(); consultas
+        iguais simultâneas compartilham um único cálculo
+        """
+        return self.query_cache.get_or_compute(key, compute)
+    
+    def get_chart_payload(self, filters, chart_type='distribuicao_notas', approximate=False,
+                          histogram_options=None):
+        """
+        Dados do gráfico e estatísticas para os filtros, com cache de resultados
+        O resultado é compartilhado entre requisições e não deve ser alterado
+        """
+        def compute():
+            resultado = self.evaluate(filters, [chart_type], approximate, histogram_options)
             return {
-                'filiais': [],
-                'series_turmas': [],
-                'disciplinas': [],
-                'tipos_nota': []
+                'chart_data': resultado['charts'][chart_type],
+                'statistics': resultado['statistics']
             }
-        
-        return {
-            'filiais': sorted(self.df['id_filial'].unique().tolist()),
-            'series_turmas': sorted(self.df['serie_turma'].unique().tolist()),
-            'disciplinas': sorted(self.df['nome_disciplina'].unique().tolist()),
-            'tipos_nota': sorted(self.df['tipo_nota_aval'].unique().tolist())
-        }
+        return self._cached(self.cache_key(filters, chart_type, approximate, histogram_options), compute)
     
-    def filter_data(self, filters):
+    def get_batch_payload(self, filters, chart_types=None, approximate=False, histogram_options=None):
         """
-        Aplica filtros aos dados usando operações otimizadas
-        Implementa MapReduce concept para filtragem distribuída
+        Todos os gráficos pedidos (padrão: todos os tipos) e as estatísticas
+        para um conjunto de filtros, em uma única avaliação e com cache
         """
-        df_filtered = self.df.copy()
-        
-        if filters.get('id_filial'):
-            df_filtered = df_filtered[df_filtered['id_filial'] == filters['id_filial']]
-        
-        if filters.get('serie_turma'):
-            df_filtered = df_filtered[df_filtered['serie_turma'] == filters['serie_turma']]
+        chart_types = tuple(chart_types or CHART_TYPES)
+        return self._cached(
+            self.cache_key(filters, chart_types, approximate, histogram_options),
+            lambda: self.evaluate(filters, chart_types, approximate, histogram_options)
+        )
+    
+    def columns(self):
+        """
+        Colunas da tabela de notas (cabeçalho da exportação)
+        """
+        return [] if self.df is None else list(self.df.columns)
+    
+    def dataset_size(self):
+        """
+        Linhas da tabela de notas e alunos da tabela de alunos carregadas
+        """
+        return (
+            0 if self.df is None else len(self.df),
+            0 if self.students is None else len(self.students)
+        )
+    
+    def cache_stats(self):
+        """
+        Contadores do cache de resultados (acertos, falhas, remoções, coalescidas)
+        """
+        return {'dataset_version': self.dataset_version, **self.query_cache.stats()}
+    
+    def evaluate(self, filters, chart_types, approximate=False, histogram_options=None):
+        """
+        Avaliação fundida: filtra uma vez e calcula as estatísticas e todos os
+        gráficos pedidos sobre a mesma seleção, compartilhando as chaves de
+        grupo (códigos), a lista de alunos únicos e as notas já convertidas
         
-        if filters.get('nome_disciplina'):
-            df_filtered = df_filtered[df_filtered['nome_disciplina'] == filters['nome_disciplina']]
+        approximate usa a amostra de alunos (cada número com margem de erro);
+        seleções com poucas linhas na amostra, o modo cubo e a amostra
+        desativada seguem o caminho exato. histogram_options: (largura,
+        percentis) de histogram.options para distribuicao_notas.
+        """
+        if self._parallel(filters, approximate):
+            selecao = self._parallel_selection(filters, chart_types)
+            if selecao is not False:
+                return _evaluate_selecao(selecao, chart_types, histogram_options)
+        return _evaluate_selecao(self.selection(filters, approximate), chart_types, histogram_options)
+    
+    def _parallel(self, filters, approximate):
+        """
+        A consulta usa a agregação paralela: pool configurado, tabela de
+        linhas (sem cubo nem amostra) e seleção com ao menos
+        ANALYTICS_PARALLEL_MIN_ROWS linhas (limite pelos postings dos filtros)
+        """
+        if self.parallel_workers <= 1 or self.cube is not None or not self._index:
+            return False
+        if approximate and self.sample is not None:
+            return False
+        tamanho = len(self.df)
+        for coluna in COLUNAS_FILTRO:
+            if filters.get(coluna):
+                entrada = self._index[coluna]
+                codigo = entrada['categorias'].get_indexer([filters[coluna]])[0]
+                if codigo < 0:
+                    return False
+                tamanho = min(tamanho, entrada['offsets'][codigo + 1] - entrada['offsets'][codigo])
+        return tamanho >= self.parallel_min_rows
+    
+    def _parallel_groups(self):
+        """
+        Filiais (códigos da filial de cada aluno) divididas em até
+        parallel_workers grupos com quantidades de linhas parecidas; os alunos
+        sem filial (-1) ficam no primeiro grupo. Retorna os grupos e o grupo
+        de cada linha.
+        """
+        filiais = self.students['id_filial'].array.codes
+        alunos = self.df['id_matricula'].array.codes
+        filial_linha = np.where(alunos >= 0, filiais.take(np.maximum(alunos, 0)), -1)
+        linhas = np.bincount(filial_linha + 1, minlength=len(self.students['id_filial'].cat.categories) + 1)
         
-        if filters.get('tipo_nota_aval'):
-            df_filtered = df_filtered[df_filtered['tipo_nota_aval'] == filters['tipo_nota_aval']]
+        # Maior filial primeiro, sempre no grupo com menos linhas
+        grupos = [[] for _ in range(min(self.parallel_workers, np.count_nonzero(linhas)))]
+        grupo_da_filial = np.zeros(len(linhas), dtype=np.int32)
+        cargas = np.zeros(len(grupos), dtype=np.int64)
+        for codigo in np.argsort(-linhas, kind='stable'):
+            if linhas[codigo] == 0:
+                break
+            destino = int(np.argmin(cargas))
+            grupos[destino].append(int(codigo) - 1)
+            grupo_da_filial[codigo] = destino
+            cargas[destino] += linhas[codigo]
+        grupos[0].append(-1)
+        return grupos, grupo_da_filial.take(filial_linha + 1)
+    
+    def _parallel_partitions(self):
+        """
+        Partições da agregação paralela desta versão dos dados, gravadas na
+        primeira consulta paralela: as linhas ordenadas pelo grupo de filiais
+        (_parallel_groups) ficam em trechos contíguos, e cada trecho vira um
+        snapshot próprio em ANALYTICS_SNAPSHOT_DIR/paralelo/<versão>/ (ou em um
+        diretório temporário do processo). Cada processo do pool mapeia só o seu, então o
+        trabalho e a memória de cada um são ~1/N do total. Partições de
+        versões anteriores são removidas.
+        """
+        with self._particoes_lock:
+            versao, caminhos = self._particoes_paralelas
+            if versao == self.dataset_version:
+                return caminhos
+            
+            if self.snapshot_dir:
+                base = os.path.join(self.snapshot_dir, 'paralelo')
+            else:
+                base = self._dir_paralelo = self._dir_paralelo or tempfile.mkdtemp(prefix='analytics-paralelo-')
+            destino = os.path.join(base, self.dataset_version)
+            grupos, grupo_linha = self._parallel_groups()
+            ordem = np.argsort(grupo_linha, kind='stable')
+            offsets = np.r_[0, np.cumsum(np.bincount(grupo_linha, minlength=len(grupos)))]
+            caminhos = []
+            for grupo in range(len(grupos)):
+                caminho = os.path.join(destino, f'{len(grupos)}-{grupo}')
+                manifest = snapshot.read_manifest(caminho) if os.path.isdir(caminho) else None
+                if manifest is None or manifest.get('dataset_version') != self.dataset_version:
+                    linhas = ordem[offsets[grupo]:offsets[grupo + 1]]
+                    snapshot.save_snapshot(
+                        self.df.take(linhas), caminho,
+                        {'size': len(linhas), 'mtime_ns': 0, 'hash': f'grupo{grupo}'},
+                        students=self.students, dataset_version=self.dataset_version
+                    )
+                caminhos.append(caminho)
+            for nome in os.listdir(base):
+                if nome != self.dataset_version:
+                    shutil.rmtree(os.path.join(base, nome), ignore_errors=True)
+            self._particoes_paralelas = (self.dataset_version, caminhos)
+            return caminhos
+    
+    def _parallel_selection(self, filters, chart_types):
+        """
+        Agregação paralela (map-reduce): cada processo do pool calcula as
+        primitivas das linhas de uma partição (_map_partition) e as parciais
+        são somadas (_SelecaoParticoes). Os alunos de partições diferentes são
+        distintos, então o resultado é o mesmo do caminho serial (as médias
+        podem diferir só no último bit, antes do arredondamento). Retorna
+        False se algum processo está com outra versão dos dados ou falhou (a
+        consulta segue pelo caminho serial).
+        """
+        try:
+            caminhos = self._parallel_partitions()
+            pool = _parallel_pool(self.parallel_workers)
+            with metrics.stage('aggregate'):
+                futuros = [
+                    pool.submit(_map_partition, caminho, self.dataset_version, filters, tuple(chart_types))
+                    for caminho in caminhos
+                ]
+                parciais = [futuro.result() for futuro in futuros]
+        except Exception:
+            logger.exception('Erro na agregação paralela; usando o caminho serial')
+            return False
+        metrics.REGISTRY.inc('analytics_parallel_queries_total')
+        if any(versao != self.dataset_version for versao, _ in parciais):
+            return False
+        resumos = [resumo for _, resumo in parciais if resumo is not None]
+        for resumo in resumos:
+            metrics.add_rows(resumo.totais()['n_linhas'])
+        return _SelecaoParticoes(resumos) if resumos else None
+    
+    def selection(self, filters, approximate=False):
+        """
+        Seleção dos registros que atendem aos filtros (None se vazia): células
+        do cubo, linhas da amostra (approximate) ou linhas da tabela
+        """
+        if self.cube is not None:
+            # Modo cubo: resposta montada só com as células pré-agregadas
+            with metrics.stage('filter'):
+                codigos = self._cube_filters(filters)
+                celulas = None if codigos is None else self.cube.select(codigos)
+            if celulas is None:
+                return None
+            metrics.add_rows(len(celulas), 'analytics_cube_cells_scanned_total')
+            if not self.cube.n_linhas[celulas].any():
+                return None
+            return _SelecaoCubo(self, codigos, celulas)
         
-        if filters.get('status'):
-            df_filtered = df_filtered[df_filtered['status'] == filters['status']]
+        if approximate and self.sample is not None:
+            amostra = self.filter_data(filters, approximate=True)
+            if len(amostra) >= AMOSTRA_MIN_LINHAS:
+                return _SelecaoAmostra(self, amostra)
         
-        return df_filtered
+        df_filtered = self.filter_data(filters)
+        if df_filtered is None or df_filtered.empty:
+            return None
+        return _SelecaoLinhas(self, df_filtered, filters)
+    
+    def evaluate_frame(self, df_filtered, chart_types):
+        """
+        Estatísticas e gráficos pedidos para um DataFrame já filtrado
+        """
+        if df_filtered.empty:
+            return _evaluate_selecao(None, chart_types)
+        return _evaluate_selecao(_SelecaoLinhas(self, df_filtered), chart_types)
+    
+    def _selecao(self, df_filtered, approximate):
+        """
+        Seleção exata sobre as linhas ou estimada sobre as linhas da amostra
+        """
+        if approximate and self.sample is not None:
+            return _SelecaoAmostra(self, df_filtered)
+        return _SelecaoLinhas(self, df_filtered)
     
-    def aggregate_data(self, df_filtered, chart_type='distribuicao_notas'):
+    def aggregate_data(self, df_filtered, chart_type='distribuicao_notas', approximate=False,
+                       histogram_options=None):
         """
         Agrega dados para visualização
         Utiliza operações de agregação distribuída (conceito de Big Data Analytics)
+        
+        approximate: df_filtered veio de filter_data(..., approximate=True)
         """
         if df_filtered.empty:
-            return {
-                'labels': [],
-                'data': [],
-                'title': 'Sem dados para os filtros selecionados'
-            }
+            return _chart_vazio()
+        with metrics.stage('aggregate'):
+            return self._selecao(df_filtered, approximate).chart(chart_type, histogram_options)
+    
+    def get_statistics(self, df_filtered, approximate=False):
+        """
+        Calcula estatísticas descritivas usando Big Data Analytics
+        
+        IMPORTANTE: Conta alunos únicos por status, não registros individuais
+        approximate: df_filtered veio de filter_data(..., approximate=True)
+        """
+        if df_filtered.empty:
+            return _statistics_vazias()
+        with metrics.stage('stats'):
+            return self._selecao(df_filtered, approximate).statistics()
+    
+    def _students_by_filial_status(self, alunos):
+        """
+        Matriz filial x status de alunos únicos (apenas filiais com alunos)
+        """
+        filiais = self.students['id_filial'].array.codes.take(alunos)
+        status = self.students['status'].array.codes.take(alunos)
+        validos = (filiais >= 0) & (status >= 0)
+        
+        # Contar por filial e status (matriz filial x status via bincount)
+        n_status = len(STATUS_ALUNO)
+        categorias = self.students['id_filial'].cat.categories
+        contagens = np.bincount(
+            filiais[validos].astype(np.int64) * n_status + status[validos],
+            minlength=len(categorias) * n_status
+        ).reshape(len(categorias), n_status)
+        presentes = np.flatnonzero(contagens.sum(axis=1))
+        return pd.DataFrame(contagens[presentes], index=categorias[presentes], columns=STATUS_ALUNO)
+    
+    def _build_cube(self):
+        """
+        Cubo OLAP no grão (filial, série/turma, disciplina, tipo de nota, status, faixa)
+        Construído uma vez na carga quando ANALYTICS_CUBE_MODE está ativo
+        """
+        dims = {
+            coluna: (self.df[coluna].array.codes, len(self.df[coluna].cat.categories))
+            for coluna in COLUNAS_FILTRO
+        }
+        dims['faixa'] = (_faixa_codes(self.df['vlr_nota'].to_numpy()), len(ROTULOS_FAIXA))
+        self.cube = OlapCube(
+            dims,
+            self.df['vlr_nota'].to_numpy(),
+            self.df['id_matricula'].array.codes,
+            len(self.students),
+            student_dims=('id_filial', 'serie_turma', 'status', 'faixa')
+        )
+    
+    def _cube_filters(self, filters):
+        """
+        Converte os filtros em códigos das dimensões do cubo (None se algum
+        valor não existe nos dados)
+        """
+        codigos = {}
+        for coluna in COLUNAS_FILTRO:
+            valor = filters.get(coluna)
+            if not valor:
+                continue
+            codigo = self.df[coluna].cat.categories.get_indexer([valor])[0]
+            if codigo < 0:
+                return None
+            codigos[coluna] = int(codigo)
+        return codigos
+
+
+class _MapEngine(BigDataAnalytics):
+    """
+    Processador dos processos do pool da agregação paralela: a partição
+    gravada por _parallel_partitions (snapshot mapeado, sem ler o CSV) com o
+    índice só das suas linhas; sem facetas, histogramas, amostra ou
+    detalhamento
+    """
+    
+    def __init__(self, caminho):
+        super().__init__(load=False)
+        self.origem = caminho
+        self.streaming_mode = False
+        self.cube_mode = False
+        manifest = snapshot.read_manifest(caminho)
+        if manifest is None:
+            raise FileNotFoundError(f'partição não encontrada em {caminho}')
+        self._attach_snapshot(manifest)
+        self.dataset_version = manifest['dataset_version']
+
+
+def _cache_key(versao, filtros, chart_type, approximate, histogram_options):
+    chave = (versao, filtros, chart_type)
+    if histogram_options is not None and histogram_options != histogram.options():
+        chave += (('histograma',) + tuple(histogram_options),)
+    return chave + ('aproximado',) if approximate else chave
+
+
+def _evaluate_selecao(selecao, chart_types, histogram_options=None):
+    """
+    Estatísticas + gráficos de uma seleção (None = seleção vazia)
+    """
+    if selecao is None:
+        return {
+            'charts': {chart_type: _chart_vazio() for chart_type in chart_types},
+            'statistics': _statistics_vazias()
+        }
+    with metrics.stage('aggregate'):
+        charts = {chart_type: selecao.chart(chart_type, histogram_options) for chart_type in chart_types}
+    with metrics.stage('stats'):
+        statistics = selecao.statistics()
+    return {'charts': charts, 'statistics': statistics}
+
+
+class _Selecao:
+    """
+    Uma seleção de registros e os resultados intermediários compartilhados
+    entre estatísticas e gráficos (calculados uma vez, sob demanda)
+    
+    Subclasses fornecem as primitivas: totais(), somas_por(coluna),
+    histograma() (classes finas de nota), alunos_por_faixa() e o atributo
+    alunos (códigos dos alunos únicos).
+    Todas são somáveis entre seleções de alunos disjuntos (partições).
+    """
+    
+    def __init__(self, engine):
+        self.engine = engine
+    
+    def n_alunos(self):
+        return len(self.alunos)
+    
+    def status_counts(self):
+        return self.engine._status_counts(self.alunos)
+    
+    def filial_status(self):
+        return self.engine._students_by_filial_status(self.alunos)
+    
+    def medias_por(self, coluna):
+        """
+        Média das notas por valor da coluna (valores com ao menos uma linha)
+        """
+        somas = self.somas_por(coluna)
+        return somas['soma'] / somas['n_notas']
+    
+    def statistics(self):
+        totais = self.totais()
+        return _statistics_payload(
+            total_registros=totais['n_linhas'],
+            media=totais['media'],
+            maxima=totais['maxima'],
+            minima=totais['minima'],
+            total_alunos=self.n_alunos(),
+            status_counts=self.status_counts()
+        )
+    
+    def chart(self, chart_type, histogram_options=None):
+        if chart_type == 'distribuicao_notas':
+            # Histogramas finos somados e reagrupados na largura pedida
+            return _chart_distribuicao_notas(self.histograma(), histogram_options or histogram.options())
         
-        if chart_type == 'comparacao_filiais':
+        elif chart_type == 'comparacao_filiais':
             # Comparação de status entre filiais (escolas)
             # Agrupa por filial e conta alunos únicos por status
-            
-            # Pegar um registro por aluno (para não contar duplicado)
-            df_alunos = df_filtered.groupby('id_matricula').first().reset_index()
-            
-            # Contar por filial e status
-            result = df_alunos.groupby(['id_filial', 'status']).size().unstack(fill_value=0)
-            
-            # Preparar dados para gráfico de barras agrupadas
-            labels = [f"Escola {filial}" for filial in result.index]
-            
-            # Dados por status (se existir)
-            data_aprovados = result['Aprovado'].tolist() if 'Aprovado' in result.columns else [0] * len(labels)
-            data_recuperacao = result['Recuperação'].tolist() if 'Recuperação' in result.columns else [0] * len(labels)
-            data_reprovados = result['Reprovado'].tolist() if 'Reprovado' in result.columns else [0] * len(labels)
-            
-            return {
-                'labels': labels,
-                'data': data_reprovados,  # Padrão: mostrar reprovados
-                'datasets': [
-                    {'label': 'Reprovados', 'data': data_reprovados, 'color': 'rgba(220, 53, 69, 0.7)'},
-                    {'label': 'Recuperação', 'data': data_recuperacao, 'color': 'rgba(255, 193, 7, 0.7)'},
-                    {'label': 'Aprovados', 'data': data_aprovados, 'color': 'rgba(40, 167, 69, 0.7)'}
-                ],
-                'title': 'Comparação entre Escolas (Aprovados, Recuperação e Reprovados)',
-                'type': 'grouped'
-            }
+            return _chart_comparacao_filiais(self.filial_status())
         
         elif chart_type == 'media_por_disciplina':
             # Média por disciplina
-            result = df_filtered.groupby('nome_disciplina')['vlr_nota'].mean().sort_values(ascending=False)
-            
-            return {
-                'labels': result.index.tolist(),
-                'data': [round(x, 2) for x in result.values.tolist()],
-                'title': 'Média de Notas por Disciplina'
-            }
+            result = self.medias_por('nome_disciplina').sort_values(ascending=False)
+            return _chart_media(result, 'Média de Notas por Disciplina')
         
         elif chart_type == 'status_alunos':
             # Status dos alunos (Aprovado/Recuperação/Reprovado)
             # Contar ALUNOS ÚNICOS, não registros
-            alunos_por_status = df_filtered.groupby('id_matricula')['status'].first()
-            result = alunos_por_status.value_counts()
-            
-            return {
-                'labels': result.index.tolist(),
-                'data': result.values.tolist(),
-                'title': 'Status dos Alunos (Quantidade de Alunos Únicos)'
-            }
+            return _chart_status_alunos(self.status_counts())
         
         elif chart_type == 'notas_por_tipo':
-            # Média de notas por tipo de avaliação
-            result = df_filtered.groupby('tipo_nota_aval')['vlr_nota'].mean().sort_index()
-            
-            return {
-                'labels': result.index.tolist(),
-                'data': [round(x, 2) for x in result.values.tolist()],
-                'title': 'Média de Notas por Tipo de Avaliação'
-            }
+            # Média de notas por tipo de avaliação (dicionário já ordenado)
+            return _chart_media(self.medias_por('tipo_nota_aval'), 'Média de Notas por Tipo de Avaliação')
         
         elif chart_type == 'alunos_por_faixa':
-            # Quantidade de alunos por faixa de nota
-            bins = [0, 4, 6, 8, 10]
-            labels_bins = ['Crítico (0-4)', 'Recuperação (4-6)', 'Bom (6-8)', 'Excelente (8-10)']
-            df_filtered['faixa_nota'] = pd.cut(df_filtered['vlr_nota'], bins=bins, labels=labels_bins, include_lowest=True)
-            
-            # Contar alunos únicos por faixa
-            result = df_filtered.groupby('faixa_nota')['id_matricula'].nunique()
-            
-            return {
-                'labels': result.index.tolist(),
-                'data': result.values.tolist(),
-                'title': 'Quantidade de Alunos por Faixa de Desempenho'
-            }
+            # Quantidade de alunos únicos por faixa de nota
+            contagens = self.alunos_por_faixa()
+            presentes = np.flatnonzero(contagens)
+            result = pd.Series(contagens[presentes], index=[ROTULOS_FAIXA[i] for i in presentes])
+            return _chart_alunos_por_faixa(result)
         
+        return _chart_nao_reconhecido()
+
+
+def _somas_presentes(categorias, n_linhas, soma, n_notas):
+    """
+    Agregados por valor (índice = rótulo) dos valores com ao menos uma linha
+    """
+    presentes = np.flatnonzero(n_linhas)
+    return pd.DataFrame({
+        'n_linhas': n_linhas[presentes],
+        'soma': soma[presentes],
+        'n_notas': n_notas[presentes]
+    }, index=categorias[presentes])
+
+
+class _SelecaoLinhas(_Selecao):
+    """
+    Seleção sobre as linhas de um DataFrame filtrado
+    """
+    
+    def __init__(self, engine, df_filtered, filters=None):
+        super().__init__(engine)
+        self.df = df_filtered
+        # Filtros que geraram a seleção (permitem usar os histogramas da carga)
+        self.filters = filters
+    
+    @cached_property
+    def notas(self):
+        # Decodificar para float64 uma única vez (valores vão para o JSON)
+        return self.df['vlr_nota'].to_numpy(dtype=np.float64)
+    
+    @cached_property
+    def classes(self):
+        return histogram.fine_bins(self.notas)
+    
+    def histograma(self):
+        if self.filters is not None:
+            precalculado = self.engine._precomputed_histogram(self.filters)
+            if precalculado is not None:
+                return precalculado
+        return histogram.counts(self.classes)
+    
+    @cached_property
+    def alunos(self):
+        return self.engine._unique_students(self.df)
+    
+    def totais(self):
+        validas = self.notas[~np.isnan(self.notas)]
+        vazio = len(validas) == 0
         return {
-            'labels': [],
-            'data': [],
-            'title': 'Tipo de gráfico não reconhecido'
+            'n_linhas': len(self.df),
+            'soma': float(validas.sum()),
+            'n_notas': len(validas),
+            'media': np.nan if vazio else validas.mean(),
+            'maxima': np.nan if vazio else validas.max(),
+            'minima': np.nan if vazio else validas.min()
         }
     
-    def get_statistics(self, df_filtered):
+    def somas_por(self, coluna):
         """
-        Calcula estatísticas descritivas usando Big Data Analytics
-        
-        IMPORTANTE: Conta alunos únicos por status, não registros individuais
+        Linhas, soma e quantidade de notas por valor da coluna, usando os
+        códigos como chave de grupo (bincount)
         """
-        if df_filtered.empty:
-            return {
-                'total_registros': 0,
-                'media_geral': 0,
-                'nota_maxima': 0,
-                'nota_minima': 0,
-                'total_alunos': 0,
-                'aprovados': 0,
-                'recuperacao': 0,
-                'reprovados': 0
-            }
+        codigos = self.df[coluna].array.codes
+        categorias = self.df[coluna].cat.categories
+        com_codigo = codigos >= 0
+        validas = com_codigo & ~np.isnan(self.notas)
+        n_linhas = np.bincount(codigos[com_codigo], minlength=len(categorias))
+        soma = np.bincount(codigos[validas], weights=self.notas[validas], minlength=len(categorias))
+        n_notas = np.bincount(codigos[validas], minlength=len(categorias))
+        return _somas_presentes(categorias, n_linhas, soma, n_notas)
+    
+    def alunos_por_faixa(self):
+        faixas = _faixa_das_classes(self.classes)
+        alunos = self.df['id_matricula'].array.codes
+        validos = (faixas >= 0) & (alunos >= 0)
+        n_alunos = len(self.engine.students)
+        # Presença (faixa, aluno) marcada com bincount: poucas faixas, sem ordenar
+        pares = faixas[validos].astype(np.int64) * n_alunos + alunos[validos]
+        presenca = np.bincount(pares, minlength=len(ROTULOS_FAIXA) * n_alunos)
+        return np.count_nonzero(presenca.reshape(len(ROTULOS_FAIXA), n_alunos), axis=1)
+
+
+class _SelecaoAmostra(_Selecao):
+    """
+    Seleção sobre as linhas da amostra de alunos (modo aproximado)
+    
+    Contagens e médias são estimativas ponderadas pelo inverso da
+    probabilidade de sorteio de cada aluno; cada payload traz 'aproximado' e,
+    em 'erro', a meia-largura do intervalo de 95% de cada número. Máxima e
+    mínima são as da amostra (sem margem).
+    """
+    
+    def __init__(self, engine, df_amostra):
+        super().__init__(engine)
+        self.df = df_amostra
+        self.pesos = engine.sample.pesos
+    
+    @cached_property
+    def notas(self):
+        return self.df['vlr_nota'].to_numpy(dtype=np.float64)
+    
+    @cached_property
+    def com_nota(self):
+        return ~np.isnan(self.notas)
+    
+    @cached_property
+    def codigos_alunos(self):
+        return self.df['id_matricula'].array.codes
+    
+    @cached_property
+    def locais(self):
+        # Posição de cada aluno na amostra (índice dos pesos)
+        return self.engine.sample.indices.take(self.codigos_alunos)
+    
+    def _do_aluno(self, coluna):
+        """
+        Código da coluna da tabela de alunos para cada linha
+        """
+        return self.engine.students[coluna].array.codes.take(self.codigos_alunos)
+    
+    def alunos_por(self, grupos, n_grupos):
+        """
+        Alunos distintos por grupo (códigos por linha, -1 = sem grupo) e margens
+        """
+        validos = grupos >= 0
+        return approx.estimate_totals(grupos[validos], self.locais[validos], self.pesos, n_grupos)
+    
+    def medias_por(self, grupos, n_grupos):
+        """
+        Média das notas por grupo, margens e se o grupo tem linhas na amostra
+        """
+        validos = grupos >= 0
+        com_nota = validos & self.com_nota
+        medias, erros = approx.estimate_ratios(
+            grupos[com_nota], self.locais[com_nota], self.pesos, n_grupos,
+            self.notas[com_nota], np.ones(np.count_nonzero(com_nota))
+        )
+        presentes = np.bincount(grupos[validos], minlength=n_grupos) > 0
+        return medias, erros, presentes
+    
+    def statistics(self):
+        zeros = np.zeros(len(self.df), dtype=np.int64)
+        registros, erro_registros = approx.estimate_totals(zeros, self.locais, self.pesos, 1, np.ones(len(self.df)))
+        alunos, erro_alunos = self.alunos_por(zeros, 1)
+        status, erro_status = self.alunos_por(self._do_aluno('status'), len(STATUS_ALUNO))
+        media, erro_media, _ = self.medias_por(zeros, 1)
+        validas = self.notas[self.com_nota]
+        
+        payload = _statistics_payload(
+            total_registros=np.rint(registros[0]),
+            media=media[0],
+            maxima=validas.max() if len(validas) else np.nan,
+            minima=validas.min() if len(validas) else np.nan,
+            total_alunos=np.rint(alunos[0]),
+            status_counts=np.rint(status).astype(np.int64)
+        )
+        erro_status = dict(zip(STATUS_ALUNO, _erro_contagem(erro_status).tolist()))
+        payload['aproximado'] = True
+        payload['erro'] = {
+            'total_registros': int(_erro_contagem(erro_registros)[0]),
+            'media_geral': round(float(erro_media[0]), 2),
+            'nota_maxima': None,
+            'nota_minima': None,
+            'total_alunos': int(_erro_contagem(erro_alunos)[0]),
+            'aprovados': erro_status['Aprovado'],
+            'recuperacao': erro_status['Recuperação'],
+            'reprovados': erro_status['Reprovado']
+        }
+        return payload
+    
+    def chart(self, chart_type, histogram_options=None):
+        if chart_type == 'distribuicao_notas':
+            # Histograma fino estimado (percentis da distribuição ponderada) e
+            # margens das contagens de cada faixa
+            opcoes = histogram_options or histogram.options()
+            classes = histogram.fine_bins(self.notas)
+            validas = classes >= 0
+            finas, _ = approx.estimate_totals(
+                classes[validas], self.locais[validas], self.pesos, histogram.N_CLASSES, np.ones(np.count_nonzero(validas))
+            )
+            chart = _chart_distribuicao_notas(finas, opcoes)
+            passo = round(opcoes[0] * histogram.RESOLUCAO)
+            faixas = np.maximum(np.ceil(classes[validas] / passo).astype(np.int64) - 1, 0)
+            contagens, erros = approx.estimate_totals(
+                faixas, self.locais[validas], self.pesos, len(chart['labels']), np.ones(len(faixas))
+            )
+            chart['data'] = np.rint(contagens).astype(np.int64)
+            return _aproximado(chart, _erro_contagem(erros))
+        
+        elif chart_type == 'comparacao_filiais':
+            n_status = len(STATUS_ALUNO)
+            filiais = self._do_aluno('id_filial')
+            status = self._do_aluno('status')
+            categorias = self.engine.students['id_filial'].cat.categories
+            grupos = np.where((filiais >= 0) & (status >= 0), filiais.astype(np.int64) * n_status + status, -1)
+            contagens, erros = self.alunos_por(grupos, len(categorias) * n_status)
+            contagens = np.rint(contagens).astype(np.int64).reshape(len(categorias), n_status)
+            erros = _erro_contagem(erros).reshape(len(categorias), n_status)
+            presentes = np.flatnonzero(contagens.sum(axis=1))
+            chart = _chart_comparacao_filiais(
+                pd.DataFrame(contagens[presentes], index=categorias[presentes], columns=STATUS_ALUNO)
+            )
+            # Datasets na ordem Reprovados, Recuperação, Aprovados
+            for dataset, status_dataset in zip(chart['datasets'], ['Reprovado', 'Recuperação', 'Aprovado']):
+                dataset['erro'] = erros[presentes, STATUS_ALUNO.index(status_dataset)]
+            return _aproximado(chart, chart['datasets'][0]['erro'])
+        
+        elif chart_type in ('media_por_disciplina', 'notas_por_tipo'):
+            coluna = 'nome_disciplina' if chart_type == 'media_por_disciplina' else 'tipo_nota_aval'
+            categorias = self.df[coluna].cat.categories
+            medias, erros, presentes = self.medias_por(self.df[coluna].array.codes, len(categorias))
+            presentes = np.flatnonzero(presentes)
+            if chart_type == 'media_por_disciplina':
+                # Maiores médias primeiro (sem média no fim, como no caminho exato)
+                presentes = presentes[np.argsort(-medias[presentes], kind='stable')]
+                titulo = 'Média de Notas por Disciplina'
+            else:
+                titulo = 'Média de Notas por Tipo de Avaliação'
+            chart = _chart_media(pd.Series(medias[presentes], index=categorias[presentes]), titulo)
+            return _aproximado(chart, np.round(erros[presentes], 2))
         
-        # Contar ALUNOS ÚNICOS por status (não registros)
-        # Cada aluno aparece múltiplas vezes (uma por nota), mas deve ser contado uma vez
-        alunos_por_status = df_filtered.groupby('id_matricula')['status'].first()
-        status_counts = alunos_por_status.value_counts().to_dict()
+        elif chart_type == 'status_alunos':
+            contagens, erros = self.alunos_por(self._do_aluno('status'), len(STATUS_ALUNO))
+            contagens = np.rint(contagens).astype(np.int64)
+            chart = _chart_status_alunos(contagens)
+            erros = pd.Series(_erro_contagem(erros), index=STATUS_ALUNO)
+            return _aproximado(chart, erros[chart['labels']].to_numpy())
+        
+        elif chart_type == 'alunos_por_faixa':
+            contagens, erros = self.alunos_por(_faixa_codes(self.notas), len(ROTULOS_FAIXA))
+            contagens = np.rint(contagens).astype(np.int64)
+            presentes = np.flatnonzero(contagens)
+            chart = _chart_alunos_por_faixa(
+                pd.Series(contagens[presentes], index=[ROTULOS_FAIXA[i] for i in presentes])
+            )
+            return _aproximado(chart, _erro_contagem(erros)[presentes])
         
+        return _chart_nao_reconhecido()
+
+
+class _SelecaoResumo(_Selecao):
+    """
+    Primitivas já calculadas de uma seleção, só as usadas pelos gráficos
+    pedidos: guarda arrays pequenos (por valor, status ou faixa) em vez das
+    linhas, então a partição de origem pode ser liberada logo em seguida
+    """
+    
+    def __init__(self, selecao, chart_types):
+        super().__init__(None)
+        self._totais = selecao.totais()
+        self._n_alunos = selecao.n_alunos()
+        self._status_counts = selecao.status_counts()
+        self._somas = {}
+        if 'distribuicao_notas' in chart_types:
+            self._histograma = selecao.histograma()
+        if 'comparacao_filiais' in chart_types:
+            self._filial_status = selecao.filial_status()
+        if 'alunos_por_faixa' in chart_types:
+            self._faixas = selecao.alunos_por_faixa()
+        for chart_type, coluna in (('media_por_disciplina', 'nome_disciplina'), ('notas_por_tipo', 'tipo_nota_aval')):
+            if chart_type in chart_types:
+                self._somas[coluna] = selecao.somas_por(coluna)
+    
+    def totais(self):
+        return self._totais
+    
+    def somas_por(self, coluna):
+        return self._somas[coluna]
+    
+    def histograma(self):
+        return self._histograma
+    
+    def n_alunos(self):
+        return self._n_alunos
+    
+    def status_counts(self):
+        return self._status_counts
+    
+    def filial_status(self):
+        return self._filial_status
+    
+    def alunos_por_faixa(self):
+        return self._faixas
+
+
+class _SelecaoParticoes(_Selecao):
+    """
+    União das seleções de várias partições do dataset (PartitionedAnalytics)
+    
+    Cada partição guarda alunos distintos das demais (a matrícula pertence a
+    uma filial e a um ano), então alunos, status e faixas somam entre elas e
+    as médias vêm das somas e quantidades de notas de cada parte.
+    """
+    
+    def __init__(self, selecoes):
+        super().__init__(None)
+        self.selecoes = selecoes
+    
+    def totais(self):
+        partes = [s.totais() for s in self.selecoes]
+        soma = sum(p['soma'] for p in partes)
+        n_notas = sum(p['n_notas'] for p in partes)
+        maximas = [p['maxima'] for p in partes if not np.isnan(p['maxima'])]
+        minimas = [p['minima'] for p in partes if not np.isnan(p['minima'])]
         return {
-            'total_registros': len(df_filtered),
-            'media_geral': round(df_filtered['vlr_nota'].mean(), 2),
-            'nota_maxima': round(df_filtered['vlr_nota'].max(), 2),
-            'nota_minima': round(df_filtered['vlr_nota'].min(), 2),
-            'total_alunos': df_filtered['id_matricula'].nunique(),
-            'aprovados': status_counts.get('Aprovado', 0),
-            'recuperacao': status_counts.get('Recuperação', 0),
-            'reprovados': status_counts.get('Reprovado', 0)
+            'n_linhas': sum(p['n_linhas'] for p in partes),
+            'soma': soma,
+            'n_notas': n_notas,
+            'media': soma / n_notas if n_notas else np.nan,
+            'maxima': max(maximas) if maximas else np.nan,
+            'minima': min(minimas) if minimas else np.nan
         }
+    
+    def somas_por(self, coluna):
+        # Rótulos ordenados como nos dicionários categóricos
+        return pd.concat([s.somas_por(coluna) for s in self.selecoes]).groupby(level=0).sum()
+    
+    def n_alunos(self):
+        return sum(s.n_alunos() for s in self.selecoes)
+    
+    def status_counts(self):
+        return sum(s.status_counts() for s in self.selecoes)
+    
+    def filial_status(self):
+        return pd.concat([s.filial_status() for s in self.selecoes]).groupby(level=0).sum()
+    
+    def histograma(self):
+        return sum(s.histograma() for s in self.selecoes)
+    
+    def alunos_por_faixa(self):
+        return sum(s.alunos_por_faixa() for s in self.selecoes)
+
+
+def _erro_contagem(erros):
+    """
+    Margens de contagens arredondadas para cima (inteiros)
+    """
+    return np.ceil(erros).astype(np.int64)
+
+
+def _aproximado(chart, erro):
+    """
+    Marca o gráfico como estimado, com a margem de cada valor de 'data'
+    """
+    chart['erro'] = erro
+    chart['aproximado'] = True
+    return chart
+
 
+class _SelecaoCubo(_Selecao):
+    """
+    Seleção de células do cubo OLAP (nenhuma linha da tabela é lida)
+    """
+    
+    def __init__(self, engine, codigos, celulas):
+        super().__init__(engine)
+        self.cube = engine.cube
+        self.codigos = codigos
+        self.celulas = celulas
+    
+    @cached_property
+    def alunos(self):
+        return self.cube.distinct_students(self.codigos, self.celulas)
+    
+    def totais(self):
+        totais = self.cube.totals(self.celulas)
+        return {
+            'n_linhas': totais['n_linhas'],
+            'soma': totais['soma'],
+            'n_notas': totais['n_notas'],
+            'media': totais['soma'] / totais['n_notas'] if totais['n_notas'] else np.nan,
+            'maxima': totais['maximo'],
+            'minima': totais['minimo']
+        }
+    
+    def somas_por(self, coluna):
+        soma, n_notas, n_linhas = self.cube.group(self.celulas, coluna)
+        return _somas_presentes(self.engine.df[coluna].cat.categories, n_linhas, soma, n_notas)
+    
+    def histograma(self):
+        return self.cube.histogram(self.celulas)
+    
+    def alunos_por_faixa(self):
+        return self.cube.distinct_students_by(self.codigos, 'faixa', self.celulas)
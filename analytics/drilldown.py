@@ -0,0 +1,132 @@
+"""
+Detalhamento abaixo dos agregados: notas de um aluno e lista de alunos de uma turma
+Os alunos de cada série/turma ficam em um trecho contíguo de um vetor
+ordenado por (turma, chave de ordenação, id_matricula), com os offsets de
+cada turma: o total é a largura do trecho e uma página é uma busca binária
+dentro dele a partir do cursor (paginação por chave, sem OFFSET) seguida de
+uma fatia de até limit alunos.
+"""
+import base64
+import binascii
+import json
+import math
+
+import numpy as np
+
+
+# Chaves de ordenação da lista de alunos (o desempate é sempre id_matricula)
+ORDENACOES = ('id_matricula', 'status', 'nota_ma', 'menor_mb')
+
+# Alunos por página: padrão e máximo
+LIMITE_PADRAO = 50
+LIMITE_MAXIMO = 500
+
+
+def options(sort=None, order=None, limit=None, cursor=None):
+    """
+    Opções normalizadas da lista (ordenação, decrescente, limite, cursor);
+    ValueError se inválidas
+    """
+    ordenacao = sort or 'id_matricula'
+    if ordenacao not in ORDENACOES:
+        raise ValueError(f"sort deve ser um de: {', '.join(ORDENACOES)}")
+    if order not in (None, '', 'asc', 'desc'):
+        raise ValueError("order deve ser 'asc' ou 'desc'")
+    limite = LIMITE_PADRAO if limit in (None, '') else int(limit)
+    if not 0 < limite <= LIMITE_MAXIMO:
+        raise ValueError(f'limit deve estar entre 1 e {LIMITE_MAXIMO}')
+    return ordenacao, order == 'desc', limite, decode_cursor(cursor) if cursor else None
+
+
+def sort_key(aluno, ordenacao, status_aluno):
+    """
+    Chave (valor, id_matricula) de um aluno da lista; valores ausentes vêm
+    por último na ordem crescente (infinito)
+    """
+    if ordenacao == 'id_matricula':
+        valor = 0.0
+    elif ordenacao == 'status':
+        valor = float(status_aluno.index(aluno['status'])) if aluno['status'] in status_aluno else math.inf
+    else:
+        valor = math.inf if aluno[ordenacao] is None else float(aluno[ordenacao])
+    return valor, aluno['id_matricula']
+
+
+def encode_cursor(chave):
+    """
+    Cursor opaco com a chave do último aluno da página
+    """
+    valor, id_matricula = chave
+    texto = json.dumps([None if math.isinf(valor) else valor, id_matricula])
+    return base64.urlsafe_b64encode(texto.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        valor, id_matricula = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return (math.inf if valor is None else float(valor)), str(id_matricula)
+    except (ValueError, TypeError, binascii.Error):
+        raise ValueError('cursor inválido')
+
+
+class RosterIndex:
+    """
+    Alunos (códigos da tabela de alunos) agrupados por série/turma e, dentro
+    de cada turma, ordenados por cada chave de ORDENACOES e pelo id
+
+    ids: id_matricula de cada aluno; turmas: código da série/turma de cada
+    aluno (-1 sem turma); valores: chave de ordenação -> valor de cada aluno
+    (infinito quando ausente).
+    """
+
+    def __init__(self, ids, turmas, n_turmas, valores):
+        ids = np.asarray(ids).astype(str)
+        # Posição de cada id na ordem lexicográfica (desempate e busca do cursor)
+        ordem_ids = np.argsort(ids, kind='stable')
+        self.ids_ordenados = ids[ordem_ids]
+        posicao_id = np.empty(len(ids), dtype=np.int64)
+        posicao_id[ordem_ids] = np.arange(len(ids))
+
+        contagens = np.bincount(turmas[turmas >= 0], minlength=n_turmas)
+        self.offsets = np.empty(n_turmas + 1, dtype=np.int64)
+        self.offsets[0] = np.count_nonzero(turmas < 0)  # alunos sem turma no início
+        np.cumsum(contagens, out=self.offsets[1:])
+        self.offsets[1:] += self.offsets[0]
+
+        self.ordens = {}
+        for ordenacao, valor in valores.items():
+            ordem = np.lexsort((posicao_id, valor, turmas)).astype(np.int32)
+            self.ordens[ordenacao] = (ordem, valor[ordem], posicao_id[ordem])
+
+    @property
+    def nbytes(self):
+        return self.offsets.nbytes + self.ids_ordenados.nbytes + sum(
+            sum(array.nbytes for array in arrays) for arrays in self.ordens.values()
+        )
+
+    def total(self, turma):
+        return int(self.offsets[turma + 1] - self.offsets[turma])
+
+    def page(self, turma, ordenacao, decrescente=False, depois=None, limite=LIMITE_PADRAO):
+        """
+        Códigos e valores da chave dos até limite alunos da turma que vêm
+        depois da chave depois (valor, id_matricula) na ordem pedida
+        """
+        inicio, fim = self.offsets[turma], self.offsets[turma + 1]
+        ordem, valores, posicoes = self.ordens[ordenacao]
+        if depois is None:
+            corte = fim if decrescente else inicio
+        else:
+            valor, id_matricula = depois
+            # Trecho com o mesmo valor do cursor e, dentro dele, o id (o id do
+            # cursor pode não existir mais: conta a posição de inserção)
+            baixo = inicio + np.searchsorted(valores[inicio:fim], valor, side='left')
+            alto = inicio + np.searchsorted(valores[inicio:fim], valor, side='right')
+            lado = 'left' if decrescente else 'right'
+            posicao = np.searchsorted(self.ids_ordenados, id_matricula, side=lado)
+            corte = baixo + np.searchsorted(posicoes[baixo:alto], posicao, side='left')
+        if decrescente:
+            trecho = slice(max(inicio, corte - limite), corte)
+            return ordem[trecho][::-1], valores[trecho][::-1]
+        trecho = slice(corte, min(fim, corte + limite))
+        return ordem[trecho], valores[trecho]
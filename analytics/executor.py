@@ -0,0 +1,75 @@
+"""
+Executor limitado para o trabalho com pandas das views assíncronas
+O processamento roda em um pool de threads de tamanho fixo, fora do event
+loop; quando todas as vagas (execução + fila) estão ocupadas a tarefa é
+recusada em vez de esperar sem limite
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Saturated(Exception):
+    """
+    Todas as vagas do executor estão ocupadas
+    """
+
+
+class BoundedExecutor:
+    """
+    Pool de threads com no máximo max_workers tarefas em execução e
+    max_pending aguardando
+    """
+
+    def __init__(self, max_workers=4, max_pending=0):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='analytics')
+        self._vagas = threading.BoundedSemaphore(max_workers + max_pending)
+        self._lock = threading.Lock()
+        self.active = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def submit(self, fn, *args):
+        """
+        Agenda fn(*args) e retorna o Future; Saturated se não houver vaga
+
+        A vaga só é liberada quando a tarefa termina, mesmo que quem esperava
+        o resultado tenha desistido (cliente desconectado).
+        """
+        if not self._vagas.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise Saturated()
+        with self._lock:
+            self.active += 1
+        try:
+            futuro = self._pool.submit(fn, *args)
+        except BaseException:
+            self._liberar(None)
+            raise
+        futuro.add_done_callback(self._liberar)
+        return futuro
+
+    def _liberar(self, _futuro):
+        with self._lock:
+            self.active -= 1
+            self.completed += 1
+        self._vagas.release()
+
+    async def run(self, fn, *args):
+        """
+        Executa fn(*args) no pool sem bloquear o event loop
+        """
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_workers': self.max_workers,
+                'max_pending': self.max_pending,
+                'active': self.active,
+                'completed': self.completed,
+                'rejected': self.rejected
+            }
@@ -0,0 +1,56 @@
+"""
+Exportação das linhas filtradas em CSV ou NDJSON
+Os lotes de linhas são codificados um a um (opcionalmente com gzip), então a
+memória usada não depende do tamanho do resultado
+"""
+import zlib
+
+import numpy as np
+
+
+# Formato -> (Content-Type, extensão do arquivo)
+FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'ndjson': ('application/x-ndjson; charset=utf-8', 'ndjson')
+}
+
+
+def encode_batches(batches, formato, colunas):
+    """
+    Bytes do arquivo exportado, um bloco por lote de linhas (o CSV começa
+    pelo cabeçalho, mesmo sem linhas)
+    """
+    if formato == 'csv':
+        yield (','.join(colunas) + '\n').encode('utf-8')
+        for lote in batches:
+            yield lote.to_csv(index=False, header=False, lineterminator='\n').encode('utf-8')
+    elif formato == 'ndjson':
+        for lote in batches:
+            texto = _float32_como_decimal(lote).to_json(orient='records', lines=True, force_ascii=False)
+            if texto:
+                yield (texto if texto.endswith('\n') else texto + '\n').encode('utf-8')
+    else:
+        raise ValueError(f'Formato de exportação não suportado: {formato}')
+
+
+def _float32_como_decimal(lote):
+    """
+    Colunas float32 convertidas para float64 pela representação decimal mais
+    curta (7.2 e não 7.1999998093 no JSON)
+    """
+    colunas = [c for c in lote.columns if lote[c].dtype == np.float32]
+    if not colunas:
+        return lote
+    return lote.assign(**{c: lote[c].to_numpy().astype(str).astype(np.float64) for c in colunas})
+
+
+def gzip_chunks(chunks, level=6):
+    """
+    Comprime os blocos em um único stream gzip, sem acumular o arquivo
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        comprimido = compressor.compress(chunk)
+        if comprimido:
+            yield comprimido
+    yield compressor.flush()
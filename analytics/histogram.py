@@ -0,0 +1,94 @@
+"""
+Histogramas de notas em classes finas de 0,1 ponto, combináveis
+A nota v cai na classe k = ceil(10 v), ou seja (k - 1) / 10 < v <= k / 10
+(a classe 0 é v = 0): os mesmos intervalos fechados à direita do pd.cut com
+include_lowest. Histogramas de grupos diferentes são somados (bincount) e
+reagrupados em faixas de qualquer largura múltipla de 0,1; os percentis saem
+da soma acumulada, exatos para notas com uma casa decimal.
+"""
+import math
+
+import numpy as np
+
+
+# Classes por ponto de nota e quantidade de classes em [0, 10]
+RESOLUCAO = 10
+N_CLASSES = 10 * RESOLUCAO + 1
+
+# Tolerância do arredondamento de float32 (6.3 é guardado como 6.3000002)
+EPS = 1e-4
+
+# Gráfico distribuicao_notas sem opções: faixas de 2 pontos, mediana e p90
+LARGURA_PADRAO = 2.0
+PERCENTIS_PADRAO = (50.0, 90.0)
+
+
+def fine_bins(notas):
+    """
+    Classe fina de cada nota (-1 para ausentes ou negativas; acima de 10 vai
+    para a última classe)
+    """
+    notas = np.asarray(notas, dtype=np.float64)
+    with np.errstate(invalid='ignore'):
+        classes = np.ceil(notas * RESOLUCAO - EPS)
+        fora = ~(notas >= 0)
+    classes = np.clip(np.nan_to_num(classes), 0, N_CLASSES - 1).astype(np.int8)
+    classes[fora] = -1
+    return classes
+
+
+def counts(classes):
+    """
+    Histograma fino das classes válidas
+    """
+    return np.bincount(classes[classes >= 0], minlength=N_CLASSES)
+
+
+def options(bin_width=None, percentiles=None):
+    """
+    Opções normalizadas do gráfico (largura, percentis); ValueError se inválidas
+    """
+    largura = LARGURA_PADRAO if bin_width in (None, '') else float(bin_width)
+    passo = round(largura * RESOLUCAO)
+    if not 0 < largura <= 10 or abs(passo - largura * RESOLUCAO) > 1e-6:
+        raise ValueError('bin_width deve ser múltiplo de 0.1 entre 0.1 e 10')
+    if percentiles in (None, ''):
+        percentis = PERCENTIS_PADRAO
+    else:
+        if isinstance(percentiles, str):
+            percentiles = percentiles.split(',')
+        percentis = tuple(sorted({float(q) for q in percentiles}))
+        if not percentis or not all(0 <= q <= 100 for q in percentis):
+            raise ValueError('percentiles deve listar valores entre 0 e 100')
+    return passo / RESOLUCAO, percentis
+
+
+def coarsen(histograma, largura):
+    """
+    Rótulos e contagens das faixas de largura pontos (fechadas à direita; a
+    primeira inclui o 0)
+    """
+    passo = round(largura * RESOLUCAO)
+    n_faixas = math.ceil((N_CLASSES - 1) / passo)
+    faixa = np.maximum(np.ceil(np.arange(N_CLASSES) / passo).astype(np.int64) - 1, 0)
+    contagens = np.bincount(faixa, weights=histograma, minlength=n_faixas)
+    if np.issubdtype(np.asarray(histograma).dtype, np.integer):
+        contagens = contagens.astype(np.int64)
+    limites = [min(i * passo, N_CLASSES - 1) / RESOLUCAO for i in range(n_faixas + 1)]
+    rotulos = [f'{limites[i]:g}-{limites[i + 1]:g}' for i in range(n_faixas)]
+    return rotulos, contagens
+
+
+def percentiles(histograma, percentis):
+    """
+    Percentis (inverso da distribuição acumulada, como numpy com
+    method='inverted_cdf') pelo limite superior da classe; NaN sem notas
+    """
+    acumulado = np.cumsum(histograma)
+    total = acumulado[-1]
+    if total <= 0:
+        return np.full(len(percentis), np.nan)
+    # Primeira classe com acumulado >= q% do total (folga para pesos não inteiros)
+    alvos = np.maximum(np.asarray(percentis, dtype=np.float64) / 100 * total * (1 - 1e-9), np.finfo(float).tiny)
+    classes = np.minimum(np.searchsorted(acumulado, alvos, side='left'), N_CLASSES - 1)
+    return classes / RESOLUCAO
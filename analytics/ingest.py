@@ -0,0 +1,142 @@
+"""
+Leitura do CSV de notas por intervalos de bytes
+O arquivo cresce por append durante o ano letivo: guardando até onde ele já
+foi lido, uma recarga processa apenas as linhas novas
+"""
+import hashlib
+import os
+
+import pandas as pd
+
+
+# Tamanho dos blocos lidos ao procurar o fim da última linha completa
+BLOCK_SIZE = 64 * 1024
+
+# Tamanho mínimo de cada intervalo na leitura paralela (arquivos menores
+# que isso não compensam o custo de iniciar os processos)
+MIN_RANGE_BYTES = 32 * 1024 * 1024
+
+
+class _RangeReader:
+    """
+    Arquivo somente leitura com o intervalo [start, end) do CSV, precedido
+    pela linha de cabeçalho quando o intervalo não começa no início
+    """
+
+    def __init__(self, path, start, end, header=b''):
+        self._file = open(path, 'rb')
+        self._file.seek(start)
+        self._header = header
+        self._restante = end - start
+
+    def read(self, size=-1):
+        if self._header:
+            bloco, self._header = self._header, b''
+            return bloco
+        if size is None or size < 0 or size > self._restante:
+            size = self._restante
+        bloco = self._file.read(size)
+        self._restante -= len(bloco)
+        return bloco
+
+    def close(self):
+        self._file.close()
+
+
+def read_header(path):
+    """
+    Linha de cabeçalho do CSV (com o '\\n')
+    """
+    with open(path, 'rb') as f:
+        return f.readline()
+
+
+def complete_rows_end(path, start, end):
+    """
+    Posição logo após o último '\\n' em [start, end): linhas ainda sendo
+    gravadas (sem quebra de linha) ficam para a próxima leitura
+    """
+    with open(path, 'rb') as f:
+        fim = end
+        while fim > start:
+            inicio = max(start, fim - BLOCK_SIZE)
+            f.seek(inicio)
+            posicao = f.read(fim - inicio).rfind(b'\n')
+            if posicao >= 0:
+                return inicio + posicao + 1
+            fim = inicio
+    return start
+
+
+def split_ranges(path, size, partes):
+    """
+    Divide os bytes [0, size) em até partes intervalos de tamanho parecido,
+    cada um começando no início de uma linha (o primeiro contém o cabeçalho)
+
+    Supõe que os campos não contêm quebras de linha (não há aspas com '\\n'
+    no arquivo de notas).
+    """
+    partes = max(1, min(partes, size // MIN_RANGE_BYTES))
+    limites = [0]
+    with open(path, 'rb') as f:
+        for i in range(1, partes):
+            f.seek(size * i // partes)
+            f.readline()  # avança até o início da próxima linha
+            posicao = f.tell()
+            if limites[-1] < posicao < size:
+                limites.append(posicao)
+    limites.append(size)
+    return list(zip(limites[:-1], limites[1:]))
+
+
+def content_digest(path, start=0, end=None, digest=None, chunk_size=4 * 1024 * 1024):
+    """
+    Hash BLAKE2b (o mesmo de snapshot.content_hash) dos bytes [start, end),
+    lido em blocos; com digest (hash dos bytes anteriores a start) continua
+    o hash dele, então só o trecho novo é lido
+    """
+    digest = digest.copy() if digest is not None else hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        f.seek(start)
+        restante = None if end is None else end - start
+        while restante is None or restante > 0:
+            bloco = f.read(chunk_size if restante is None else min(chunk_size, restante))
+            if not bloco:
+                break
+            digest.update(bloco)
+            if restante is not None:
+                restante -= len(bloco)
+    return digest
+
+
+def range_version(offset, digest):
+    """
+    Identifica o conteúdo lido (tamanho e hash de todos os bytes [0, offset)),
+    igual em todos os processos que leram o mesmo conteúdo
+    """
+    return f'{offset:x}-{digest[:16]}'
+
+
+def read_csv_range(path, start, end, **kwargs):
+    """
+    pd.read_csv apenas sobre os bytes [start, end) do arquivo
+    """
+    header = read_header(path) if start > 0 else b''
+    leitor = _RangeReader(path, start, end, header)
+    try:
+        return pd.read_csv(leitor, **kwargs)
+    finally:
+        leitor.close()
+
+
+def read_csv_chunks(path, start, end, chunksize, **kwargs):
+    """
+    pd.read_csv em blocos de chunksize linhas sobre os bytes [start, end)
+    """
+    header = read_header(path) if start > 0 else b''
+    leitor = _RangeReader(path, start, end, header)
+    try:
+        with pd.read_csv(leitor, chunksize=chunksize, **kwargs) as blocos:
+            yield from blocos
+    finally:
+        leitor.close()
@@ -0,0 +1,112 @@
+"""
+Comando de gerenciamento: benchmark em várias escalas com dados sintéticos
+Uso: python manage.py benchmark [--rows 500000 5000000 50000000]
+                                [--output resultados.json] [--compare anterior.json [--tolerance 0.10]]
+
+Cada escala roda em um processo separado, para que o pico de memória medido
+seja só o daquela escala. Os CSVs gerados são reaproveitados (o gerador é
+determinístico).
+"""
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from analytics import benchmark, synthetic
+
+
+ESCALAS = [500_000, 5_000_000, 50_000_000]
+
+
+class Command(BaseCommand):
+    help = 'Mede carga, status, filtros, agregações e memória em CSVs sintéticos de várias escalas'
+
+    # As verificações do Django importam as views, que carregariam o CSV
+    # configurado e somariam essa memória ao pico medido
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=ESCALAS, help='Quantidade de linhas de cada escala')
+        parser.add_argument('--repeat', type=int, default=3, help='Repetições de cada medição (mediana)')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--data-dir', default=os.path.join(tempfile.gettempdir(), 'analytics-benchmark'),
+            help='Diretório dos CSVs sintéticos'
+        )
+        parser.add_argument('--output', help='Arquivo JSON de saída (padrão: stdout)')
+        parser.add_argument('--compare', help='Resultado anterior (JSON): lista as métricas que pioraram')
+        parser.add_argument('--tolerance', type=float, default=0.10, help='Piora relativa tolerada no --compare (0.10 = 10%%)')
+        parser.add_argument('--single', help='Uso interno: executa uma escala sobre este CSV e imprime o JSON')
+
+    def handle(self, *args, **options):
+        if options['single']:
+            resultado = benchmark.run_benchmark(options['single'], options['repeat'])
+            self.stdout.write(json.dumps(resultado))
+            return
+
+        os.makedirs(options['data_dir'], exist_ok=True)
+        escalas = []
+        for n_linhas in options['rows']:
+            caminho = os.path.join(options['data_dir'], f"notas-{n_linhas}-{options['seed']}.csv")
+            geracao = None
+            if not os.path.exists(caminho):
+                inicio = time.perf_counter()
+                synthetic.generate_csv(caminho + '.tmp', n_linhas, seed=options['seed'])
+                os.replace(caminho + '.tmp', caminho)
+                geracao = round(time.perf_counter() - inicio, 3)
+
+            self.stderr.write(f'Escala {n_linhas:,} linhas...')
+            processo = subprocess.run(
+                [sys.executable, '-m', 'django', 'benchmark', '--single', caminho, '--repeat', str(options['repeat'])],
+                cwd=settings.BASE_DIR, capture_output=True, text=True,
+                env={**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'bigdata_project.settings')}
+            )
+            if processo.returncode != 0:
+                raise CommandError(f'Falha na escala {n_linhas}: {processo.stderr.strip()[-2000:]}')
+            resultado = json.loads(processo.stdout.strip().splitlines()[-1])
+            escalas.append({'target_rows': n_linhas, 'seed': options['seed'], 'generate_s': geracao, **resultado})
+
+        saida = {'meta': self._meta(), 'scales': escalas}
+        texto = json.dumps(saida, indent=2, ensure_ascii=False)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(texto + '\n')
+        else:
+            self.stdout.write(texto)
+
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as f:
+                pioras = benchmark.compare(json.load(f), saida, options['tolerance'])
+            for escala, metrica, antes, depois in pioras:
+                self.stderr.write(self.style.WARNING(
+                    f'{escala:,} linhas: {metrica} {antes} -> {depois} ({depois / antes - 1:+.0%})'
+                ))
+            if not pioras:
+                self.stderr.write(self.style.SUCCESS(f"Nenhuma métrica piorou mais de {options['tolerance']:.0%}"))
+
+    @staticmethod
+    def _meta():
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            'commit': commit,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count()
+        }
@@ -0,0 +1,31 @@
+"""
+Comando de gerenciamento: gera o snapshot binário antes do deploy
+Uso: python manage.py build_snapshot [--force]
+"""
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from analytics.data_processor import BigDataAnalytics
+
+
+class Command(BaseCommand):
+    help = 'Processa o CSV de notas e grava o snapshot colunar usado na inicialização'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Regrava mesmo se o snapshot estiver atualizado')
+
+    def handle(self, *args, **options):
+        if not getattr(settings, 'ANALYTICS_SNAPSHOT_DIR', None):
+            raise CommandError('ANALYTICS_SNAPSHOT_DIR não está configurado')
+
+        inicio = time.perf_counter()
+        manifest = BigDataAnalytics(load=False).build_snapshot(force=options['force'])
+        if manifest is None:
+            raise CommandError('Não foi possível gerar o snapshot')
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Snapshot pronto: {manifest['rows']:,} registros, "
+            f"{len(manifest['columns'])} colunas ({time.perf_counter() - inicio:.2f}s)"
+        ))
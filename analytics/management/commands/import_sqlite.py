@@ -0,0 +1,35 @@
+"""
+Comando de gerenciamento: importa o CSV de notas para o banco SQLite
+Uso: python manage.py import_sqlite [--force]
+"""
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from analytics import sqlstore
+
+
+class Command(BaseCommand):
+    help = 'Importa o CSV de notas para o banco SQLite usado com ANALYTICS_SQLITE_PATH'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Reimporta mesmo se o banco estiver atualizado')
+
+    def handle(self, *args, **options):
+        caminho = getattr(settings, 'ANALYTICS_SQLITE_PATH', None)
+        if not caminho:
+            raise CommandError('ANALYTICS_SQLITE_PATH não está configurado')
+
+        inicio = time.perf_counter()
+        meta, _ = sqlstore.ensure_imported(
+            settings.CSV_DATA_PATH, caminho, getattr(settings, 'ANALYTICS_STREAMING_CHUNK_ROWS', 500_000),
+            force=options['force']
+        )
+        if meta is None:
+            raise CommandError('Não foi possível importar o CSV')
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Banco pronto: {int(meta['rows']):,} registros, {int(meta['students']):,} alunos "
+            f"({time.perf_counter() - inicio:.2f}s)"
+        ))
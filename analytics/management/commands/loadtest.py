@@ -0,0 +1,94 @@
+"""
+Comando de gerenciamento: teste de carga das views assíncronas
+Uso: python manage.py loadtest [--users 16] [--requests 20] [--workers 1 4]
+
+Simula usuários simultâneos do dashboard (página inicial e depois consultas
+em lote com filtros aleatórios) contra a aplicação, no próprio processo, e
+compara a vazão para cada tamanho do executor. Com 1 thread o comportamento
+equivale ao das views síncronas sob ASGI, executadas uma por vez.
+"""
+import asyncio
+import json
+import random
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient
+from django.urls import reverse
+
+from analytics import views
+from analytics.executor import BoundedExecutor
+
+
+class Command(BaseCommand):
+    help = 'Mede vazão e latência do dashboard com usuários simultâneos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=16, help='Usuários simultâneos')
+        parser.add_argument('--requests', type=int, default=20, help='Consultas por usuário')
+        parser.add_argument('--workers', type=int, nargs='+', default=[1, 4], help='Tamanhos do executor comparados')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        engine = views._engine()
+        valores = engine.get_unique_values()
+        opcoes = {
+            'id_filial': valores['filiais'],
+            'serie_turma': valores['series_turmas'],
+            'nome_disciplina': valores['disciplinas'],
+            'tipo_nota_aval': valores['tipos_nota']
+        }
+
+        for workers in options['workers']:
+            # Mesmas consultas em cada rodada, com o cache de resultados vazio
+            engine.query_cache.clear()
+            rng = random.Random(options['seed'])
+            consultas = [
+                [self._filtros(rng, opcoes) for _ in range(options['requests'])]
+                for _ in range(options['users'])
+            ]
+            anterior = views._executor
+            views._executor = BoundedExecutor(max_workers=workers, max_pending=options['users'])
+            try:
+                resultado = asyncio.run(self._rodada(consultas))
+            finally:
+                views._executor = anterior
+
+            latencias = np.array(resultado['latencias']) * 1000
+            self.stdout.write(
+                f"executor={workers:<3} requisições={len(latencias)} "
+                f"vazão={len(latencias) / resultado['duracao']:.1f} req/s "
+                f"p50={np.percentile(latencias, 50):.1f}ms p95={np.percentile(latencias, 95):.1f}ms "
+                f"503={resultado['recusadas']}"
+            )
+
+    @staticmethod
+    def _filtros(rng, opcoes):
+        filtros = {
+            coluna: rng.choice(valores)
+            for coluna, valores in opcoes.items()
+            if valores and rng.random() < 0.4
+        }
+        return json.dumps(filtros)
+
+    async def _rodada(self, consultas):
+        latencias = []
+        recusadas = 0
+
+        async def usuario(corpos):
+            nonlocal recusadas
+            client = AsyncClient()
+            for url, corpo in [(reverse('analytics:dashboard'), None)] + [
+                    (reverse('analytics:chart_data_batch'), corpo) for corpo in corpos]:
+                inicio = time.perf_counter()
+                if corpo is None:
+                    response = await client.get(url)
+                else:
+                    response = await client.post(url, corpo, content_type='application/json')
+                latencias.append(time.perf_counter() - inicio)
+                recusadas += response.status_code == 503
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*(usuario(corpos) for corpos in consultas))
+        return {'latencias': latencias, 'recusadas': recusadas, 'duracao': time.perf_counter() - inicio}
@@ -0,0 +1,40 @@
+"""
+Comando de gerenciamento: relatório de memória do armazenamento compacto
+Uso: python manage.py memory_report
+"""
+import json
+
+from django.core.management.base import BaseCommand
+
+from analytics.data_processor import BigDataAnalytics
+
+
+class Command(BaseCommand):
+    help = 'Compara bytes por registro entre o formato original (strings) e o compacto (códigos)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true', help='Imprime o relatório em JSON')
+
+    def handle(self, *args, **options):
+        report = BigDataAnalytics().memory_report()
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2, ensure_ascii=False))
+            return
+
+        if not report['total_registros']:
+            self.stdout.write(self.style.WARNING('Nenhum dado carregado'))
+            return
+
+        self.stdout.write(f"Registros: {report['total_registros']:,}")
+        self.stdout.write(f"{'Coluna':<18}{'dtype':<14}{'Original (MB)':>15}{'Compacto (MB)':>15}")
+        for coluna, info in report['colunas'].items():
+            self.stdout.write(
+                f"{coluna:<18}{info['dtype']:<14}"
+                f"{info['bytes_original'] / 1e6:>15.2f}{info['bytes_compacto'] / 1e6:>15.2f}"
+            )
+        self.stdout.write(
+            f"Bytes por registro: {report['bytes_por_registro_original']} -> "
+            f"{report['bytes_por_registro_compacto']} "
+            f"(redução de {report['reducao']:.1%})"
+        )
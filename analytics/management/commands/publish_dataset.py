@@ -0,0 +1,57 @@
+"""
+Comando de gerenciamento: processo carregador do modo compartilhado
+Uso: python manage.py publish_dataset [--watch] [--interval SEGUNDOS]
+"""
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from analytics.data_processor import BigDataAnalytics
+
+
+class Command(BaseCommand):
+    help = (
+        'Carrega o CSV de notas e publica tabela, alunos e índices no snapshot, '
+        'anexados pelos workers com ANALYTICS_SHARED_DATASET'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--watch', action='store_true', help='Continua executando e publica cada nova versão do CSV')
+        parser.add_argument(
+            '--interval', type=float, default=getattr(settings, 'ANALYTICS_RELOAD_INTERVAL', 5) or 5,
+            help='Segundos entre verificações do CSV no modo --watch'
+        )
+
+    def handle(self, *args, **options):
+        if not getattr(settings, 'ANALYTICS_SNAPSHOT_DIR', None):
+            raise CommandError('ANALYTICS_SNAPSHOT_DIR não está configurado')
+        if getattr(settings, 'ANALYTICS_STREAMING_MODE', False):
+            raise CommandError('O modo em fluxo não guarda as linhas e não pode ser publicado')
+
+        # O carregador lê o CSV (nunca anexa a si mesmo)
+        inicio = time.perf_counter()
+        engine = BigDataAnalytics(load=False)
+        engine.shared_dataset = False
+        engine._load_data()
+        self._publicar(engine, inicio)
+        if not options['watch']:
+            return
+
+        engine.reload_interval = 0
+        while True:
+            time.sleep(options['interval'])
+            inicio = time.perf_counter()
+            novo = engine.refresh()
+            if novo is not engine:
+                engine = novo
+                self._publicar(engine, inicio)
+
+    def _publicar(self, engine, inicio):
+        manifest = engine.publish()
+        if manifest is None:
+            raise CommandError('Não foi possível publicar o dataset')
+        self.stdout.write(self.style.SUCCESS(
+            f"Versão {manifest['version']} publicada: {manifest['rows']:,} registros "
+            f"({time.perf_counter() - inicio:.2f}s)"
+        ))
@@ -0,0 +1,264 @@
+"""
+Métricas de desempenho do processador e das views
+Tempo de cada etapa (filtro, agregação, estatísticas), histogramas de
+latência por endpoint e contadores, expostos no formato texto do Prometheus
+"""
+import bisect
+import contextvars
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+
+# Limites superiores (segundos) dos buckets dos histogramas de latência
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Descrição de cada métrica (linha # HELP)
+HELP = {
+    'analytics_request_duration_seconds': 'Tempo de processamento das requisições por endpoint e tipo de gráfico',
+    'analytics_stage_duration_seconds': 'Tempo das etapas das consultas (filter, aggregate, stats)',
+    'analytics_rows_scanned_total': 'Linhas da tabela de notas selecionadas pelas consultas',
+    'analytics_cube_cells_scanned_total': 'Células do cubo lidas pelas consultas',
+    'analytics_load_duration_seconds': 'Tempo de cada etapa da última carga do dataset',
+    'analytics_loads_total': 'Cargas do dataset',
+    'analytics_load_errors_total': 'Cargas do dataset que falharam',
+    'analytics_dataset_info': 'Versão do dataset carregado (rótulo version)',
+    'analytics_dataset_rows': 'Linhas da tabela de notas carregada',
+    'analytics_dataset_students': 'Alunos da tabela de alunos carregada',
+    'analytics_query_cache_entries': 'Entradas no cache de resultados',
+    'analytics_query_cache_hits_total': 'Acertos do cache de resultados',
+    'analytics_query_cache_misses_total': 'Falhas do cache de resultados',
+    'analytics_query_cache_evictions_total': 'Remoções do cache de resultados',
+    'analytics_query_coalesced_total': 'Consultas que esperaram o cálculo de uma consulta igual em andamento',
+    'analytics_executor_active': 'Tarefas em execução ou na fila do executor',
+    'analytics_executor_completed_total': 'Tarefas concluídas pelo executor',
+    'analytics_executor_rejected_total': 'Requisições recusadas com 503 (executor cheio)',
+    'analytics_partitions': 'Partições do dataset particionado',
+    'analytics_partitions_loaded': 'Partições carregadas em memória',
+    'analytics_partition_memory_bytes': 'Memória estimada das partições carregadas',
+    'analytics_partition_loads_total': 'Cargas de partições (primeiro acesso ou após remoção)',
+    'analytics_partition_evictions_total': 'Partições removidas da memória pelo orçamento',
+    'analytics_parallel_queries_total': 'Consultas agregadas em paralelo pelo pool de processos',
+}
+
+# Ordem das etapas no cabeçalho Server-Timing
+ETAPAS_CONSULTA = ('filter', 'aggregate', 'stats')
+
+
+class Histogram:
+    """
+    Contagens por bucket (não cumulativas), soma e total de observações
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, valor):
+        self.counts[bisect.bisect_left(self.buckets, valor)] += 1
+        self.sum += valor
+        self.count += 1
+
+
+class Registry:
+    """
+    Histogramas e contadores do processo, identificados por nome e rótulos
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+
+    def observe(self, nome, valor, **labels):
+        chave = (nome, tuple(sorted(labels.items())))
+        with self._lock:
+            histograma = self._histograms.get(chave)
+            if histograma is None:
+                histograma = self._histograms[chave] = Histogram()
+            histograma.observe(valor)
+
+    def inc(self, nome, valor=1, **labels):
+        chave = (nome, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[chave] = self._counters.get(chave, 0) + valor
+
+    def counter(self, nome, **labels):
+        with self._lock:
+            return self._counters.get((nome, tuple(sorted(labels.items()))), 0)
+
+    def histogram(self, nome, **labels):
+        """
+        Cópia (count, sum) de um histograma, ou None se não houve observações
+        """
+        with self._lock:
+            histograma = self._histograms.get((nome, tuple(sorted(labels.items()))))
+            return None if histograma is None else (histograma.count, histograma.sum)
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def render(self, extras=()):
+        """
+        Texto no formato de exposição do Prometheus (versão 0.0.4)
+
+        extras: métricas calculadas na hora, como (nome, tipo, [(labels, valor)])
+        """
+        with self._lock:
+            histogramas = sorted(
+                (nome, labels, h.buckets, list(h.counts), h.sum, h.count)
+                for (nome, labels), h in self._histograms.items()
+            )
+            contadores = sorted(self._counters.items())
+
+        linhas = []
+        vistos = set()
+
+        def cabecalho(nome, tipo):
+            if nome not in vistos:
+                vistos.add(nome)
+                if nome in HELP:
+                    linhas.append(f'# HELP {nome} {HELP[nome]}')
+                linhas.append(f'# TYPE {nome} {tipo}')
+
+        for nome, labels, buckets, counts, soma, total in histogramas:
+            cabecalho(nome, 'histogram')
+            acumulado = 0
+            for limite, n in zip([_valor(b) for b in buckets] + ['+Inf'], counts):
+                acumulado += n
+                linhas.append(f'{nome}_bucket{_labels(labels + (("le", limite),))} {acumulado}')
+            linhas.append(f'{nome}_sum{_labels(labels)} {_valor(soma)}')
+            linhas.append(f'{nome}_count{_labels(labels)} {total}')
+
+        for (nome, labels), valor in contadores:
+            cabecalho(nome, 'counter')
+            linhas.append(f'{nome}{_labels(labels)} {_valor(valor)}')
+
+        for nome, tipo, amostras in extras:
+            cabecalho(nome, tipo)
+            for labels, valor in amostras:
+                linhas.append(f'{nome}{_labels(tuple(sorted(labels.items())))} {_valor(valor)}')
+
+        return '\n'.join(linhas) + '\n'
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    pares = ','.join(f'{nome}="{_escapar(valor)}"' for nome, valor in labels)
+    return '{' + pares + '}'
+
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _valor(valor):
+    if isinstance(valor, float):
+        if math.isnan(valor):
+            return 'NaN'
+        if math.isinf(valor):
+            return '+Inf' if valor > 0 else '-Inf'
+        return repr(valor)
+    return str(valor)
+
+
+# Registro global do processo (cada worker do servidor expõe o seu)
+REGISTRY = Registry()
+
+
+class RequestTimings:
+    """
+    Tempos das etapas e linhas lidas durante uma requisição
+    """
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.stages = {}
+        self.rows = 0
+        self.labels = {}
+
+    def elapsed(self):
+        return time.perf_counter() - self.inicio
+
+    def server_timing(self):
+        """
+        Valor do cabeçalho Server-Timing (durações em milissegundos)
+        """
+        partes = [
+            f'{etapa};dur={self.stages[etapa] * 1000:.3f}'
+            for etapa in ETAPAS_CONSULTA if etapa in self.stages
+        ]
+        partes.append(f'total;dur={self.elapsed() * 1000:.3f}')
+        return ', '.join(partes)
+
+
+# Coleta da requisição em andamento (o trabalho roda no thread do executor,
+# que define a variável antes de chamar o processador)
+_atual = contextvars.ContextVar('analytics_timings', default=None)
+
+
+@contextmanager
+def collect():
+    """
+    Coleta os tempos das etapas executadas dentro do bloco
+    """
+    timings = RequestTimings()
+    token = _atual.set(timings)
+    try:
+        yield timings
+    finally:
+        _atual.reset(token)
+
+
+def set_label(**labels):
+    """
+    Rótulos da requisição em andamento (por exemplo, chart_type)
+    """
+    timings = _atual.get()
+    if timings is not None:
+        timings.labels.update(labels)
+
+
+@contextmanager
+def stage(nome):
+    """
+    Mede uma etapa de consulta: histograma do processo e, se houver, a coleta
+    da requisição em andamento
+    """
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        duracao = time.perf_counter() - inicio
+        REGISTRY.observe('analytics_stage_duration_seconds', duracao, stage=nome)
+        timings = _atual.get()
+        if timings is not None:
+            timings.stages[nome] = timings.stages.get(nome, 0.0) + duracao
+
+
+@contextmanager
+def timed(destino, nome):
+    """
+    Soma a duração do bloco em destino[nome] (tempos da carga)
+    """
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        destino[nome] = destino.get(nome, 0.0) + time.perf_counter() - inicio
+
+
+def add_rows(n, nome='analytics_rows_scanned_total'):
+    """
+    Contabiliza linhas (ou células do cubo) lidas por uma consulta
+    """
+    REGISTRY.inc(nome, n)
+    timings = _atual.get()
+    if timings is not None:
+        timings.rows += n
@@ -0,0 +1,578 @@
+"""
+Dataset particionado: um CSV por filial e/ou ano letivo
+Layout no estilo Hive, com os valores das chaves nos nomes dos diretórios:
+ANALYTICS_PARTITION_DIR/id_filial=1/ano=2024/notas.csv (qualquer subconjunto
+das chaves). Cada partição é um BigDataAnalytics carregado na primeira
+consulta que a usa e descartado (LRU) quando a memória das partições
+carregadas passa de ANALYTICS_PARTITION_MEMORY_MB. Filtros por id_filial ou
+ano descartam as partições de outras chaves sem carregá-las. O resumo de
+cada partição (matrículas, turmas, opções e contagens das facetas sem
+filtros), gravado junto do seu snapshot, responde as opções e as facetas que
+não dependem de outros filtros e leva o detalhamento de um aluno ou turma só
+às partições que os têm.
+"""
+import copy
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+
+from . import metrics
+from .cache import QueryCache
+from .data_processor import (
+    BigDataAnalytics, COLUNAS_FILTRO, _SelecaoParticoes, _SelecaoResumo, _cache_key, _evaluate_selecao
+)
+
+
+# Chaves reconhecidas nos nomes dos diretórios (ano não é coluna do CSV: é um
+# filtro que só seleciona partições)
+CHAVES_PARTICAO = ('id_filial', 'ano')
+
+# Filtros que entram na chave de cache (os do dashboard mais o ano)
+FILTROS_PARTICIONADO = COLUNAS_FILTRO + ['ano']
+
+
+class Partition:
+    """
+    Um CSV do dataset: nome (caminho relativo sem .csv), valores das chaves e
+    (tamanho, mtime) observados na descoberta
+    """
+
+    def __init__(self, nome, csv_path, chaves, stat):
+        self.nome = nome
+        self.csv_path = csv_path
+        self.chaves = chaves
+        self.stat = stat
+
+    def matches(self, filters):
+        """
+        A partição pode ter linhas que atendem aos filtros
+        """
+        return all(
+            not filters.get(chave) or str(filters[chave]) == valor
+            for chave, valor in self.chaves.items()
+        )
+
+
+def discover(raiz):
+    """
+    Partições (nome -> Partition) encontradas sob raiz, em ordem de nome
+    """
+    particoes = {}
+    for diretorio, subdiretorios, arquivos in os.walk(raiz):
+        subdiretorios.sort()
+        relativo = os.path.relpath(diretorio, raiz)
+        chaves = {}
+        for parte in ([] if relativo == os.curdir else relativo.split(os.sep)):
+            chave, igual, valor = parte.partition('=')
+            if igual and chave in CHAVES_PARTICAO:
+                chaves[chave] = valor
+        for arquivo in sorted(arquivos):
+            if not arquivo.endswith('.csv'):
+                continue
+            caminho = os.path.join(diretorio, arquivo)
+            stat = os.stat(caminho)
+            nome = os.path.normpath(os.path.join(relativo, arquivo[:-len('.csv')])).replace(os.sep, '/')
+            particoes[nome] = Partition(nome, caminho, chaves, (stat.st_size, stat.st_mtime_ns))
+    return particoes
+
+
+def partition_summary(engine, stat):
+    """
+    Resumo de uma partição carregada: (tamanho, mtime) do CSV, matrículas
+    (ordenadas) e séries/turmas dos seus alunos, quantidade de linhas, opções
+    dos filtros e facetas sem filtros
+    """
+    alunos = engine.students
+    vazia = alunos is None or alunos.empty
+    return {
+        'stat': stat,
+        'ids': np.array([], dtype=str) if vazia else np.sort(np.asarray(alunos['id_matricula'], dtype=str)),
+        'turmas': [] if vazia else sorted(alunos['serie_turma'].dropna().unique().tolist()),
+        'linhas': 0 if engine.df is None else len(engine.df),
+        'opcoes': engine.get_unique_values(),
+        'facetas': engine.get_facets({})
+    }
+
+
+def save_summary(resumo, caminho):
+    """
+    Grava o resumo (.npz) em caminho; os.replace é atômico
+    """
+    arrays = {
+        'stat': np.array(resumo['stat'], dtype=np.int64),
+        'ids': resumo['ids'],
+        'turmas': np.array(resumo['turmas'], dtype=str),
+        'linhas': np.array(resumo['linhas'], dtype=np.int64)
+    }
+    for chave, valores in resumo['opcoes'].items():
+        arrays[f'opcoes.{chave}'] = np.array(valores, dtype=str)
+    for coluna, faceta in resumo['facetas'].items():
+        arrays[f'facetas.{coluna}.valores'] = np.array(faceta['valores'], dtype=str)
+        arrays[f'facetas.{coluna}.total_registros'] = np.asarray(faceta['total_registros'], dtype=np.int64)
+        arrays[f'facetas.{coluna}.total_alunos'] = np.asarray(faceta['total_alunos'], dtype=np.int64)
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    fd, temporario = tempfile.mkstemp(dir=os.path.dirname(caminho), suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(temporario, caminho)
+
+
+def load_summary(caminho, stat):
+    """
+    Resumo gravado em caminho, ou None se não existe ou é de outra versão do CSV
+    """
+    try:
+        with np.load(caminho) as dados:
+            if tuple(int(v) for v in dados['stat']) != tuple(stat):
+                return None
+            resumo = {
+                'stat': tuple(stat), 'ids': dados['ids'], 'turmas': dados['turmas'].tolist(),
+                'linhas': int(dados['linhas']), 'opcoes': {}, 'facetas': {}
+            }
+            for chave in dados.files:
+                grupo, _, resto = chave.partition('.')
+                if grupo == 'opcoes':
+                    resumo['opcoes'][resto] = dados[chave].tolist()
+                elif grupo == 'facetas':
+                    coluna, _, campo = resto.partition('.')
+                    valor = dados[chave]
+                    resumo['facetas'].setdefault(coluna, {})[campo] = valor.tolist() if campo == 'valores' else valor
+            return resumo
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def summary_facet(resumo, coluna, filtros):
+    """
+    Faceta da coluna em uma partição calculada só com o resumo, ou None se
+    os filtros (os das outras colunas de filtro) exigem a partição carregada
+
+    Filtros que todas as linhas da partição atendem são ignorados; sobrando
+    nenhum, vale a faceta sem filtros; sobrando um só e a coluna tendo um
+    único valor em todas as linhas (id_filial de uma partição por filial),
+    as contagens são as do valor filtrado na faceta do filtro.
+    """
+    facetas = resumo['facetas']
+    if coluna not in facetas:
+        return None if resumo['linhas'] else _faceta_vazia()
+
+    def unico(nome):
+        # Valor que todas as linhas da partição têm na coluna (ou None)
+        faceta = facetas[nome]
+        if len(faceta['valores']) == 1 and faceta['total_registros'][0] == resumo['linhas']:
+            return faceta['valores'][0]
+        return None
+
+    restantes = {c: str(v) for c, v in filtros.items() if unico(c) != str(v)}
+    for c, v in restantes.items():
+        if v not in facetas[c]['valores']:
+            return _faceta_vazia()
+    if not restantes:
+        return facetas[coluna]
+    if len(restantes) > 1 or unico(coluna) is None:
+        return None
+    (c, v), = restantes.items()
+    posicao = facetas[c]['valores'].index(v)
+    return {
+        'valores': [unico(coluna)],
+        'total_registros': facetas[c]['total_registros'][posicao:posicao + 1],
+        'total_alunos': facetas[c]['total_alunos'][posicao:posicao + 1]
+    }
+
+
+def _faceta_vazia():
+    return {'valores': [], 'total_registros': np.zeros(0, dtype=np.int64), 'total_alunos': np.zeros(0, dtype=np.int64)}
+
+
+def merge_ids(nomes, resumos):
+    """
+    Matrículas das partições (ordenadas) e o índice da partição de cada uma
+
+    Alunos e status são somados entre partições, então uma matrícula em mais
+    de uma partição (transferência, partições por ano com as mesmas
+    matrículas) seria contada duas vezes: ValueError com a matrícula e as
+    partições.
+    """
+    if not resumos:
+        return np.array([], dtype=str), np.array([], dtype=np.int64)
+    ids = np.concatenate([r['ids'] for r in resumos])
+    donos = np.repeat(np.arange(len(resumos)), [len(r['ids']) for r in resumos])
+    ordem = np.argsort(ids, kind='stable')
+    ids, donos = ids[ordem], donos[ordem]
+    repetidas = np.flatnonzero(ids[1:] == ids[:-1])
+    if len(repetidas):
+        i = repetidas[0]
+        raise ValueError(
+            f'Matrícula {ids[i]} em mais de uma partição ({nomes[donos[i]]}, {nomes[donos[i + 1]]}): '
+            f'cada aluno deve estar em uma única partição'
+        )
+    return ids, donos
+
+
+def dataset_version(particoes):
+    """
+    Versão do dataset: nomes, tamanhos e mtimes de todas as partições (muda
+    quando qualquer arquivo muda, sem ler nenhum)
+    """
+    resumo = repr(sorted((nome, p.stat) for nome, p in particoes.items()))
+    return 'p-' + hashlib.blake2b(resumo.encode('utf-8'), digest_size=8).hexdigest()
+
+
+class PartitionedAnalytics(BigDataAnalytics):
+    """
+    Mesma interface de consulta do BigDataAnalytics sobre um dataset em
+    partições carregadas sob demanda
+
+    Consultas com várias partições calculam as primitivas de cada uma
+    (_SelecaoResumo) e somam os resultados: as matrículas não podem se repetir
+    entre partições (verificado pelos resumos antes de somar; ValueError se
+    repetem), então alunos e status também somam. O modo aproximado vale
+    quando a consulta usa uma só partição; com várias, o resultado é exato.
+    A API de DataFrame (filter_data, aggregate_data, get_statistics) não se
+    aplica: não há uma tabela única.
+    """
+
+    def __init__(self, root=None):
+        super().__init__(load=False)
+        self.root = root or settings.ANALYTICS_PARTITION_DIR
+        memoria = getattr(settings, 'ANALYTICS_PARTITION_MEMORY_MB', 2048)
+        self.memory_budget = None if memoria is None else memoria * 1024 * 1024
+        # Partições carregadas (ordem LRU) e a memória estimada de cada uma
+        self._engines = OrderedDict()
+        self._memoria = {}
+        self._lock = threading.Lock()
+        # Uma carga por vez: duas partições lidas juntas dobrariam o pico de memória
+        self._load_lock = threading.Lock()
+        # Resumos das partições e mapas do detalhamento montados com eles
+        self._resumos = {}
+        self._mapas = None
+        self._mapas_lock = threading.Lock()
+        # Conjuntos de partições já verificados sem matrículas em comum
+        self._disjuntas = set()
+        self.partitions = discover(self.root)
+        self.dataset_version = dataset_version(self.partitions)
+
+    def refresh(self):
+        """
+        Redescobre as partições (no máximo a cada ANALYTICS_RELOAD_INTERVAL
+        segundos) e retorna o processador com os dados atuais
+
+        Partições carregadas cujo arquivo mudou passam pelo refresh do
+        BigDataAnalytics (só as linhas anexadas são lidas); as demais seguem
+        compartilhadas com a instância atual, que nunca é alterada.
+        """
+        if self.reload_interval is None:
+            return self
+        agora = time.monotonic()
+        if agora - self._refreshed_at < self.reload_interval:
+            return self
+        self._refreshed_at = agora
+
+        particoes = discover(self.root)
+        versao = dataset_version(particoes)
+        if versao == self.dataset_version:
+            return self
+
+        novo = copy.copy(self)
+        novo.partitions = particoes
+        novo.dataset_version = versao
+        novo.facets = None
+        novo._engines = OrderedDict()
+        novo._memoria = {}
+        novo._lock = threading.Lock()
+        novo._load_lock = threading.Lock()
+        novo._resumos = {
+            nome: resumo for nome, resumo in self._resumos.items()
+            if nome in particoes and resumo['stat'] == particoes[nome].stat
+        }
+        novo._mapas = None
+        novo._mapas_lock = threading.Lock()
+        novo._disjuntas = set()
+        novo.query_cache = QueryCache(self.query_cache.max_entries, self.query_cache.ttl)
+        with self._lock:
+            carregadas = list(self._engines.items())
+        for nome, engine in carregadas:
+            if nome not in particoes:
+                continue
+            if particoes[nome].stat != self.partitions[nome].stat:
+                engine = engine.refresh()
+            novo._engines[nome] = engine
+            novo._memoria[nome] = engine.memory_bytes()
+        return novo
+
+    def partition_engine(self, particao):
+        """
+        Processador da partição, carregado no primeiro acesso
+        """
+        with self._lock:
+            engine = self._engines.get(particao.nome)
+            if engine is not None:
+                self._engines.move_to_end(particao.nome)
+                return engine
+        with self._load_lock:
+            with self._lock:
+                engine = self._engines.get(particao.nome)
+            if engine is None:
+                engine = self._load_partition(particao)
+                memoria = engine.memory_bytes()
+                with self._lock:
+                    self._engines[particao.nome] = engine
+                    self._memoria[particao.nome] = memoria
+                    self._evict()
+        return engine
+
+    def _partition_snapshot_dir(self, particao):
+        if self.snapshot_dir:
+            return os.path.join(self.snapshot_dir, 'particoes', *particao.nome.split('/'))
+        return None
+
+    def _load_partition(self, particao):
+        engine = BigDataAnalytics(load=False)
+        engine.csv_path = particao.csv_path
+        engine.snapshot_dir = self._partition_snapshot_dir(particao)
+        # Cada partição tem o próprio snapshot; a verificação de mudanças é
+        # feita aqui, na redescoberta
+        engine.shared_dataset = False
+        engine.reload_interval = 0
+        engine._load_data()
+        self.load_timings = engine.load_timings
+        metrics.REGISTRY.inc('analytics_partition_loads_total')
+        self._store_summary(particao, engine)
+        return engine
+
+    def _store_summary(self, particao, engine):
+        resumo = partition_summary(engine, particao.stat)
+        self._resumos[particao.nome] = resumo
+        diretorio = self._partition_snapshot_dir(particao)
+        if diretorio:
+            save_summary(resumo, os.path.join(diretorio, 'resumo.npz'))
+        return resumo
+
+    def partition_summary(self, particao):
+        """
+        Resumo da partição: em memória, gravado junto do snapshot da partição
+        ou, se nenhum corresponde ao CSV, montado com a partição carregada
+        """
+        resumo = self._resumos.get(particao.nome)
+        if resumo is not None and resumo['stat'] == particao.stat:
+            return resumo
+        diretorio = self._partition_snapshot_dir(particao)
+        resumo = diretorio and load_summary(os.path.join(diretorio, 'resumo.npz'), particao.stat)
+        if resumo:
+            self._resumos[particao.nome] = resumo
+            return resumo
+        return self._store_summary(particao, self.partition_engine(particao))
+
+    def _maps(self):
+        """
+        Matrículas de todas as partições (ordenadas) com o índice da partição
+        de cada uma, nomes das partições e série/turma -> partições que a têm
+        """
+        with self._mapas_lock:
+            if self._mapas is None:
+                nomes = list(self.partitions)
+                resumos = [self.partition_summary(self.partitions[nome]) for nome in nomes]
+                ids, donos = merge_ids(nomes, resumos)
+                turmas = {}
+                for nome, resumo in zip(nomes, resumos):
+                    for turma in resumo['turmas']:
+                        turmas.setdefault(turma, []).append(nome)
+                self._mapas = (ids, donos, nomes, turmas)
+                self._disjuntas.add(frozenset(nomes))
+            return self._mapas
+
+    def _check_disjoint(self, particoes):
+        """
+        As partições somadas por uma consulta não têm matrículas em comum
+        (merge_ids); cada conjunto é verificado uma vez
+        """
+        nomes = frozenset(p.nome for p in particoes)
+        if len(nomes) < 2 or any(nomes <= verificadas for verificadas in self._disjuntas):
+            return
+        merge_ids([p.nome for p in particoes], [self.partition_summary(p) for p in particoes])
+        self._disjuntas.add(nomes)
+
+    def _evict(self):
+        """
+        Descarta as partições usadas há mais tempo até a memória caber no
+        orçamento (a mais recente fica mesmo se sozinha passar dele)
+        Chamar com _lock
+        """
+        if self.memory_budget is None:
+            return
+        while len(self._engines) > 1 and sum(self._memoria.values()) > self.memory_budget:
+            nome, _ = self._engines.popitem(last=False)
+            del self._memoria[nome]
+            metrics.REGISTRY.inc('analytics_partition_evictions_total')
+
+    def partition_stats(self):
+        """
+        Partições descobertas, carregadas e memória estimada das carregadas
+        """
+        with self._lock:
+            return {
+                'total': len(self.partitions),
+                'loaded': len(self._engines),
+                'memory_bytes': sum(self._memoria.values())
+            }
+
+    def _prune(self, filters):
+        return [p for p in self.partitions.values() if p.matches(filters)]
+
+    def evaluate(self, filters, chart_types, approximate=False, histogram_options=None):
+        """
+        Avalia cada partição que sobra após a poda e soma os resultados
+        """
+        particoes = self._prune(filters)
+        if len(particoes) == 1:
+            engine = self.partition_engine(particoes[0])
+            return _evaluate_selecao(engine.selection(filters, approximate), chart_types, histogram_options)
+
+        self._check_disjoint(particoes)
+        resumos = []
+        for particao in particoes:
+            selecao = self.partition_engine(particao).selection(filters)
+            if selecao is not None:
+                with metrics.stage('aggregate'):
+                    resumos.append(_SelecaoResumo(selecao, chart_types))
+        if not resumos:
+            return _evaluate_selecao(None, chart_types)
+        return _evaluate_selecao(_SelecaoParticoes(resumos), chart_types, histogram_options)
+
+    def cache_key(self, filters, chart_type, approximate=False, histogram_options=None):
+        filtros = tuple(sorted(
+            (coluna, str(filters[coluna]))
+            for coluna in FILTROS_PARTICIONADO
+            if filters.get(coluna)
+        ))
+        return _cache_key(self.dataset_version, filtros, chart_type, approximate, histogram_options)
+
+    def get_unique_values(self):
+        """
+        União das opções dos resumos das partições (uma partição só é
+        carregada se o seu resumo não está gravado) e os anos das partições
+        """
+        if self.facets is None:
+            opcoes = {'filiais': set(), 'series_turmas': set(), 'disciplinas': set(), 'tipos_nota': set()}
+            for particao in self.partitions.values():
+                for chave, valores in self.partition_summary(particao)['opcoes'].items():
+                    opcoes[chave].update(valores)
+            facets = {chave: sorted(valores) for chave, valores in opcoes.items()}
+            facets['anos'] = sorted({p.chaves['ano'] for p in self.partitions.values() if 'ano' in p.chaves})
+            self.facets = facets
+        return self.facets
+
+    def get_facets(self, filters):
+        """
+        Soma das facetas das partições
+
+        Cada coluna ignora o próprio filtro, então a faceta de id_filial
+        precisa das partições das outras filiais (que só contribuem com ela);
+        o ano continua podando. Cada faceta vem do resumo da partição quando
+        possível (summary_facet); a partição só é carregada quando os demais
+        filtros exigem.
+        """
+        def compute():
+            somas = {coluna: {} for coluna in COLUNAS_FILTRO}
+            sem_filial = {k: v for k, v in filters.items() if k != 'id_filial'}
+            particoes = self._prune(sem_filial)
+            self._check_disjoint(particoes)
+            for particao in particoes:
+                resumo = self.partition_summary(particao)
+                carregadas = None
+                for coluna in COLUNAS_FILTRO:
+                    if coluna != 'id_filial' and not particao.matches(filters):
+                        continue
+                    filtros = {k: v for k, v in filters.items() if k in COLUNAS_FILTRO and k != coluna and v}
+                    faceta = summary_facet(resumo, coluna, filtros)
+                    if faceta is None:
+                        if carregadas is None:
+                            carregadas = self.partition_engine(particao).get_facets(filters)
+                        faceta = carregadas.get(coluna)
+                        if faceta is None:
+                            continue
+                    for valor, linhas, alunos in zip(faceta['valores'], faceta['total_registros'], faceta['total_alunos']):
+                        anterior = somas[coluna].get(valor, (0, 0))
+                        somas[coluna][valor] = (anterior[0] + linhas, anterior[1] + alunos)
+            facetas = {}
+            for coluna, contagens in somas.items():
+                valores = sorted(contagens)
+                facetas[coluna] = {
+                    'valores': valores,
+                    'total_registros': np.array([contagens[v][0] for v in valores], dtype=np.int64),
+                    'total_alunos': np.array([contagens[v][1] for v in valores], dtype=np.int64)
+                }
+            return facetas
+
+        if not self.partitions:
+            return {}
+        return self._cached(self.cache_key(filters, 'facets'), compute)
+
+    def student_detail(self, id_matricula):
+        """
+        Detalhe lido só da partição que tem o aluno (as matrículas não se
+        repetem entre partições)
+        """
+        ids, donos, nomes, _ = self._maps()
+        id_matricula = str(id_matricula)
+        posicao = np.searchsorted(ids, id_matricula)
+        if posicao == len(ids) or ids[posicao] != id_matricula:
+            return None
+        return self.partition_engine(self.partitions[nomes[donos[posicao]]]).student_detail(id_matricula)
+
+    def _roster_page(self, serie_turma, ordenacao, decrescente, depois, limite):
+        """
+        Junta as páginas das partições que têm a turma (cada uma já começa
+        depois do cursor) e fica com as limite primeiras chaves
+        """
+        total, pagina = 0, []
+        for nome in self._maps()[3].get(serie_turma, []):
+            parcial, alunos = self.partition_engine(self.partitions[nome])._roster_page(
+                serie_turma, ordenacao, decrescente, depois, limite
+            )
+            total += parcial
+            pagina += alunos
+        pagina.sort(key=lambda par: par[0], reverse=decrescente)
+        return total, pagina[:limite]
+
+    def selection(self, filters, approximate=False):
+        raise NotImplementedError('Dataset particionado: as partições são avaliadas em evaluate')
+
+    def filter_data(self, filters, approximate=False):
+        raise NotImplementedError('Dataset particionado não tem uma tabela única: use iter_rows ou evaluate')
+
+    def evaluate_frame(self, df_filtered, chart_types):
+        raise NotImplementedError('Dataset particionado não tem uma tabela única: use evaluate')
+
+    def aggregate_data(self, df_filtered, chart_type='distribuicao_notas', approximate=False,
+                       histogram_options=None):
+        raise NotImplementedError('Dataset particionado não tem uma tabela única: use get_chart_payload')
+
+    def get_statistics(self, df_filtered, approximate=False):
+        raise NotImplementedError('Dataset particionado não tem uma tabela única: use get_batch_payload')
+
+    def iter_rows(self, filters, batch_size=10_000):
+        for particao in self._prune(filters):
+            yield from self.partition_engine(particao).iter_rows(filters, batch_size)
+
+    def columns(self):
+        for particao in self.partitions.values():
+            colunas = self.partition_engine(particao).columns()
+            if colunas:
+                return colunas
+        return []
+
+    def dataset_size(self):
+        """
+        Linhas e alunos das partições carregadas
+        """
+        with self._lock:
+            engines = list(self._engines.values())
+        tamanhos = [engine.dataset_size() for engine in engines]
+        return sum(t[0] for t in tamanhos), sum(t[1] for t in tamanhos)
@@ -0,0 +1,109 @@
+"""
+Respostas JSON das APIs de gráficos
+Serialização que escreve os arrays NumPy dos payloads diretamente (orjson,
+quando instalado) e compressão gzip/brotli negociada pelo Accept-Encoding
+"""
+import gzip
+import json
+import math
+
+import numpy as np
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+
+try:
+    import orjson
+except ImportError:  # opcional: sem ele, json da biblioteca padrão
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # opcional: sem ele, apenas gzip
+    brotli = None
+
+
+# Corpos menores que isso não compensam a compressão
+COMPRESS_MIN_BYTES = 512
+
+# Níveis de compressão (respostas pequenas, geradas a cada requisição)
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def dumps(data):
+    """
+    Serializa o payload em bytes UTF-8; arrays e escalares NumPy são aceitos
+    e NaN vira null (JSON válido)
+    """
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(_sem_nan(data), default=_default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def _default(obj):
+    if isinstance(obj, np.ndarray):
+        return _sem_nan(obj.tolist())
+    if isinstance(obj, np.generic):
+        return _sem_nan(obj.item())
+    raise TypeError(f'{type(obj).__name__} não é serializável em JSON')
+
+
+def _sem_nan(obj):
+    """
+    NaN -> None nos tipos Python (mesma saída do orjson)
+    """
+    if isinstance(obj, float):
+        return None if math.isnan(obj) else obj
+    if isinstance(obj, dict):
+        return {k: _sem_nan(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_sem_nan(v) for v in obj]
+    return obj
+
+
+def _accepted_encoding(request):
+    """
+    Codificação escolhida pelo Accept-Encoding: br (se disponível), gzip ou None
+    """
+    aceitas = {}
+    for parte in request.headers.get('Accept-Encoding', '').split(','):
+        nome, _, parametros = parte.strip().partition(';')
+        qualidade = 1.0
+        if parametros.strip().startswith('q='):
+            try:
+                qualidade = float(parametros.strip()[2:])
+            except ValueError:
+                qualidade = 0.0
+        if nome:
+            aceitas[nome.lower()] = qualidade
+    for codificacao in ('br', 'gzip'):
+        if codificacao == 'br' and brotli is None:
+            continue
+        if aceitas.get(codificacao, aceitas.get('*', 0)) > 0:
+            return codificacao
+    return None
+
+
+def json_response(request, data, etag=None):
+    """
+    HttpResponse com o payload serializado e comprimido conforme o cliente
+
+    O ETag de uma resposta comprimida passa a ser fraco (como no
+    GZipMiddleware do Django): o corpo depende da codificação.
+    """
+    corpo = dumps(data)
+    response = HttpResponse(content_type='application/json')
+    patch_vary_headers(response, ('Accept-Encoding',))
+
+    codificacao = _accepted_encoding(request) if len(corpo) >= COMPRESS_MIN_BYTES else None
+    if codificacao == 'br':
+        corpo = brotli.compress(corpo, quality=BROTLI_QUALITY)
+    elif codificacao == 'gzip':
+        corpo = gzip.compress(corpo, compresslevel=GZIP_LEVEL, mtime=0)
+    if codificacao:
+        response['Content-Encoding'] = codificacao
+    if etag:
+        response['ETag'] = f'W/{etag}' if codificacao and not etag.startswith('W/') else etag
+
+    response.content = corpo
+    return response
@@ -0,0 +1,324 @@
+"""
+Snapshot binário colunar da tabela de notas
+Cada coluna é persistida como um arquivo .npy e carregada com memory mapping,
+evitando reprocessar o CSV (leitura, limpeza e status) a cada inicialização
+
+O snapshot também guarda a tabela de alunos e o índice invertido. Cada
+gravação recebe um número de versão crescente; processos no modo
+compartilhado mapeiam a versão ativa (as páginas são as mesmas em todos eles)
+e acompanham o número para trocar de versão.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+
+MANIFEST_FILE = 'manifest.json'
+CURRENT_FILE = 'CURRENT'
+SNAPSHOT_FORMAT = 1
+
+
+def csv_fingerprint(csv_path, with_hash=True, size=None):
+    """
+    Identifica o conteúdo do CSV por tamanho, mtime e hash do conteúdo
+    
+    size limita a identificação aos primeiros bytes do arquivo (o trecho já
+    processado, quando o final ainda tem uma linha incompleta)
+    """
+    stat = os.stat(csv_path)
+    fingerprint = {
+        'size': stat.st_size if size is None else size,
+        'mtime_ns': stat.st_mtime_ns
+    }
+    if with_hash:
+        fingerprint['hash'] = content_hash(csv_path, limit=size)
+    return fingerprint
+
+
+def content_hash(csv_path, chunk_size=4 * 1024 * 1024, limit=None):
+    """
+    Hash BLAKE2b do arquivo (ou dos primeiros limit bytes), lido em blocos
+    para não carregar tudo na memória
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    restante = limit
+    with open(csv_path, 'rb') as f:
+        while restante is None or restante > 0:
+            bloco = f.read(chunk_size if restante is None else min(chunk_size, restante))
+            if not bloco:
+                break
+            digest.update(bloco)
+            if restante is not None:
+                restante -= len(bloco)
+    return digest.hexdigest()
+
+
+def _current_name(snapshot_dir):
+    """
+    Nome do diretório do snapshot ativo (conteúdo do arquivo CURRENT) ou None
+    """
+    try:
+        with open(os.path.join(snapshot_dir, CURRENT_FILE), encoding='utf-8') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _current_dir(snapshot_dir):
+    """
+    Diretório do snapshot ativo (apontado pelo arquivo CURRENT) ou None
+    """
+    nome = _current_name(snapshot_dir)
+    if nome is None:
+        return None
+    caminho = os.path.join(snapshot_dir, nome)
+    return caminho if os.path.isdir(caminho) else None
+
+
+def current_version(snapshot_dir):
+    """
+    Número de versão do snapshot ativo (prefixo do nome do diretório), lido
+    sem abrir o manifesto; None se não houver snapshot
+    """
+    nome = _current_name(snapshot_dir)
+    if nome is None:
+        return None
+    versao = _version_of(nome)
+    return 0 if versao is None else versao
+
+
+def read_manifest(snapshot_dir):
+    """
+    Lê o manifesto do snapshot ativo (ou None se não existir)
+    """
+    atual = _current_dir(snapshot_dir)
+    if atual is None:
+        return None
+    try:
+        with open(os.path.join(atual, MANIFEST_FILE), encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    if manifest.get('format') != SNAPSHOT_FORMAT:
+        return None
+    # Diretório de origem (não persistido): os arquivos são lidos dele mesmo
+    # que outra versão seja ativada entretanto
+    manifest['path'] = atual
+    return manifest
+
+
+def is_fresh(manifest, csv_path):
+    """
+    Verifica se o snapshot corresponde ao CSV atual
+
+    Tamanho e mtime iguais: válido sem ler o arquivo.
+    Mesmo tamanho com mtime diferente: decide pelo hash do conteúdo e, se ele
+    confere, grava o mtime novo no manifesto (as próximas verificações não
+    releem o arquivo).
+    """
+    if manifest is None:
+        return False
+    origem = manifest['source']
+    stat = os.stat(csv_path)
+    if stat.st_size != origem['size']:
+        return False
+    if stat.st_mtime_ns == origem['mtime_ns']:
+        return True
+    if content_hash(csv_path) != origem['hash']:
+        return False
+    _update_source_mtime(manifest, stat.st_mtime_ns)
+    return True
+
+
+def _update_source_mtime(manifest, mtime_ns):
+    """
+    Regrava o manifesto com o mtime atual do CSV (troca atômica; falhas, como
+    um diretório somente leitura, apenas mantêm a verificação pelo hash)
+    """
+    origem = dict(manifest['source'], mtime_ns=mtime_ns)
+    gravado = {chave: valor for chave, valor in manifest.items() if chave != 'path'}
+    gravado['source'] = origem
+    try:
+        fd, tmp = tempfile.mkstemp(prefix=f'{MANIFEST_FILE}.', dir=manifest['path'])
+    except OSError:
+        return
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(gravado, f, ensure_ascii=False)
+        os.replace(tmp, os.path.join(manifest['path'], MANIFEST_FILE))
+    except OSError:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return
+    manifest['source'] = origem
+
+
+def is_prefix(manifest, csv_path):
+    """
+    Verifica se o CSV atual é o conteúdo do snapshot com linhas anexadas ao
+    final (basta ler as linhas novas)
+    """
+    if manifest is None:
+        return False
+    origem = manifest['source']
+    if os.stat(csv_path).st_size <= origem['size']:
+        return False
+    return content_hash(csv_path, limit=origem['size']) == origem['hash']
+
+
+def save_snapshot(df, snapshot_dir, fingerprint, students=None, index=None, dataset_version=None):
+    """
+    Grava o DataFrame como um .npy por coluna e ativa o novo snapshot
+
+    Colunas categóricas guardam os códigos em .npy e o dicionário no manifesto;
+    colunas de texto são codificadas da mesma forma. A tabela de alunos e as
+    listas de postings do índice (index: coluna -> {'ordem', 'offsets'}) são
+    gravadas junto quando informadas. A troca é atômica: os arquivos vão para
+    um diretório novo e só depois o CURRENT passa a apontá-lo, então processos
+    que ainda mapeiam a versão anterior não são afetados.
+    """
+    os.makedirs(snapshot_dir, exist_ok=True)
+    versao = (current_version(snapshot_dir) or 0) + 1
+    destino = tempfile.mkdtemp(prefix=f"{versao:010d}-{fingerprint['hash']}-", dir=snapshot_dir)
+
+    manifest = {
+        'format': SNAPSHOT_FORMAT,
+        'version': versao,
+        'dataset_version': dataset_version,
+        'source': fingerprint,
+        'rows': len(df),
+        'columns': _write_frame(df, destino)
+    }
+    if students is not None:
+        manifest['students'] = _write_frame(students, destino, prefixo='s')
+    if index:
+        manifest['index'] = {}
+        for n, (coluna, postings) in enumerate(index.items()):
+            arquivos = {}
+            for parte in ('ordem', 'offsets'):
+                arquivos[parte] = f'i{n}-{parte}.npy'
+                np.save(os.path.join(destino, arquivos[parte]), np.ascontiguousarray(postings[parte]))
+            manifest['index'][coluna] = arquivos
+    with open(os.path.join(destino, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+
+    _activate(snapshot_dir, os.path.basename(destino))
+    manifest['path'] = destino
+    return manifest
+
+
+def _write_frame(df, destino, prefixo=''):
+    """
+    Grava cada coluna de df como .npy em destino; retorna a descrição das
+    colunas para o manifesto
+    """
+    colunas = []
+    for nome in df.columns:
+        serie = df[nome]
+        info = {'name': nome}
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            valores = serie.array.codes
+            info['categories'] = serie.cat.categories.tolist()
+        elif serie.dtype.kind in 'biuf':
+            valores = serie.to_numpy()
+        else:
+            codigos, categorias = pd.factorize(serie)
+            valores = codigos.astype(np.int32)
+            info['categories'] = categorias.tolist()
+            info['decode'] = True
+        info['file'] = f'{prefixo}{len(colunas)}.npy'
+        np.save(os.path.join(destino, info['file']), np.ascontiguousarray(valores))
+        colunas.append(info)
+    return colunas
+
+
+def _version_of(nome):
+    """
+    Número de versão no prefixo do nome de um diretório de snapshot ou None
+    """
+    prefixo = nome.split('-', 1)[0]
+    return int(prefixo) if prefixo.isdigit() else None
+
+
+def _activate(snapshot_dir, nome):
+    """
+    Aponta CURRENT para o novo snapshot (os.replace é atômico) e remove os antigos
+    """
+    anterior = _current_name(snapshot_dir)
+    tmp = os.path.join(snapshot_dir, f'{CURRENT_FILE}.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(nome)
+    os.replace(tmp, os.path.join(snapshot_dir, CURRENT_FILE))
+
+    # A versão anterior é mantida para processos que leram o CURRENT antigo e
+    # ainda estão abrindo os arquivos. Só são removidas versões completas (com
+    # manifesto, gravado por último) mais antigas que ela: um diretório sem
+    # manifesto pode ser a gravação em andamento de outro processo, e os
+    # subdiretórios que não são versões (partições) ficam intactos.
+    limite = _version_of(anterior) if anterior else None
+    if limite is None:
+        return
+    for antigo in os.listdir(snapshot_dir):
+        caminho = os.path.join(snapshot_dir, antigo)
+        versao = _version_of(antigo)
+        if (antigo not in (nome, anterior) and versao is not None and versao < limite
+                and os.path.isfile(os.path.join(caminho, MANIFEST_FILE))):
+            # Em POSIX, arquivos ainda mapeados continuam válidos após a remoção
+            shutil.rmtree(caminho, ignore_errors=True)
+
+
+def load_snapshot(snapshot_dir, manifest=None):
+    """
+    Carrega o snapshot ativo com memory mapping (somente leitura, sem cópia)
+    """
+    manifest = manifest or read_manifest(snapshot_dir)
+    if manifest is None:
+        return None
+    return _read_frame(manifest['path'], manifest['columns'])
+
+
+def load_students(manifest):
+    """
+    Tabela de alunos do snapshot (memory mapping) ou None se não foi gravada
+    """
+    if 'students' not in manifest:
+        return None
+    return _read_frame(manifest['path'], manifest['students'])
+
+
+def load_index(manifest):
+    """
+    Listas de postings do snapshot (coluna -> (ordem, offsets), memory
+    mapping) ou None se não foram gravadas
+    """
+    if 'index' not in manifest:
+        return None
+    return {
+        coluna: tuple(
+            np.load(os.path.join(manifest['path'], arquivos[parte]), mmap_mode='r')
+            for parte in ('ordem', 'offsets')
+        )
+        for coluna, arquivos in manifest['index'].items()
+    }
+
+
+def _read_frame(atual, colunas):
+    """
+    DataFrame com as colunas gravadas por _write_frame, sem copiar os arrays
+    """
+    dados = {}
+    for info in colunas:
+        valores = np.load(os.path.join(atual, info['file']), mmap_mode='r')
+        if 'categories' in info:
+            coluna = pd.Categorical.from_codes(valores, categories=info['categories'], validate=False)
+            if info.get('decode'):
+                coluna = np.asarray(coluna, dtype=object)
+            dados[info['name']] = coluna
+        else:
+            dados[info['name']] = valores
+    return pd.DataFrame(dados, copy=False)
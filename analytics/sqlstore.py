@@ -0,0 +1,568 @@
+"""
+Armazenamento em SQLite para instâncias com pouca memória
+O CSV é importado uma vez (em blocos) para uma tabela indexada pelas colunas
+de filtro e por id_matricula, com uma tabela materializada de alunos e seus
+status. Filtros, gráficos e estatísticas viram agregações SQL executadas no
+banco: só os resultados (por valor, status ou classe de nota) vêm para o
+processo, que não guarda nenhuma linha em memória.
+"""
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # opcional: sem ele (Windows), importações não são serializadas entre processos
+    fcntl = None
+
+from . import histogram, ingest, metrics
+from .data_processor import (
+    BigDataAnalytics, COLUNAS_FILTRO, CSV_DTYPES, ROTULOS_FAIXA, STATUS_ALUNO,
+    _Selecao, _aluno_payload, _clean_frame, _detalhe_aluno, _evaluate_selecao, _faixa_das_classes,
+    _somas_presentes
+)
+
+
+logger = logging.getLogger(__name__)
+
+# Colunas da tabela de notas na ordem da tabela em memória (exportação)
+COLUNAS_NOTAS = [
+    'id_nota', 'id_matricula', 'vlr_nota', 'id_filial', 'titulo_turma', 'nome_serie',
+    'nome_disciplina', 'tipo_nota_aval', 'serie_turma', 'status'
+]
+
+# Colunas das médias por grupo (media_por_disciplina e notas_por_tipo)
+COLUNAS_GRUPO = ['nome_disciplina', 'tipo_nota_aval']
+
+ESQUEMA = """
+CREATE TABLE notas (
+    id_nota TEXT, id_matricula TEXT, vlr_nota REAL, id_filial TEXT, titulo_turma TEXT,
+    nome_serie TEXT, nome_disciplina TEXT, tipo_nota_aval TEXT, serie_turma TEXT, status TEXT,
+    classe INTEGER, faixa INTEGER
+);
+CREATE TABLE alunos (
+    id_matricula TEXT PRIMARY KEY, id_filial TEXT, serie_turma TEXT, nota_ma REAL,
+    menor_mb REAL, status TEXT, faixas INTEGER
+) WITHOUT ROWID;
+CREATE TABLE meta (chave TEXT PRIMARY KEY, valor TEXT) WITHOUT ROWID;
+"""
+
+# Agregados das linhas por disciplina, tipo de nota e classe fina (sobre a
+# tabela inteira, materializados na importação: consulta sem filtros)
+GRUPOS_SQL = f"""
+SELECT {', '.join(COLUNAS_GRUPO)}, classe, COUNT(*), TOTAL(vlr_nota), COUNT(vlr_nota), MAX(vlr_nota), MIN(vlr_nota)
+FROM notas{{where}} GROUP BY {', '.join(COLUNAS_GRUPO)}, classe
+"""
+
+# Faixas de desempenho presentes nas linhas de um aluno, como bits de um inteiro
+FAIXAS_SQL = ' | '.join(f'(MAX(faixa IS {i}) << {i})' for i in range(len(ROTULOS_FAIXA)))
+
+# Tabela de alunos: nota MA do primeiro registro MA, menor nota bimestral,
+# filial e série/turma do primeiro registro com valor (mesmas regras da tabela
+# de alunos em memória) e faixas presentes
+ALUNOS_SQL = f"""
+INSERT INTO alunos
+WITH primeiros AS (
+    SELECT id_matricula,
+           MIN(CASE WHEN tipo_nota_aval = 'MA' THEN rowid END) AS linha_ma,
+           MIN(CASE WHEN tipo_nota_aval IN ('Mb1', 'Mb2', 'Mb3', 'Mb4') THEN vlr_nota END) AS menor_mb,
+           MIN(CASE WHEN id_filial IS NOT NULL THEN rowid END) AS linha_filial,
+           MIN(CASE WHEN serie_turma IS NOT NULL THEN rowid END) AS linha_serie,
+           {FAIXAS_SQL} AS faixas
+    FROM notas WHERE id_matricula IS NOT NULL GROUP BY id_matricula
+)
+SELECT p.id_matricula, f.id_filial, s.serie_turma, ma.vlr_nota, p.menor_mb,
+       CASE WHEN ma.vlr_nota < 6 THEN '{STATUS_ALUNO[2]}'
+            WHEN p.menor_mb < 6 THEN '{STATUS_ALUNO[1]}'
+            ELSE '{STATUS_ALUNO[0]}' END,
+       p.faixas
+FROM primeiros p
+LEFT JOIN notas ma ON ma.rowid = p.linha_ma
+LEFT JOIN notas f ON f.rowid = p.linha_filial
+LEFT JOIN notas s ON s.rowid = p.linha_serie
+"""
+
+
+# Chave de ordenação da lista de alunos da turma (drilldown.sort_key: valores
+# ausentes como infinito, 9e999 no SQLite)
+CHAVES_ROSTER = {
+    'id_matricula': '0.0',
+    'status': 'CASE status ' + ' '.join(
+        f"WHEN '{status}' THEN {float(i)}" for i, status in enumerate(STATUS_ALUNO)
+    ) + ' ELSE 9e999 END',
+    'nota_ma': 'COALESCE(nota_ma, 9e999)',
+    'menor_mb': 'COALESCE(menor_mb, 9e999)',
+}
+
+COLUNAS_ALUNO = 'id_matricula, id_filial, serie_turma, status, nota_ma, menor_mb'
+
+
+def _where(filters):
+    """
+    Cláusula WHERE (com parâmetros) dos filtros não vazios
+    """
+    colunas = [coluna for coluna in COLUNAS_FILTRO if filters.get(coluna)]
+    if not colunas:
+        return '', []
+    return ' WHERE ' + ' AND '.join(f'{coluna} = ?' for coluna in colunas), [str(filters[c]) for c in colunas]
+
+
+def _and(where, condicao):
+    """
+    Acrescenta uma condição à cláusula WHERE
+    """
+    return f'{where} AND {condicao}' if where else f' WHERE {condicao}'
+
+
+def import_csv(csv_path, caminho, chunk_rows=500_000):
+    """
+    Importa o CSV para um banco novo em caminho: o arquivo é lido em blocos
+    (limpos como na carga em memória) e o banco só substitui o anterior
+    quando está completo, então processos lendo a versão antiga não são
+    afetados. Retorna os tempos de cada etapa.
+    """
+    tempos = {}
+    stat = os.stat(csv_path)
+    # Arquivo temporário único no mesmo diretório (os.replace atômico)
+    fd, temporario = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(caminho)), prefix=f'{os.path.basename(caminho)}.', suffix='.tmp'
+    )
+    os.close(fd)
+    conexao = sqlite3.connect(temporario)
+    try:
+        conexao.execute('PRAGMA journal_mode = OFF')
+        conexao.execute('PRAGMA synchronous = OFF')
+        conexao.executescript(ESQUEMA)
+        colunas = COLUNAS_NOTAS[:-1] + ['classe', 'faixa']
+        insert = f"INSERT INTO notas ({', '.join(colunas)}) VALUES ({', '.join('?' * len(colunas))})"
+        with metrics.timed(tempos, 'import'):
+            blocos = ingest.read_csv_chunks(csv_path, 0, stat.st_size, chunk_rows, dtype=CSV_DTYPES)
+            for bloco in blocos:
+                bloco = _clean_frame(bloco)
+                classes = histogram.fine_bins(bloco['vlr_nota'].to_numpy())
+                valores = [
+                    bloco[coluna].astype(object).where(bloco[coluna].notna(), None).tolist()
+                    for coluna in COLUNAS_NOTAS[:-1]
+                ]
+                valores.append(np.where(classes >= 0, classes, None).tolist())
+                faixas = _faixa_das_classes(classes)
+                valores.append(np.where(faixas >= 0, faixas, None).tolist())
+                conexao.executemany(insert, zip(*valores))
+        with metrics.timed(tempos, 'status'):
+            conexao.execute(ALUNOS_SQL)
+            conexao.execute(
+                'UPDATE notas SET status = (SELECT status FROM alunos a WHERE a.id_matricula = notas.id_matricula)'
+            )
+        with metrics.timed(tempos, 'summary'):
+            conexao.execute(f"CREATE TABLE grupos AS {GRUPOS_SQL.format(where='')}")
+        with metrics.timed(tempos, 'index'):
+            for coluna in COLUNAS_FILTRO + ['id_matricula']:
+                conexao.execute(f'CREATE INDEX idx_notas_{coluna} ON notas ({coluna})')
+            conexao.execute('CREATE INDEX idx_alunos_serie_turma ON alunos (serie_turma, id_matricula)')
+            conexao.execute('ANALYZE')
+        n_linhas = conexao.execute('SELECT COUNT(*) FROM notas').fetchone()[0]
+        n_alunos = conexao.execute('SELECT COUNT(*) FROM alunos').fetchone()[0]
+        versao = ingest.range_version(stat.st_size, ingest.content_digest(csv_path, 0, stat.st_size).hexdigest())
+        conexao.executemany('INSERT INTO meta VALUES (?, ?)', [
+            ('csv_size', str(stat.st_size)),
+            ('csv_mtime_ns', str(stat.st_mtime_ns)),
+            ('dataset_version', versao),
+            ('rows', str(n_linhas)),
+            ('students', str(n_alunos)),
+        ])
+        conexao.commit()
+    except BaseException:
+        conexao.close()
+        os.remove(temporario)
+        raise
+    conexao.close()
+    os.replace(temporario, caminho)
+    return tempos
+
+
+@contextmanager
+def import_lock(caminho):
+    """
+    Trava exclusiva (flock em <caminho>.lock) durante a importação: um
+    processo ou thread importa e os demais esperam e reabrem o banco pronto
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(f'{caminho}.lock', 'a') as trava:
+        fcntl.flock(trava, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(trava, fcntl.LOCK_UN)
+
+
+def ensure_imported(csv_path, caminho, chunk_rows=500_000, force=False):
+    """
+    Importa o CSV se o banco não corresponde a ele (ou com force), com a
+    trava de importação; quem esperou pela importação de outro processo só
+    reabre o banco. Retorna os metadados e os tempos da importação (vazio
+    se não importou).
+    """
+    with import_lock(caminho):
+        meta = read_meta(caminho)
+        if not force and is_fresh(meta, csv_path):
+            return meta, {}
+        tempos = import_csv(csv_path, caminho, chunk_rows)
+        return read_meta(caminho), tempos
+
+
+def read_meta(caminho):
+    """
+    Metadados do banco importado (None se não existe ou está incompleto)
+    """
+    if not os.path.exists(caminho):
+        return None
+    try:
+        conexao = sqlite3.connect(f'file:{caminho}?mode=ro', uri=True)
+        try:
+            return dict(conexao.execute('SELECT chave, valor FROM meta').fetchall())
+        finally:
+            conexao.close()
+    except sqlite3.Error:
+        return None
+
+
+def is_fresh(meta, csv_path):
+    """
+    O banco corresponde ao CSV atual (sem CSV, o banco existente vale)
+    """
+    if meta is None:
+        return False
+    try:
+        stat = os.stat(csv_path)
+    except OSError:
+        return True
+    return (str(stat.st_size), str(stat.st_mtime_ns)) == (meta['csv_size'], meta['csv_mtime_ns'])
+
+
+class SqliteAnalytics(BigDataAnalytics):
+    """
+    Mesma interface de consulta do BigDataAnalytics com os dados em SQLite
+    (ANALYTICS_SQLITE_PATH)
+
+    Cada consulta é resolvida por agregações SQL sobre os índices das colunas
+    de filtro; o modo aproximado e o cubo não se aplicam (respostas exatas).
+    Cada thread usa a própria conexão somente leitura. A reimportação quando
+    o CSV muda roda em um thread de fundo (refresh): as requisições seguem
+    respondendo com o banco anterior até o novo ficar pronto.
+    """
+
+    def __init__(self, path=None):
+        super().__init__(load=False)
+        self.path = path or settings.ANALYTICS_SQLITE_PATH
+        self.meta = None
+        self._conexoes = threading.local()
+        self._reimportacao = None
+        self._reimportado = None
+        self._load_data()
+
+    def _load_data(self):
+        """
+        Importa o CSV quando o banco não existe ou é de outra versão do arquivo
+        """
+        self.load_timings = tempos = {}
+        inicio = time.perf_counter()
+        try:
+            self.meta, importacao = ensure_imported(self.csv_path, self.path, self.streaming_chunk_rows)
+            tempos.update(importacao)
+        except Exception:
+            logger.exception('Erro ao importar %s para %s', self.csv_path, self.path)
+            metrics.REGISTRY.inc('analytics_load_errors_total')
+            self.meta = None
+        with metrics.timed(tempos, 'facets'):
+            self._build_facets()
+        tempos['total'] = time.perf_counter() - inicio
+        metrics.REGISTRY.inc('analytics_loads_total')
+        self.dataset_version = 'vazio' if self.meta is None else self.meta['dataset_version']
+        self.query_cache.clear()
+
+    def refresh(self):
+        """
+        Retorna o processador atual: quando o CSV muda (verificado no máximo a
+        cada ANALYTICS_RELOAD_INTERVAL segundos), o banco é reimportado em um
+        thread de fundo, fora da requisição, e o novo processador é retornado
+        quando fica pronto (um banco já importado por outro processo é só
+        reaberto)
+        """
+        if self._reimportado is not None:
+            novo, self._reimportado = self._reimportado, None
+            if novo.meta is not None and novo.meta != self.meta:
+                return novo
+        if self.reload_interval is None:
+            return self
+        agora = time.monotonic()
+        if agora - self._refreshed_at < self.reload_interval:
+            return self
+        self._refreshed_at = agora
+        if is_fresh(self.meta, self.csv_path) or (self._reimportacao and self._reimportacao.is_alive()):
+            return self
+        if is_fresh(read_meta(self.path), self.csv_path):
+            novo = SqliteAnalytics(self.path)
+            return novo if novo.meta is not None else self
+        self._reimportacao = threading.Thread(target=self._reimport, name='analytics-sqlite-import', daemon=True)
+        self._reimportacao.start()
+        return self
+
+    def _reimport(self):
+        self._reimportado = SqliteAnalytics(self.path)
+
+    def query(self, sql, params=()):
+        """
+        Linhas de uma consulta na conexão somente leitura deste thread
+        """
+        conexao = getattr(self._conexoes, 'conexao', None)
+        if conexao is None:
+            conexao = sqlite3.connect(f'file:{self.path}?mode=ro', uri=True)
+            self._conexoes.conexao = conexao
+        return conexao.execute(sql, params).fetchall()
+
+    def _build_facets(self):
+        self._facet_totals = {}
+        if self.meta is None:
+            self.facets = {'filiais': [], 'series_turmas': [], 'disciplinas': [], 'tipos_nota': []}
+            return
+        self.facets = {
+            chave: [valor for valor, in self.query(
+                f'SELECT DISTINCT {coluna} FROM notas WHERE {coluna} IS NOT NULL ORDER BY {coluna}'
+            )]
+            for chave, coluna in (
+                ('filiais', 'id_filial'), ('series_turmas', 'serie_turma'),
+                ('disciplinas', 'nome_disciplina'), ('tipos_nota', 'tipo_nota_aval')
+            )
+        }
+
+    def selection(self, filters, approximate=False):
+        if self.meta is None:
+            return None
+        where, params = _where(filters)
+        with metrics.stage('filter'):
+            existe = self.query(f'SELECT EXISTS (SELECT 1 FROM notas{where})', params)[0][0]
+        return _SelecaoSql(self, where, params) if existe else None
+
+    def filter_data(self, filters, approximate=False):
+        """
+        Linhas que atendem aos filtros (materializadas; o dashboard usa
+        evaluate, que não lê as linhas)
+        """
+        with metrics.stage('filter'):
+            df_filtered = pd.concat(list(self.iter_rows(filters, 1 << 20)) or [pd.DataFrame(columns=COLUNAS_NOTAS)])
+        df_filtered.attrs['filters'] = dict(filters)
+        return df_filtered
+
+    def aggregate_data(self, df_filtered, chart_type='distribuicao_notas', approximate=False,
+                       histogram_options=None):
+        """
+        df_filtered: resultado de filter_data; a agregação é refeita no banco
+        com os mesmos filtros
+        """
+        resultado = self.evaluate(df_filtered.attrs['filters'], [chart_type], histogram_options=histogram_options)
+        return resultado['charts'][chart_type]
+
+    def get_statistics(self, df_filtered, approximate=False):
+        return self.evaluate(df_filtered.attrs['filters'], [])['statistics']
+
+    def evaluate(self, filters, chart_types, approximate=False, histogram_options=None):
+        return _evaluate_selecao(self.selection(filters), chart_types, histogram_options)
+
+    def get_facets(self, filters):
+        def compute():
+            facetas = {}
+            for coluna in COLUNAS_FILTRO:
+                where, params = _where({k: v for k, v in filters.items() if k != coluna})
+                linhas = self.query(
+                    f'SELECT {coluna}, COUNT(*), COUNT(DISTINCT id_matricula) FROM notas'
+                    f'{_and(where, f"{coluna} IS NOT NULL")} GROUP BY {coluna} ORDER BY {coluna}',
+                    params
+                )
+                facetas[coluna] = {
+                    'valores': [linha[0] for linha in linhas],
+                    'total_registros': np.array([linha[1] for linha in linhas], dtype=np.int64),
+                    'total_alunos': np.array([linha[2] for linha in linhas], dtype=np.int64)
+                }
+            return facetas
+
+        if self.meta is None:
+            return {}
+        return self._cached(self.cache_key(filters, 'facets'), compute)
+
+    def student_detail(self, id_matricula):
+        """
+        Aluno pela chave primária e suas linhas pelo índice de id_matricula
+        """
+        if self.meta is None:
+            return None
+        aluno = self.query(f'SELECT {COLUNAS_ALUNO} FROM alunos WHERE id_matricula = ?', (str(id_matricula),))
+        if not aluno:
+            return None
+        linhas = self.query(
+            'SELECT nome_disciplina, tipo_nota_aval, vlr_nota FROM notas WHERE id_matricula = ? ORDER BY rowid',
+            (str(id_matricula),)
+        )
+        metrics.add_rows(len(linhas))
+        return _detalhe_aluno(
+            _aluno_payload(*aluno[0]), ((d, t, np.nan if v is None else v) for d, t, v in linhas)
+        )
+
+    def _roster_page(self, serie_turma, ordenacao, decrescente, depois, limite):
+        """
+        Página por chave: alunos da turma (índice de alunos por serie_turma)
+        depois da chave do cursor, na ordem (chave, id_matricula)
+        """
+        if self.meta is None:
+            return 0, []
+        chave = CHAVES_ROSTER[ordenacao]
+        where, params = ' WHERE serie_turma = ?', [serie_turma]
+        total = self.query(f'SELECT COUNT(*) FROM alunos{where}', params)[0][0]
+        if depois is not None:
+            comparacao = '<' if decrescente else '>'
+            where = _and(where, f'({chave} {comparacao} ? OR ({chave} = ? AND id_matricula {comparacao} ?))')
+            params += [depois[0], depois[0], depois[1]]
+        direcao = 'DESC' if decrescente else 'ASC'
+        linhas = self.query(
+            f'SELECT {chave}, {COLUNAS_ALUNO} FROM alunos{where} '
+            f'ORDER BY {chave} {direcao}, id_matricula {direcao} LIMIT ?',
+            params + [limite]
+        )
+        return total, [((valor, aluno[0]), _aluno_payload(*aluno)) for valor, *aluno in linhas]
+
+    def iter_rows(self, filters, batch_size=10_000):
+        if self.meta is None:
+            return
+        where, params = _where(filters)
+        conexao = sqlite3.connect(f'file:{self.path}?mode=ro', uri=True)
+        try:
+            cursor = conexao.execute(f"SELECT {', '.join(COLUNAS_NOTAS)} FROM notas{where} ORDER BY rowid", params)
+            while lote := cursor.fetchmany(batch_size):
+                df = pd.DataFrame(lote, columns=COLUNAS_NOTAS)
+                df['id_nota'] = BigDataAnalytics._compact_id_nota(df['id_nota'])
+                df['vlr_nota'] = df['vlr_nota'].astype(np.float32)
+                metrics.add_rows(len(df))
+                yield df
+        finally:
+            conexao.close()
+
+    def columns(self):
+        return list(COLUNAS_NOTAS)
+
+    def dataset_size(self):
+        if self.meta is None:
+            return 0, 0
+        return int(self.meta['rows']), int(self.meta['students'])
+
+    def memory_bytes(self):
+        # Nenhuma tabela em memória: só o cache de páginas do SQLite
+        return 0
+
+
+class _SelecaoSql(_Selecao):
+    """
+    Seleção definida por uma cláusula WHERE
+
+    As primitivas saem de duas agregações SQL (cada uma uma passada pelas
+    linhas selecionadas): uma por disciplina, tipo de nota e classe fina
+    (totais, médias e histograma) e uma por aluno, resumida em status, faixas
+    presentes e filial (alunos, status e faixas). Só os grupos saem do banco.
+    Sem filtros, as duas vêm das tabelas materializadas na importação
+    (grupos e alunos), sem ler as linhas.
+    """
+
+    def __init__(self, engine, where, params):
+        super().__init__(engine)
+        self.where = where
+        self.params = params
+
+    def _query(self, sql):
+        return self.engine.query(sql, self.params)
+
+    @cached_property
+    def grupos(self):
+        linhas = self._query('SELECT * FROM grupos' if not self.where else GRUPOS_SQL.format(where=self.where))
+        return pd.DataFrame(
+            linhas, columns=COLUNAS_GRUPO + ['classe', 'n_linhas', 'soma', 'n_notas', 'maxima', 'minima']
+        )
+
+    @cached_property
+    def perfis(self):
+        if not self.where:
+            linhas = self._query('SELECT id_filial, status, faixas, COUNT(*) FROM alunos GROUP BY 1, 2, 3')
+        else:
+            linhas = self._query(
+                f'SELECT a.id_filial, s.status, s.faixas, COUNT(*) FROM ('
+                f'SELECT id_matricula, MAX(status) AS status, {FAIXAS_SQL} AS faixas FROM notas'
+                f'{_and(self.where, "id_matricula IS NOT NULL")} GROUP BY id_matricula'
+                f') s LEFT JOIN alunos a USING (id_matricula) GROUP BY a.id_filial, s.status, s.faixas'
+            )
+        return pd.DataFrame(linhas, columns=['id_filial', 'status', 'faixas', 'n_alunos'])
+
+    def totais(self):
+        grupos = self.grupos
+        n_notas = int(grupos['n_notas'].sum())
+        soma = float(grupos['soma'].sum())
+        return {
+            'n_linhas': int(grupos['n_linhas'].sum()),
+            'soma': soma,
+            'n_notas': n_notas,
+            'media': soma / n_notas if n_notas else np.nan,
+            'maxima': grupos['maxima'].max() if n_notas else np.nan,
+            'minima': grupos['minima'].min() if n_notas else np.nan
+        }
+
+    def somas_por(self, coluna):
+        if coluna in COLUNAS_GRUPO:
+            somas = self.grupos.groupby(coluna)[['n_linhas', 'soma', 'n_notas']].sum()
+        else:
+            somas = pd.DataFrame(self._query(
+                f'SELECT {coluna}, COUNT(*), TOTAL(vlr_nota), COUNT(vlr_nota) FROM notas'
+                f'{_and(self.where, f"{coluna} IS NOT NULL")} GROUP BY {coluna}'
+            ), columns=[coluna, 'n_linhas', 'soma', 'n_notas']).set_index(coluna).sort_index()
+        return _somas_presentes(
+            pd.Index(somas.index.tolist()),
+            somas['n_linhas'].to_numpy(dtype=np.int64),
+            somas['soma'].to_numpy(dtype=np.float64),
+            somas['n_notas'].to_numpy(dtype=np.int64)
+        )
+
+    def histograma(self):
+        classes = self.grupos.dropna(subset=['classe'])
+        return np.bincount(
+            classes['classe'].to_numpy(dtype=np.int64), weights=classes['n_linhas'], minlength=histogram.N_CLASSES
+        ).astype(np.int64)
+
+    def n_alunos(self):
+        return int(self.perfis['n_alunos'].sum())
+
+    def status_counts(self):
+        perfis = self.perfis.dropna(subset=['status'])
+        codigos = [STATUS_ALUNO.index(status) for status in perfis['status']]
+        return np.bincount(codigos, weights=perfis['n_alunos'], minlength=len(STATUS_ALUNO)).astype(np.int64)
+
+    def filial_status(self):
+        # Filial do aluno (tabela de alunos), não a de cada linha
+        perfis = self.perfis.dropna(subset=['id_filial', 'status'])
+        contagens = perfis.pivot_table(
+            index='id_filial', columns='status', values='n_alunos', aggfunc='sum', fill_value=0
+        )
+        contagens = contagens.reindex(columns=STATUS_ALUNO, fill_value=0).astype(np.int64)
+        contagens.index = pd.Index(contagens.index.tolist())
+        contagens.columns = pd.Index(STATUS_ALUNO)
+        return contagens
+
+    def alunos_por_faixa(self):
+        faixas = self.perfis['faixas'].to_numpy(dtype=np.int64)
+        alunos = self.perfis['n_alunos'].to_numpy(dtype=np.int64)
+        return np.array([alunos[(faixas >> i) & 1 == 1].sum() for i in range(len(ROTULOS_FAIXA))], dtype=np.int64)
@@ -0,0 +1,325 @@
+"""
+Agregação em fluxo (out-of-core) da tabela de notas
+O CSV é lido em blocos de tamanho fixo e cada bloco é reduzido a agregados
+parciais por aluno e por grupo, que são combinados entre os blocos; nenhuma
+tabela com todas as linhas fica em memória. A memória depende da quantidade
+de alunos e de grupos, não da quantidade de registros.
+"""
+import numpy as np
+import pandas as pd
+
+from . import histogram
+from .cube import OlapCube, _decode_keys, _histogram_lists, _sorted_unique
+
+
+def _resize(valores, tamanho, preenchimento):
+    """
+    Aumenta o array (primeiro eixo) até tamanho, preenchendo as novas posições
+    """
+    if len(valores) >= tamanho:
+        return valores
+    novo = np.full((tamanho,) + valores.shape[1:], preenchimento, dtype=valores.dtype)
+    novo[:len(valores)] = valores
+    return novo
+
+
+def _first_per_group(grupos):
+    """
+    Grupos presentes e a posição da primeira ocorrência de cada um
+    """
+    return np.unique(grupos, return_index=True)
+
+
+class Dictionary:
+    """
+    Dicionário de uma coluna categórica montado bloco a bloco
+
+    Os valores recebem ids provisórios em ordem de chegada; no fim o
+    dicionário é ordenado e os ids são traduzidos para os códigos finais
+    """
+
+    def __init__(self):
+        self.valores = pd.Index([], dtype=object)
+
+    def __len__(self):
+        return len(self.valores)
+
+    def codes(self, serie):
+        """
+        Ids provisórios das linhas de uma coluna categórica do bloco (-1 = nulo)
+        """
+        categorias = serie.cat.categories
+        posicao = self.valores.get_indexer(categorias)
+        novos = posicao < 0
+        if novos.any():
+            posicao[novos] = len(self.valores) + np.arange(np.count_nonzero(novos))
+            self.valores = self.valores.append(pd.Index(np.asarray(categorias[novos], dtype=object)))
+        codigos = serie.array.codes
+        return np.where(codigos >= 0, posicao.take(np.maximum(codigos, 0)), -1)
+
+    def finalize(self):
+        """
+        Ordena o dicionário (como na carga completa) e retorna as categorias;
+        posto passa a traduzir id provisório -> código final
+        """
+        valores = np.asarray(self.valores, dtype=object)
+        ordem = np.argsort(valores, kind='stable')
+        self.posto = np.empty(len(ordem), dtype=np.int64)
+        self.posto[ordem] = np.arange(len(ordem))
+        return valores[ordem]
+
+    def final_codes(self, serie):
+        """
+        Códigos finais das linhas de um bloco (após finalize)
+        """
+        codigos = self.codes(serie)
+        return np.where(codigos >= 0, self.posto.take(np.maximum(codigos, 0)), -1)
+
+
+class StudentPartials:
+    """
+    Parciais por aluno (ids provisórios) combináveis entre blocos: registros,
+    primeira nota MA, menor nota bimestral, primeira filial/série-turma e soma
+    e quantidade de notas por tipo de avaliação
+    """
+
+    def __init__(self):
+        self.total = np.zeros(0, dtype=np.int64)
+        self.tem_ma = np.zeros(0, dtype=bool)
+        self.nota_ma = np.zeros(0)
+        self.menor_mb = np.zeros(0)
+        self.filial = np.zeros(0, dtype=np.int64)
+        self.serie_turma = np.zeros(0, dtype=np.int64)
+        self.somas = np.zeros((0, 0))
+        self.contagens = np.zeros((0, 0), dtype=np.int64)
+
+    def _grow(self, n_alunos, n_tipos):
+        self.total = _resize(self.total, n_alunos, 0)
+        self.tem_ma = _resize(self.tem_ma, n_alunos, False)
+        self.nota_ma = _resize(self.nota_ma, n_alunos, np.nan)
+        self.menor_mb = _resize(self.menor_mb, n_alunos, np.nan)
+        self.filial = _resize(self.filial, n_alunos, -1)
+        self.serie_turma = _resize(self.serie_turma, n_alunos, -1)
+        if self.somas.shape[1] < n_tipos:
+            somas = np.zeros((len(self.somas), n_tipos))
+            contagens = np.zeros((len(self.somas), n_tipos), dtype=np.int64)
+            somas[:, :self.somas.shape[1]] = self.somas
+            contagens[:, :self.somas.shape[1]] = self.contagens
+            self.somas, self.contagens = somas, contagens
+        self.somas = _resize(self.somas, n_alunos, 0.0)
+        self.contagens = _resize(self.contagens, n_alunos, 0)
+
+    def add(self, alunos, notas, tipos, e_ma, e_mb, filial, serie_turma, n_alunos, n_tipos):
+        """
+        Combina um bloco (ids provisórios por linha, na ordem do arquivo)
+        """
+        self._grow(n_alunos, n_tipos)
+        validos = alunos >= 0
+        self.total += np.bincount(alunos[validos], minlength=n_alunos)
+
+        # Primeira nota MA: só vale para alunos sem MA nos blocos anteriores
+        linhas = np.flatnonzero(e_ma & validos)
+        presentes, primeira = _first_per_group(alunos[linhas])
+        novos = ~self.tem_ma[presentes]
+        self.nota_ma[presentes[novos]] = notas[linhas[primeira[novos]]]
+        self.tem_ma[presentes] = True
+
+        # Menor nota bimestral (fmin ignora NaN, como o min do groupby)
+        linhas = e_mb & validos
+        menores = pd.Series(notas[linhas]).groupby(alunos[linhas]).min()
+        indice = menores.index.to_numpy()
+        self.menor_mb[indice] = np.fmin(self.menor_mb[indice], menores.to_numpy())
+
+        # Primeiro valor não nulo de filial e série/turma
+        for atual, codigos in [(self.filial, filial), (self.serie_turma, serie_turma)]:
+            linhas = np.flatnonzero(validos & (codigos >= 0))
+            presentes, primeira = _first_per_group(alunos[linhas])
+            vazios = atual[presentes] < 0
+            atual[presentes[vazios]] = codigos[linhas[primeira[vazios]]]
+
+        # Soma e quantidade de notas por tipo de avaliação
+        com_nota = validos & (tipos >= 0) & ~np.isnan(notas)
+        largura = self.somas.shape[1]
+        chave = alunos[com_nota] * largura + tipos[com_nota]
+        tamanho = len(self.somas) * largura
+        self.somas += np.bincount(chave, weights=notas[com_nota], minlength=tamanho).reshape(-1, largura)
+        self.contagens += np.bincount(chave, minlength=tamanho).reshape(-1, largura)
+
+
+class CellPartials:
+    """
+    Agregados por célula (chave inteira da combinação de dimensões)
+    combinados entre blocos: linhas, notas válidas, soma, mínimo e máximo
+    """
+
+    def __init__(self):
+        self.chaves = np.zeros(0, dtype=np.int64)
+        self.n_linhas = np.zeros(0)
+        self.n_notas = np.zeros(0)
+        self.soma = np.zeros(0)
+        self.minimo = np.zeros(0)
+        self.maximo = np.zeros(0)
+
+    def add(self, chaves, notas):
+        validas = ~np.isnan(notas)
+        todas = np.concatenate([self.chaves, chaves])
+        chaves_unicas, inverso = np.unique(todas, return_inverse=True)
+        atuais, novas = inverso[:len(self.chaves)], inverso[len(self.chaves):]
+        n = len(chaves_unicas)
+
+        # Chaves atuais são distintas: os parciais vão direto para a nova posição
+        n_linhas, n_notas, soma = np.zeros(n), np.zeros(n), np.zeros(n)
+        minimo, maximo = np.full(n, np.nan), np.full(n, np.nan)
+        for novo, atual in [(n_linhas, self.n_linhas), (n_notas, self.n_notas), (soma, self.soma),
+                            (minimo, self.minimo), (maximo, self.maximo)]:
+            novo[atuais] = atual
+
+        n_linhas += np.bincount(novas, minlength=n)
+        n_notas += np.bincount(novas[validas], minlength=n)
+        soma += np.bincount(novas[validas], weights=notas[validas], minlength=n)
+        np.fmin.at(minimo, novas[validas], notas[validas])
+        np.fmax.at(maximo, novas[validas], notas[validas])
+
+        self.chaves = chaves_unicas
+        self.n_linhas, self.n_notas, self.soma = n_linhas, n_notas, soma
+        self.minimo, self.maximo = minimo, maximo
+
+
+class HistogramPartials:
+    """
+    Histogramas finos das notas por célula combinados entre blocos: contagem
+    de cada par (chave da célula, classe) presente
+    """
+
+    def __init__(self):
+        self.chaves = np.zeros(0, dtype=np.int64)
+        self.contagens = np.zeros(0, dtype=np.int64)
+
+    def add(self, chaves, notas):
+        classes = histogram.fine_bins(notas)
+        validas = classes >= 0
+        pares = chaves[validas] * histogram.N_CLASSES + classes[validas]
+        todas, inverso = np.unique(np.concatenate([self.chaves, pares]), return_inverse=True)
+        pesos = np.concatenate([self.contagens, np.ones(len(pares), dtype=np.int64)])
+        self.contagens = np.bincount(inverso, weights=pesos, minlength=len(todas)).astype(np.int64)
+        self.chaves = todas
+
+
+class PresencePartials:
+    """
+    Presença de cada aluno nas combinações das dimensões de linha (bitset por
+    aluno: bit i = combinação i)
+
+    Linhas cuja filial ou série/turma difere da do aluno (raro) são guardadas
+    à parte como pares (chave da célula, aluno), para que a contagem de alunos
+    distintos continue exata
+    """
+
+    def __init__(self, n_alunos, n_combinacoes):
+        self.presenca = np.zeros((n_alunos, (n_combinacoes + 63) // 64), dtype=np.uint64)
+        self._irregulares = []
+
+    def add(self, alunos, combinacoes, regulares, chaves):
+        linhas = regulares & (alunos >= 0)
+        combinacoes = combinacoes[linhas]
+        np.bitwise_or.at(
+            self.presenca,
+            (alunos[linhas], combinacoes // 64),
+            np.left_shift(np.uint64(1), (combinacoes % 64).astype(np.uint64))
+        )
+        linhas = ~regulares & (alunos >= 0)
+        if linhas.any():
+            self._irregulares.append((chaves[linhas], alunos[linhas]))
+
+    def irregular_pairs(self, n_alunos):
+        """
+        Pares (chave, aluno) distintos das linhas irregulares
+        """
+        if not self._irregulares:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        chaves = np.concatenate([c for c, _ in self._irregulares])
+        alunos = np.concatenate([a for _, a in self._irregulares])
+        pares = _sorted_unique(chaves * n_alunos + alunos)
+        return pares // n_alunos, pares % n_alunos
+
+
+class StreamingCube(OlapCube):
+    """
+    Cubo montado a partir dos parciais do modo em fluxo
+
+    Os agregados de notas vêm das células (mesma interface do OlapCube). Os
+    alunos distintos vêm das dimensões do aluno (filial, série/turma, status)
+    combinadas com o bitset de presença nas dimensões de linha, mais os pares
+    das linhas irregulares
+    """
+
+    def __init__(self, dim_names, cardinalidades, celulas, student_dims, row_dims, presenca, irregulares, histogramas):
+        self.dim_names = list(dim_names)
+        self.cardinalidades = [int(c) + 1 for c in cardinalidades]
+        self.student_dims = []
+        self.n_alunos = len(presenca.presenca)
+
+        codigos = _decode_keys(celulas.chaves, self.cardinalidades)
+        self.cells = {d: c for d, c in zip(self.dim_names, codigos)}
+        self.n_linhas = celulas.n_linhas.astype(np.int64)
+        self.n_notas = celulas.n_notas.astype(np.int64)
+        self.soma, self.minimo, self.maximo = celulas.soma, celulas.minimo, celulas.maximo
+        self.hist_classes, self.hist_contagens, self.hist_offsets = _histogram_lists(
+            np.searchsorted(celulas.chaves, histogramas.chaves // histogram.N_CLASSES),
+            histogramas.chaves % histogram.N_CLASSES, histogramas.contagens, len(celulas.chaves)
+        )
+
+        self.alunos_dims = student_dims
+        self.row_dims = list(row_dims)
+        self.presenca = presenca.presenca
+        chaves, self.irregulares_alunos = irregulares
+        self.irregulares_celulas = np.searchsorted(celulas.chaves, chaves)
+
+    def nbytes(self):
+        arrays = [self.n_linhas, self.n_notas, self.soma, self.minimo, self.maximo,
+                  self.presenca, self.irregulares_celulas, self.irregulares_alunos,
+                  self.hist_classes, self.hist_contagens, self.hist_offsets]
+        arrays += list(self.cells.values()) + list(self.alunos_dims.values())
+        return int(sum(a.nbytes for a in arrays))
+
+    def _row_combinations(self, filtros):
+        """
+        Máscara (palavras de 64 bits) das combinações das dimensões de linha
+        compatíveis com os filtros
+        """
+        formato = [self.cardinalidades[self.dim_names.index(d)] for d in self.row_dims]
+        combinacoes = np.ones(formato, dtype=bool)
+        for eixo, dim in enumerate(self.row_dims):
+            if dim in filtros:
+                fatia = [slice(None)] * len(formato)
+                fatia[eixo] = np.arange(formato[eixo]) != filtros[dim] + 1
+                combinacoes[tuple(fatia)] = False
+        bits = np.packbits(combinacoes.reshape(-1), bitorder='little')
+        bits = np.pad(bits, (0, self.presenca.shape[1] * 8 - len(bits)))
+        return bits.view(np.uint64)
+
+    def _students_mask(self, filtros, celulas):
+        mascara = (self.presenca & self._row_combinations(filtros)).any(axis=1)
+        for dim, codigo in filtros.items():
+            if dim in self.alunos_dims:
+                mascara &= self.alunos_dims[dim] == codigo
+        if len(self.irregulares_alunos):
+            selecionadas = np.zeros(self.n_cells, dtype=bool)
+            selecionadas[celulas] = True
+            mascara[self.irregulares_alunos[selecionadas[self.irregulares_celulas]]] = True
+        return mascara
+
+    def distinct_students(self, filtros, celulas=None):
+        if celulas is None:
+            celulas = self.select(filtros)
+        return np.flatnonzero(self._students_mask(filtros, celulas))
+
+    def distinct_students_by(self, filtros, dim, celulas=None):
+        n = self.cardinalidades[self.dim_names.index(dim)] - 1
+        contagens = np.zeros(n, dtype=np.int64)
+        for codigo in range(n):
+            filtros_valor = dict(filtros, **{dim: codigo})
+            contagens[codigo] = np.count_nonzero(
+                self._students_mask(filtros_valor, self.select(filtros_valor))
+            )
+        return contagens
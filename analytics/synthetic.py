@@ -0,0 +1,80 @@
+"""
+Gerador determinístico de CSVs sintéticos no formato do arquivo de notas
+Usado pelos benchmarks: o arquivo é escrito em blocos de alunos, então a
+memória não depende da quantidade de linhas pedida
+"""
+import numpy as np
+import pandas as pd
+
+
+COLUNAS = [
+    'id_nota', 'id_matricula', 'vlr_nota', 'id_filial',
+    'titulo_turma', 'nome_serie', 'nome_disciplina', 'tipo_nota_aval'
+]
+
+# Valores com os mesmos espaços extras encontrados no arquivo real
+SERIES = ['6º Ano', '7º Ano', '8º Ano', '9º Ano', '1ª Série', '2ª Série ', '3ª Série ']
+TURMAS = ['A', 'B', 'C', 'D', 'E ']
+DISCIPLINAS = [
+    'Matemática', 'Português ', 'História', 'Geografia', 'Ciências',
+    'Inglês', 'Arte', 'Educação Física', 'Física', 'Química', 'Biologia', ' Filosofia'
+]
+TIPOS_NOTA = ['Mb1', 'Mb2', 'Mb3', 'Mb4', 'MA']
+N_FILIAIS = 30
+
+# Linhas por aluno: todas as disciplinas em todos os tipos de nota
+LINHAS_POR_ALUNO = len(DISCIPLINAS) * len(TIPOS_NOTA)
+
+# Alunos por bloco escrito (~1,2 milhão de linhas)
+ALUNOS_POR_BLOCO = 20_000
+
+
+def _bloco(indice, primeiro_aluno, n_alunos, primeira_linha, seed):
+    """
+    Linhas de n_alunos alunos a partir de primeiro_aluno, embaralhadas
+    (cada bloco tem seu próprio gerador: o conteúdo não depende de quantos
+    blocos são gerados)
+    """
+    rng = np.random.default_rng([seed, indice])
+    alunos = np.arange(primeiro_aluno, primeiro_aluno + n_alunos)
+    filial = rng.integers(1, N_FILIAIS + 1, n_alunos)
+    serie = rng.integers(len(SERIES), size=n_alunos)
+    turma = rng.integers(len(TURMAS), size=n_alunos)
+    desempenho = rng.normal(7.0, 1.2, n_alunos)
+
+    por_aluno = np.repeat(np.arange(n_alunos), LINHAS_POR_ALUNO)
+    combinacao = np.tile(np.arange(LINHAS_POR_ALUNO), n_alunos)
+    notas = np.clip(desempenho[por_aluno] + rng.normal(0, 1.3, len(por_aluno)), 0, 10).round(1)
+    notas[rng.random(len(notas)) < 0.01] = np.nan
+
+    n_linhas = len(por_aluno)
+    ordem = rng.permutation(n_linhas)
+    return pd.DataFrame({
+        'id_nota': np.arange(primeira_linha + 1, primeira_linha + n_linhas + 1)[ordem],
+        'id_matricula': (100_000 + alunos)[por_aluno][ordem],
+        'vlr_nota': notas[ordem],
+        'id_filial': filial[por_aluno][ordem],
+        'titulo_turma': pd.Categorical.from_codes(turma[por_aluno][ordem], TURMAS),
+        'nome_serie': pd.Categorical.from_codes(serie[por_aluno][ordem], SERIES),
+        'nome_disciplina': pd.Categorical.from_codes((combinacao // len(TIPOS_NOTA))[ordem], DISCIPLINAS),
+        'tipo_nota_aval': pd.Categorical.from_codes((combinacao % len(TIPOS_NOTA))[ordem], TIPOS_NOTA)
+    }, columns=COLUNAS)
+
+
+def generate_csv(caminho, n_linhas, seed=0):
+    """
+    Escreve um CSV sintético com exatamente n_linhas registros
+
+    O mesmo (n_linhas, seed) gera sempre o mesmo arquivo. Retorna a
+    quantidade de alunos.
+    """
+    n_alunos = -(-n_linhas // LINHAS_POR_ALUNO)
+    escritas = 0
+    with open(caminho, 'w', encoding='utf-8', newline='') as f:
+        f.write(','.join(COLUNAS) + '\n')
+        for indice, primeiro in enumerate(range(0, n_alunos, ALUNOS_POR_BLOCO)):
+            bloco = _bloco(indice, primeiro, min(ALUNOS_POR_BLOCO, n_alunos - primeiro), escritas, seed)
+            bloco = bloco.iloc[:n_linhas - escritas]
+            bloco.to_csv(f, header=False, index=False, lineterminator='\n')
+            escritas += len(bloco)
+    return n_alunos
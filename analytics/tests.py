@@ -0,0 +1,1883 @@
+"""
+Testes do processador de dados
+Executar com: python manage.py test analytics
+"""
+import asyncio
+import gzip
+import io
+import json
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import unittest
+from html.parser import HTMLParser
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+from django.test import AsyncClient, SimpleTestCase, override_settings
+from django.urls import reverse
+
+from . import approx, benchmark, data_processor, drilldown, export, histogram, ingest, metrics, responses, snapshot, sqlstore, synthetic, views
+from .data_processor import BigDataAnalytics, COLUNAS_FILTRO
+from .executor import BoundedExecutor
+from .partitions import PartitionedAnalytics
+from .sqlstore import SqliteAnalytics
+
+
+def gerar_csv_amostra(caminho, n_alunos=300, seed=42):
+    """
+    Gera um CSV sintético no mesmo formato do arquivo de notas
+    (inclui espaços extras, notas ausentes e alunos sem MA)
+    """
+    rng = np.random.default_rng(seed)
+    disciplinas = ['Matemática', 'Português ', ' História', 'Ciências']
+    tipos = ['Mb1', 'Mb2', 'Mb3', 'Mb4', 'MA']
+    series = ['1ª Série', '2ª Série ', '6º Ano']
+    turmas = ['A', 'B ', 'C']
+
+    linhas = []
+    id_nota = 1
+    for aluno in range(n_alunos):
+        filial = str(rng.integers(1, 6))
+        serie = series[rng.integers(len(series))]
+        turma = turmas[rng.integers(len(turmas))]
+        for disciplina in disciplinas:
+            for tipo in tipos:
+                if rng.random() < 0.05:
+                    continue
+                nota = round(float(np.clip(rng.normal(7.2, 1.6), 0, 10)), 1)
+                if rng.random() < 0.01:
+                    nota = np.nan
+                linhas.append({
+                    'id_nota': str(id_nota),
+                    'id_matricula': str(50000 + aluno * 3),
+                    'vlr_nota': nota,
+                    'id_filial': filial,
+                    'titulo_turma': turma,
+                    'nome_serie': serie,
+                    'nome_disciplina': disciplina,
+                    'tipo_nota_aval': tipo
+                })
+                id_nota += 1
+
+    df = pd.DataFrame(linhas).sample(frac=1, random_state=seed)
+    df.to_csv(caminho, index=False)
+    return df
+
+
+def status_referencia(df):
+    """
+    Implementação de referência (laço por aluno) das regras de status
+    """
+    status = {}
+    for id_matricula, grupo in df.groupby('id_matricula'):
+        nota_ma = grupo[grupo['tipo_nota_aval'] == 'MA']['vlr_nota']
+        bimestrais = grupo[grupo['tipo_nota_aval'].isin(['Mb1', 'Mb2', 'Mb3', 'Mb4'])]['vlr_nota']
+        if len(nota_ma) > 0 and nota_ma.iloc[0] < 6:
+            status[id_matricula] = 'Reprovado'
+        elif len(bimestrais) > 0 and (bimestrais < 6).any():
+            status[id_matricula] = 'Recuperação'
+        else:
+            status[id_matricula] = 'Aprovado'
+    return status
+
+
+def particionar_csv(csv_path, raiz):
+    """
+    Um CSV por filial sob raiz; a filial 1 também por ano (matrícula par em
+    2023, ímpar em 2024)
+    """
+    bruto = pd.read_csv(csv_path, dtype=str, keep_default_na=False)
+    for filial, grupo in bruto.groupby('id_filial'):
+        if filial == '1':
+            # Matrículas de anos diferentes são diferentes
+            ano = np.where(grupo['id_matricula'].astype(int) % 2 == 0, '2023', '2024')
+            for valor in ('2023', '2024'):
+                destino = os.path.join(raiz, 'id_filial=1', f'ano={valor}')
+                os.makedirs(destino)
+                grupo[ano == valor].to_csv(os.path.join(destino, 'notas.csv'), index=False)
+        else:
+            destino = os.path.join(raiz, f'id_filial={filial}')
+            os.makedirs(destino)
+            grupo.to_csv(os.path.join(destino, 'notas.csv'), index=False)
+
+
+class BigDataAnalyticsTestCase(SimpleTestCase):
+    """
+    Carrega o processador sobre um CSV sintético temporário
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        cls.csv_path = os.path.join(cls.tmpdir.name, 'notas.csv')
+        cls.snapshot_dir = os.path.join(cls.tmpdir.name, 'snapshot')
+        gerar_csv_amostra(cls.csv_path)
+        cls.settings_override = override_settings(
+            CSV_DATA_PATH=cls.csv_path,
+            ANALYTICS_SNAPSHOT_DIR=cls.snapshot_dir
+        )
+        cls.settings_override.enable()
+        cls.engine = BigDataAnalytics()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        cls.tmpdir.cleanup()
+        super().tearDownClass()
+
+
+class StudentStatusTests(BigDataAnalyticsTestCase):
+
+    def test_status_igual_ao_laco_por_aluno(self):
+        df = self.engine.df
+        esperado = status_referencia(df)
+        obtido = df.groupby('id_matricula', observed=True)['status'].agg(['first', 'nunique'])
+
+        self.assertEqual(len(obtido), len(esperado))
+        self.assertTrue((obtido['nunique'] == 1).all())
+        for id_matricula, linha in obtido.iterrows():
+            self.assertEqual(linha['first'], esperado[id_matricula], id_matricula)
+
+    def test_todos_os_status_presentes(self):
+        self.assertEqual(
+            set(self.engine.df['status'].unique()),
+            {'Aprovado', 'Recuperação', 'Reprovado'}
+        )
+
+
+class CompactStorageTests(BigDataAnalyticsTestCase):
+
+    def test_colunas_codificadas(self):
+        df = self.engine.df
+        for coluna in ['id_matricula', 'id_filial', 'serie_turma', 'nome_disciplina',
+                       'tipo_nota_aval', 'status']:
+            self.assertIsInstance(df[coluna].dtype, pd.CategoricalDtype, coluna)
+        self.assertEqual(df['vlr_nota'].dtype, np.float32)
+        self.assertNotIn('status_aluno', df.columns)
+
+    def test_limpeza_e_serie_turma(self):
+        df = self.engine.df
+        self.assertIn('Português', df['nome_disciplina'].cat.categories)
+        self.assertNotIn('Português ', df['nome_disciplina'].cat.categories)
+        esperado = df['nome_serie'].astype(str) + ' - ' + df['titulo_turma'].astype(str)
+        self.assertTrue((df['serie_turma'].astype(str) == esperado).all())
+
+    def test_memory_report(self):
+        report = self.engine.memory_report()
+        self.assertEqual(report['total_registros'], len(self.engine.df))
+        self.assertLess(report['bytes_por_registro_compacto'], report['bytes_por_registro_original'])
+
+
+class SnapshotTests(BigDataAnalyticsTestCase):
+
+    def test_snapshot_recarregado_sem_csv(self):
+        manifest = snapshot.read_manifest(self.snapshot_dir)
+        self.assertTrue(snapshot.is_fresh(manifest, self.csv_path))
+
+        engine = BigDataAnalytics()
+        self.assertTrue(engine.df.equals(self.engine.df))
+        # Colunas numéricas vêm direto do arquivo mapeado, sem cópia
+        base = engine.df['vlr_nota'].to_numpy()
+        while base is not None and not isinstance(base, np.memmap):
+            base = base.base
+        self.assertIsInstance(base, np.memmap)
+
+    def test_snapshot_desatualizado_e_reconstruido(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            csv_path = os.path.join(tmp, 'notas.csv')
+            snapshot_dir = os.path.join(tmp, 'snapshot')
+            gerar_csv_amostra(csv_path, n_alunos=20)
+            with override_settings(CSV_DATA_PATH=csv_path, ANALYTICS_SNAPSHOT_DIR=snapshot_dir):
+                antes = BigDataAnalytics()
+
+                # Mesmo conteúdo com mtime diferente continua válido (hash)
+                os.utime(csv_path, ns=(0, 0))
+                self.assertTrue(snapshot.is_fresh(snapshot.read_manifest(snapshot_dir), csv_path))
+                # ... e o mtime novo fica no manifesto: a próxima carga não relê o CSV
+                self.assertEqual(snapshot.read_manifest(snapshot_dir)['source']['mtime_ns'], 0)
+                with mock.patch.object(snapshot, 'content_hash', wraps=snapshot.content_hash) as hash_csv:
+                    self.assertTrue(BigDataAnalytics().df.equals(antes.df))
+                hash_csv.assert_not_called()
+
+                # Linhas novas invalidam o snapshot
+                with open(csv_path, 'a', encoding='utf-8') as f:
+                    f.write('999999,50000,9.5,1,A,1ª Série,Matemática,Mb1\n')
+                self.assertFalse(snapshot.is_fresh(snapshot.read_manifest(snapshot_dir), csv_path))
+
+                depois = BigDataAnalytics()
+                self.assertEqual(len(depois.df), len(antes.df) + 1)
+                self.assertTrue(snapshot.is_fresh(snapshot.read_manifest(snapshot_dir), csv_path))
+
+
+    def test_limpeza_preserva_gravacao_em_andamento(self):
+        with tempfile.TemporaryDirectory() as snapshot_dir:
+            df = self.engine.df.head(10)
+            versoes = [
+                snapshot.save_snapshot(df, snapshot_dir, {'size': n, 'mtime_ns': 0, 'hash': f'h{n}'})['path']
+                for n in range(2)
+            ]
+            # Outro processo gravando (ainda sem manifesto) e partições no mesmo diretório
+            em_andamento = tempfile.mkdtemp(prefix='0000000002-h-', dir=snapshot_dir)
+            particoes = os.path.join(snapshot_dir, 'particoes', 'id_filial=1')
+            os.makedirs(particoes)
+
+            ultima = snapshot.save_snapshot(df, snapshot_dir, {'size': 2, 'mtime_ns': 0, 'hash': 'h2'})['path']
+            self.assertFalse(os.path.exists(versoes[0]))
+            for caminho in (versoes[1], ultima, em_andamento, particoes):
+                self.assertTrue(os.path.isdir(caminho), caminho)
+            self.assertEqual(snapshot.read_manifest(snapshot_dir)['path'], ultima)
+
+
+class FilterIndexTests(BigDataAnalyticsTestCase):
+
+    def filtrar_por_mascara(self, filters):
+        df = self.engine.df
+        mascara = np.ones(len(df), dtype=bool)
+        for coluna, valor in filters.items():
+            mascara &= (df[coluna] == valor).to_numpy()
+        return df[mascara]
+
+    def test_filtros_iguais_a_varredura(self):
+        valores = self.engine.get_unique_values()
+        combinacoes = [
+            {'id_filial': valores['filiais'][0]},
+            {'serie_turma': valores['series_turmas'][1], 'status': 'Recuperação'},
+            {'id_filial': valores['filiais'][1], 'nome_disciplina': 'Matemática', 'tipo_nota_aval': 'MA'},
+            {'id_filial': valores['filiais'][2], 'serie_turma': valores['series_turmas'][0],
+             'nome_disciplina': 'História', 'tipo_nota_aval': 'Mb1', 'status': 'Aprovado'},
+        ]
+        for filters in combinacoes:
+            esperado = self.filtrar_por_mascara(filters)
+            obtido = self.engine.filter_data(filters)
+            self.assertTrue(obtido.equals(esperado), filters)
+
+    def test_sem_filtros_e_valor_inexistente(self):
+        self.assertIs(self.engine.filter_data({}), self.engine.df)
+        self.assertTrue(self.engine.filter_data({'id_filial': 'nao-existe'}).empty)
+
+
+class StudentTableTests(BigDataAnalyticsTestCase):
+
+    def test_uma_linha_por_aluno(self):
+        df = self.engine.df
+        students = self.engine.students
+        self.assertEqual(len(students), df['id_matricula'].nunique())
+
+        primeiro = df.groupby('id_matricula', observed=True)[['id_filial', 'serie_turma', 'status']].first()
+        tabela = students.set_index('id_matricula').loc[primeiro.index]
+        for coluna in ['id_filial', 'serie_turma', 'status']:
+            self.assertEqual(tabela[coluna].astype(str).tolist(), primeiro[coluna].astype(str).tolist())
+
+    def test_media_por_tipo(self):
+        df = self.engine.df
+        esperado = (
+            df.assign(vlr_nota=df['vlr_nota'].astype(np.float64))
+            .pivot_table(index='id_matricula', columns='tipo_nota_aval', values='vlr_nota',
+                         aggfunc='mean', observed=True)
+        )
+        tabela = self.engine.students.set_index('id_matricula').loc[esperado.index]
+        for tipo in ['Mb1', 'Mb2', 'Mb3', 'Mb4', 'MA']:
+            np.testing.assert_allclose(tabela[tipo].to_numpy(), esperado[tipo].to_numpy())
+
+    def test_contagem_de_alunos_unicos(self):
+        filters = {'id_filial': self.engine.get_unique_values()['filiais'][0]}
+        df_filtered = self.engine.filter_data(filters)
+        statistics = self.engine.get_statistics(df_filtered)
+        por_status = df_filtered.groupby('id_matricula', observed=True)['status'].first().value_counts()
+
+        self.assertEqual(statistics['total_alunos'], df_filtered['id_matricula'].nunique())
+        self.assertEqual(statistics['aprovados'], por_status.get('Aprovado', 0))
+        self.assertEqual(statistics['recuperacao'], por_status.get('Recuperação', 0))
+        self.assertEqual(statistics['reprovados'], por_status.get('Reprovado', 0))
+
+
+class QueryCacheTests(BigDataAnalyticsTestCase):
+
+    def setUp(self):
+        self.engine.query_cache.clear()
+        patcher = mock.patch.object(views, 'analytics_engine', self.engine)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, url, payload, **headers):
+        return self.client.post(url, json.dumps(payload), content_type='application/json', **headers)
+
+    def test_resultado_em_cache(self):
+        filters = {'id_filial': self.engine.get_unique_values()['filiais'][0]}
+        antes = self.engine.cache_stats()
+        primeiro = self.engine.get_chart_payload(filters, 'status_alunos')
+        segundo = self.engine.get_chart_payload(dict(filters, status=''), 'status_alunos')
+        depois = self.engine.cache_stats()
+
+        self.assertIs(primeiro, segundo)
+        self.assertEqual(depois['misses'] - antes['misses'], 1)
+        self.assertEqual(depois['hits'] - antes['hits'], 1)
+
+    def test_cache_lru_limitado(self):
+        cache = self.engine.query_cache.__class__(max_entries=2, ttl=None)
+        for chave in 'abc':
+            cache.set(chave, chave)
+        self.assertEqual(cache.get('a'), (False, None))
+        self.assertEqual(cache.get('c'), (True, 'c'))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_consultas_simultaneas_coalescidas(self):
+        liberar = threading.Event()
+        chamadas = []
+        evaluate = self.engine.evaluate
+
+        def evaluate_lento(*args, **kwargs):
+            chamadas.append(args)
+            liberar.wait(10)
+            return evaluate(*args, **kwargs)
+
+        filters = {'tipo_nota_aval': 'MA'}
+        antes = self.engine.cache_stats()['coalesced']
+        resultados = []
+        with mock.patch.object(self.engine, 'evaluate', evaluate_lento):
+            threads = [
+                threading.Thread(target=lambda: resultados.append(self.engine.get_chart_payload(filters, 'status_alunos')))
+                for _ in range(4)
+            ]
+            for thread in threads:
+                thread.start()
+            while self.engine.cache_stats()['coalesced'] - antes < 3:
+                threading.Event().wait(0.01)
+            liberar.set()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(chamadas), 1)
+        self.assertEqual(len(resultados), 4)
+        self.assertTrue(all(r is resultados[0] for r in resultados))
+
+    def test_erro_compartilhado_sem_cache(self):
+        cache = self.engine.query_cache.__class__(max_entries=0, ttl=None)
+        comecou, liberar = threading.Event(), threading.Event()
+        erros = []
+
+        def falha():
+            comecou.set()
+            liberar.wait(10)
+            raise ValueError('falhou')
+
+        def consulta():
+            try:
+                cache.get_or_compute('k', falha)
+            except ValueError as erro:
+                erros.append(erro)
+
+        lider = threading.Thread(target=consulta)
+        lider.start()
+        comecou.wait(10)
+        seguidor = threading.Thread(target=consulta)
+        seguidor.start()
+        while cache.stats()['coalesced'] < 1:
+            threading.Event().wait(0.01)
+        liberar.set()
+        lider.join()
+        seguidor.join()
+
+        self.assertEqual(len(erros), 2)
+        self.assertIs(erros[0], erros[1])
+        # Sem cálculo em andamento, a próxima consulta calcula de novo
+        self.assertEqual(cache.get_or_compute('k', lambda: 1), 1)
+
+    def test_recarga_invalida_cache(self):
+        self.engine.get_chart_payload({}, 'status_alunos')
+        self.assertEqual(self.engine.cache_stats()['entries'], 1)
+        self.engine._load_data()
+        self.assertEqual(self.engine.cache_stats()['entries'], 0)
+
+    def test_etag_e_304(self):
+        payload = {'chart_type': 'media_por_disciplina', 'tipo_nota_aval': 'MA'}
+        for url in [reverse('analytics:chart_data'), reverse('analytics:generate_report')]:
+            response = self.post(url, payload)
+            self.assertEqual(response.status_code, 200)
+            etag = response['ETag']
+
+            response = self.post(url, payload, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response['ETag'], etag)
+
+            response = self.post(url, dict(payload, tipo_nota_aval='Mb1'), HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+
+
+CHART_TYPES = [
+    'distribuicao_notas', 'comparacao_filiais', 'media_por_disciplina', 'status_alunos', 'notas_por_tipo',
+    'alunos_por_faixa'
+]
+
+
+def combinacoes_de_filtros(engine):
+    valores = engine.get_unique_values()
+    return [
+        {},
+        {'id_filial': valores['filiais'][0]},
+        {'serie_turma': valores['series_turmas'][1], 'status': 'Recuperação'},
+        {'nome_disciplina': 'Matemática'},
+        {'id_filial': valores['filiais'][1], 'tipo_nota_aval': 'MA', 'status': 'Reprovado'},
+        {'id_filial': valores['filiais'][2], 'serie_turma': valores['series_turmas'][0],
+         'nome_disciplina': 'História', 'tipo_nota_aval': 'Mb1'},
+        {'id_filial': 'nao-existe'},
+    ]
+
+
+def como_json(payload):
+    """
+    Payload como o cliente o recebe (arrays NumPy viram listas)
+    """
+    return json.loads(responses.dumps(payload))
+
+
+class OlapCubeTests(BigDataAnalyticsTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        with override_settings(ANALYTICS_CUBE_MODE=True):
+            cls.cube_engine = BigDataAnalytics()
+
+    def test_cubo_igual_as_linhas(self):
+        self.assertIsNotNone(self.cube_engine.cube)
+        for filters in combinacoes_de_filtros(self.engine):
+            df_filtered = self.engine.filter_data(filters)
+            esperado_stats = self.engine.get_statistics(df_filtered)
+            for chart_type in CHART_TYPES:
+                esperado = self.engine.aggregate_data(df_filtered, chart_type)
+                obtido = self.cube_engine.get_chart_payload(filters, chart_type)
+                self.assertEqual(obtido['chart_data']['labels'], esperado['labels'], (filters, chart_type))
+                np.testing.assert_allclose(obtido['chart_data']['data'], esperado['data'], atol=0.011)
+                for chave, valor in esperado_stats.items():
+                    self.assertAlmostEqual(obtido['statistics'][chave], valor, delta=0.011, msg=chave)
+            self.assertEqual(
+                como_json(self.cube_engine.get_facets(filters)), como_json(self.engine.get_facets(filters)), filters
+            )
+
+
+class FusedEvaluationTests(BigDataAnalyticsTestCase):
+
+    def setUp(self):
+        self.engine.query_cache.clear()
+        patcher = mock.patch.object(views, 'analytics_engine', self.engine)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_avaliacao_fundida_igual_as_chamadas_separadas(self):
+        for filters in combinacoes_de_filtros(self.engine):
+            df_filtered = self.engine.filter_data(filters)
+            resultado = self.engine.evaluate(filters, CHART_TYPES)
+            self.assertEqual(resultado['statistics'], self.engine.get_statistics(df_filtered))
+            for chart_type in CHART_TYPES:
+                self.assertEqual(
+                    como_json(resultado['charts'][chart_type]),
+                    como_json(self.engine.aggregate_data(df_filtered, chart_type)),
+                    (filters, chart_type)
+                )
+
+    def test_media_por_disciplina_pela_media_sem_arredondar(self):
+        for filters in combinacoes_de_filtros(self.engine):
+            df_filtered = self.engine.filter_data(filters)
+            if df_filtered is None or df_filtered.empty:
+                continue
+            medias = df_filtered.groupby('nome_disciplina', observed=True)['vlr_nota'].mean().dropna()
+            chart = self.engine.evaluate(filters, ['media_por_disciplina'])['charts']['media_por_disciplina']
+            self.assertEqual(list(chart['labels']), medias.sort_values(ascending=False).index.tolist(), filters)
+
+    def test_endpoint_em_lote(self):
+        payload = {'id_filial': self.engine.get_unique_values()['filiais'][0]}
+        response = self.client.post(
+            reverse('analytics:chart_data_batch'), json.dumps(payload), content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertTrue(data['success'])
+        self.assertEqual(sorted(data['charts']), sorted(CHART_TYPES))
+
+        for chart_type in CHART_TYPES:
+            individual = self.client.post(
+                reverse('analytics:chart_data'),
+                json.dumps(dict(payload, chart_type=chart_type)),
+                content_type='application/json'
+            ).json()
+            self.assertEqual(data['charts'][chart_type], individual['chart_data'])
+            self.assertEqual(data['statistics'], individual['statistics'])
+
+        response = self.client.post(
+            reverse('analytics:chart_data_batch'), json.dumps(payload),
+            content_type='application/json', HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, 304)
+
+
+class HotReloadTests(SimpleTestCase):
+    """
+    Linhas anexadas ao CSV são incorporadas sem recarregar o arquivo inteiro
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.csv_path = os.path.join(self.tmp.name, 'notas.csv')
+        gerar_csv_amostra(self.csv_path, n_alunos=60)
+        with open(self.csv_path, 'rb') as f:
+            self.linhas = f.read().splitlines(keepends=True)
+
+        # Começa com parte do arquivo; o restante é anexado nos testes
+        self.corte = len(self.linhas) * 2 // 3
+        with open(self.csv_path, 'wb') as f:
+            f.writelines(self.linhas[:self.corte])
+
+        override = override_settings(
+            CSV_DATA_PATH=self.csv_path,
+            ANALYTICS_SNAPSHOT_DIR=os.path.join(self.tmp.name, 'snapshot'),
+            ANALYTICS_RELOAD_INTERVAL=0
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        self.engine = BigDataAnalytics()
+
+    def anexar(self, dados):
+        with open(self.csv_path, 'ab') as f:
+            f.write(dados)
+
+    def assertIgualCargaCompleta(self, engine):
+        with override_settings(ANALYTICS_SNAPSHOT_DIR=None):
+            completo = BigDataAnalytics()
+        self.assertTrue(engine.df.equals(completo.df))
+        self.assertTrue(engine.students.equals(completo.students))
+        self.assertEqual(engine.dataset_version, completo.dataset_version)
+        for filters in combinacoes_de_filtros(completo):
+            self.assertEqual(
+                como_json(engine.evaluate(filters, CHART_TYPES)),
+                como_json(completo.evaluate(filters, CHART_TYPES))
+            )
+
+    def test_linhas_anexadas_incorporadas(self):
+        # A última linha ainda está sendo gravada (sem '\n'): fica para depois
+        self.anexar(b''.join(self.linhas[self.corte:-1]) + self.linhas[-1][:5])
+        novo = self.engine.refresh()
+        self.assertIsNot(novo, self.engine)
+        self.assertEqual(len(self.engine.df), self.corte - 1)
+        self.assertEqual(len(novo.df), len(self.linhas) - 2)
+
+        # Completa a linha e traz aluno, filial e disciplina novos
+        self.anexar(
+            self.linhas[-1][5:]
+            + '900001,999999,4.5,77,Z,9ª Série,Astronomia,MA\n'.encode('utf-8')
+            + '900002,50000,3.0,1,A,1ª Série,Matemática,MA\n'.encode('utf-8')
+        )
+        novo = novo.refresh()
+        self.assertEqual(len(novo.df), len(self.linhas) + 1)
+        self.assertIgualCargaCompleta(novo)
+
+        esperado = status_referencia(novo.df)
+        for id_matricula, status in zip(novo.students['id_matricula'], novo.students['status']):
+            self.assertEqual(status, esperado[id_matricula])
+
+    def test_sem_mudanca_retorna_mesma_instancia(self):
+        self.assertIs(self.engine.refresh(), self.engine)
+        os.utime(self.csv_path)
+        self.assertIs(self.engine.refresh(), self.engine)
+
+    def test_arquivo_reescrito_recarrega_tudo(self):
+        with open(self.csv_path, 'wb') as f:
+            f.writelines(self.linhas[:self.corte // 2])
+        novo = self.engine.refresh()
+        self.assertEqual(len(novo.df), self.corte // 2 - 1)
+        self.assertIgualCargaCompleta(novo)
+
+    def test_linha_alterada_sem_mudar_tamanho(self):
+        antes = self.engine.get_chart_payload({}, 'status_alunos')['statistics']
+        # Troca uma nota no início do arquivo por outra de mesmo tamanho
+        with open(self.csv_path, 'rb') as f:
+            conteudo = f.read()
+        inicio = conteudo.index(b'\n') + 1
+        linha = conteudo[inicio:conteudo.index(b'\n', inicio)]
+        campos = linha.split(b',')
+        campos[2] = b'0.0' if campos[2] != b'0.0' else b'9.9'
+        alterada = b','.join(campos)
+        self.assertEqual(len(alterada), len(linha))
+        with open(self.csv_path, 'wb') as f:
+            f.write(conteudo[:inicio] + alterada + conteudo[inicio + len(linha):])
+
+        novo = self.engine.refresh()
+        self.assertIsNot(novo, self.engine)
+        self.assertNotEqual(novo.dataset_version, self.engine.dataset_version)
+        self.assertNotEqual(novo.get_chart_payload({}, 'status_alunos')['statistics'], antes)
+        self.assertIgualCargaCompleta(novo)
+
+        # Um processo novo também vê outra versão (ETags e cache não valem mais)
+        with override_settings(ANALYTICS_SNAPSHOT_DIR=None):
+            self.assertEqual(BigDataAnalytics().dataset_version, novo.dataset_version)
+
+    def test_snapshot_desatualizado_aproveitado(self):
+        self.anexar(b''.join(self.linhas[self.corte:]))
+        engine = BigDataAnalytics()
+        self.assertEqual(len(engine.df), len(self.linhas) - 1)
+        self.assertIgualCargaCompleta(engine)
+        self.assertTrue(snapshot.is_fresh(snapshot.read_manifest(engine.snapshot_dir), self.csv_path))
+
+    def test_view_troca_o_processador(self):
+        with mock.patch.object(views, 'analytics_engine', self.engine):
+            self.anexar(b''.join(self.linhas[self.corte:]))
+            response = self.client.post(
+                reverse('analytics:chart_data_batch'), '{}', content_type='application/json'
+            )
+            self.assertIsNot(views.analytics_engine, self.engine)
+            self.assertEqual(
+                response.json()['statistics']['total_registros'],
+                len(self.linhas) - 1
+            )
+
+
+class StreamingModeTests(BigDataAnalyticsTestCase):
+    """
+    Modo em fluxo: blocos pequenos para forçar vários blocos por passagem
+    """
+
+    def carregar_em_fluxo(self):
+        with override_settings(ANALYTICS_STREAMING_MODE=True, ANALYTICS_STREAMING_CHUNK_ROWS=700,
+                               ANALYTICS_SNAPSHOT_DIR=None):
+            return BigDataAnalytics()
+
+    def test_fluxo_igual_em_memoria(self):
+        engine = self.carregar_em_fluxo()
+        self.assertTrue(engine.df.empty)
+        self.assertTrue(engine.students.equals(self.engine.students))
+        self.assertEqual(engine.get_unique_values(), self.engine.get_unique_values())
+        for filters in combinacoes_de_filtros(self.engine):
+            self.assertEqual(
+                como_json(engine.evaluate(filters, CHART_TYPES)),
+                como_json(self.engine.evaluate(filters, CHART_TYPES)),
+                filters
+            )
+            self.assertEqual(como_json(engine.get_facets(filters)), como_json(self.engine.get_facets(filters)))
+
+    def test_aluno_em_mais_de_uma_filial(self):
+        # Linhas com filial diferente da do aluno continuam contadas com exatidão
+        with tempfile.TemporaryDirectory() as tmp:
+            csv_path = os.path.join(tmp, 'notas.csv')
+            gerar_csv_amostra(csv_path, n_alunos=40)
+            with open(csv_path, 'a', encoding='utf-8') as f:
+                f.write('900001,50000,2.0,9,C,6º Ano,Matemática,Mb3\n')
+                f.write('900002,50003,7.0,,A,1ª Série,Ciências,MA\n')
+            with override_settings(CSV_DATA_PATH=csv_path, ANALYTICS_SNAPSHOT_DIR=None):
+                em_memoria = BigDataAnalytics()
+                engine = self.carregar_em_fluxo()
+
+            self.assertEqual(len(engine.cube.irregulares_alunos), 2)
+            for filters in combinacoes_de_filtros(em_memoria) + [{'id_filial': '9'}]:
+                self.assertEqual(
+                    como_json(engine.evaluate(filters, CHART_TYPES)),
+                    como_json(em_memoria.evaluate(filters, CHART_TYPES)),
+                    filters
+                )
+                self.assertEqual(como_json(engine.get_facets(filters)), como_json(em_memoria.get_facets(filters)))
+
+
+class ParallelParseTests(BigDataAnalyticsTestCase):
+    """
+    Leitura paralela: intervalos pequenos para forçar várias partes
+    """
+
+    def test_intervalos_alinhados_em_linhas(self):
+        tamanho = os.path.getsize(self.csv_path)
+        with mock.patch.object(ingest, 'MIN_RANGE_BYTES', 1):
+            intervalos = ingest.split_ranges(self.csv_path, tamanho, 7)
+        self.assertEqual(len(intervalos), 7)
+        self.assertEqual(intervalos[0][0], 0)
+        self.assertEqual(intervalos[-1][1], tamanho)
+        with open(self.csv_path, 'rb') as f:
+            for (_, fim), (inicio, _) in zip(intervalos, intervalos[1:]):
+                self.assertEqual(fim, inicio)
+                f.seek(inicio - 1)
+                self.assertEqual(f.read(1), b'\n')
+
+    def test_leitura_paralela_igual_a_serial(self):
+        for workers in (2, 3):
+            with mock.patch.object(ingest, 'MIN_RANGE_BYTES', 1), \
+                    override_settings(ANALYTICS_CSV_WORKERS=workers, ANALYTICS_SNAPSHOT_DIR=None):
+                engine = BigDataAnalytics()
+            self.assertTrue(engine.df.equals(self.engine.df), workers)
+            self.assertEqual(list(engine.df.dtypes), list(self.engine.df.dtypes))
+            self.assertTrue(engine.students.equals(self.engine.students), workers)
+
+
+class ParallelAggregationTests(BigDataAnalyticsTestCase):
+    """
+    Agregação map-reduce no pool de processos (grupos de filiais)
+    """
+
+    def test_paralela_igual_a_serial(self):
+        with override_settings(ANALYTICS_PARALLEL_WORKERS=3, ANALYTICS_PARALLEL_MIN_ROWS=0):
+            engine = BigDataAnalytics()
+        self.addCleanup(data_processor.shutdown_parallel_pool)
+        grupos, _ = engine._parallel_groups()
+        self.assertEqual(len(grupos), 3)
+        self.assertEqual(sorted(sum(grupos, [])), [-1, 0, 1, 2, 3, 4])
+
+        # Cada processo mapeia só as linhas do seu grupo de filiais
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        engine.snapshot_dir = tmp.name
+        caminhos = engine._parallel_partitions()
+        self.assertEqual(len(caminhos), 3)
+        particoes = [data_processor._MapEngine(caminho) for caminho in caminhos]
+        self.assertEqual(sum(len(particao.df) for particao in particoes), len(engine.df))
+        for particao, grupo in zip(particoes, grupos):
+            self.assertLess(len(particao.df), len(engine.df))
+            self.assertEqual(particao.dataset_version, engine.dataset_version)
+            filiais = particao.students['id_filial'].array.codes.take(particao.df['id_matricula'].array.codes)
+            self.assertTrue(set(filiais.tolist()) <= set(grupo))
+
+        consultas = metrics.REGISTRY.counter('analytics_parallel_queries_total')
+        for filters in combinacoes_de_filtros(self.engine):
+            self.assertEqual(
+                como_json(engine.evaluate(filters, CHART_TYPES)),
+                como_json(self.engine.evaluate(filters, CHART_TYPES)),
+                filters
+            )
+        # Filial inexistente não vai para o pool
+        self.assertEqual(metrics.REGISTRY.counter('analytics_parallel_queries_total') - consultas, 6)
+
+        # Abaixo do mínimo de linhas, o caminho serial
+        engine.parallel_min_rows = len(engine.df) + 1
+        engine.evaluate({}, ['status_alunos'])
+        self.assertEqual(metrics.REGISTRY.counter('analytics_parallel_queries_total') - consultas, 6)
+
+
+class SharedDatasetTests(SimpleTestCase):
+    """
+    Modo compartilhado: workers anexam a versão publicada pelo carregador
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.csv_path = os.path.join(self.tmp.name, 'notas.csv')
+        gerar_csv_amostra(self.csv_path, n_alunos=60)
+        override = override_settings(
+            CSV_DATA_PATH=self.csv_path,
+            ANALYTICS_SNAPSHOT_DIR=os.path.join(self.tmp.name, 'snapshot'),
+            ANALYTICS_RELOAD_INTERVAL=0
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        self.carregador = BigDataAnalytics()
+        self.carregador.publish()
+
+    def anexar_worker(self):
+        # O worker nunca lê o CSV
+        with override_settings(ANALYTICS_SHARED_DATASET=True), \
+                mock.patch.object(ingest, 'read_csv_range', side_effect=AssertionError('CSV lido')):
+            return BigDataAnalytics()
+
+    def test_worker_anexa_sem_copia(self):
+        worker = self.anexar_worker()
+        self.assertEqual(worker.shared_version, snapshot.current_version(worker.snapshot_dir))
+        self.assertEqual(worker.dataset_version, self.carregador.dataset_version)
+        self.assertTrue(worker.df.equals(self.carregador.df))
+        self.assertTrue(worker.students.equals(self.carregador.students))
+        for coluna, postings in self.carregador._index.items():
+            np.testing.assert_array_equal(worker._index[coluna]['ordem'], postings['ordem'])
+            np.testing.assert_array_equal(worker._index[coluna]['offsets'], postings['offsets'])
+
+        # Arrays mapeados somente leitura
+        self.assertFalse(worker.df['vlr_nota'].to_numpy().flags.writeable)
+        self.assertFalse(worker._index['id_filial']['ordem'].flags.writeable)
+        for filters in combinacoes_de_filtros(self.carregador):
+            self.assertEqual(
+                como_json(worker.evaluate(filters, CHART_TYPES)),
+                como_json(self.carregador.evaluate(filters, CHART_TYPES))
+            )
+
+    def test_worker_troca_de_versao(self):
+        worker = self.anexar_worker()
+        self.assertIs(worker.refresh(), worker)
+
+        with open(self.csv_path, 'a', encoding='utf-8') as f:
+            f.write('900001,999999,4.5,77,Z,9ª Série,Astronomia,MA\n')
+        carregador = self.carregador.refresh()
+        self.assertEqual(carregador.publish()['version'], worker.shared_version + 1)
+
+        with mock.patch.object(ingest, 'read_csv_range', side_effect=AssertionError('CSV lido')):
+            novo = worker.refresh()
+        self.assertEqual(novo.shared_version, worker.shared_version + 1)
+        self.assertNotEqual(novo.dataset_version, worker.dataset_version)
+        self.assertEqual(len(novo.df), len(worker.df) + 1)
+        self.assertTrue(novo.students.equals(carregador.students))
+
+
+class AsyncViewTests(BigDataAnalyticsTestCase):
+    """
+    Views assíncronas com o processamento no executor limitado
+    """
+
+    def setUp(self):
+        patcher = mock.patch.object(views, 'analytics_engine', self.engine)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_executor_lotado_responde_503(self):
+        executor = BoundedExecutor(max_workers=1, max_pending=0)
+        liberar = threading.Event()
+        executor.submit(liberar.wait)
+        with mock.patch.object(views, '_executor', executor):
+            response = self.client.post(reverse('analytics:chart_data'), '{}', content_type='application/json')
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response['Retry-After'], str(views.RETRY_AFTER))
+            self.assertFalse(response.json()['success'])
+
+            liberar.set()
+            executor._pool.submit(lambda: None).result()
+            response = self.client.post(reverse('analytics:chart_data'), '{}', content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(executor.stats()['rejected'], 1)
+
+    def test_requisicoes_simultaneas(self):
+        filtros = combinacoes_de_filtros(self.engine)
+
+        async def consultar():
+            client = AsyncClient()
+            return await asyncio.gather(*(
+                client.post(reverse('analytics:chart_data_batch'), json.dumps(f), content_type='application/json')
+                for f in filtros
+            ))
+
+        with mock.patch.object(views, '_executor', BoundedExecutor(max_workers=3, max_pending=len(filtros))):
+            respostas = asyncio.run(consultar())
+        for f, response in zip(filtros, respostas):
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                response.json()['charts'],
+                como_json(self.engine.get_batch_payload(f, CHART_TYPES)['charts'])
+            )
+
+
+def scripts_inline(html):
+    """
+    Conteúdo dos <script> sem src de uma página renderizada
+    """
+    return re.findall(r'<script>(.*?)</script>', html, flags=re.S)
+
+
+class ElementosDaPagina(HTMLParser):
+    """
+    Elementos com id (selects com as opções e inputs) de uma página
+    renderizada, no formato do DOM mínimo de dashboard_harness.js
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.elementos = []
+        self._select = None
+        self._opcao = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'option' and self._select is not None:
+            self._opcao = {'tag': 'option', 'value': attrs.get('value', ''), 'textContent': ''}
+            self._select['options'].append(self._opcao)
+            if 'selected' in attrs:
+                self._select['value'] = self._opcao['value']
+            return
+        if 'id' not in attrs:
+            return
+        elemento = {'tag': tag, 'id': attrs['id']}
+        if tag == 'input':
+            elemento.update(type=attrs.get('type', 'text'), name=attrs.get('name', ''),
+                            value=attrs.get('value', ''), checked='checked' in attrs)
+        if tag == 'select':
+            elemento['options'] = []
+            self._select = elemento
+        self.elementos.append(elemento)
+
+    def handle_endtag(self, tag):
+        if tag == 'select':
+            if self._select['options'] and not any(o['value'] == self._select.get('value') for o in self._select['options']):
+                self._select['value'] = self._select['options'][0]['value']
+            self._select = None
+        elif tag == 'option':
+            self._opcao = None
+
+    def handle_data(self, data):
+        if self._opcao is not None:
+            self._opcao['textContent'] += data.strip()
+
+
+@unittest.skipUnless(shutil.which('node'), 'node não instalado')
+class DashboardScriptTests(BigDataAnalyticsTestCase):
+    """
+    JavaScript do dashboard executado no node com um DOM mínimo
+    (dashboard_harness.js): as requisições do script vão para as views reais
+    """
+
+    def executar(self, cenario, engine=None):
+        """
+        Renderiza o dashboard, executa o script e depois o cenário (corpo de
+        uma função async com acesso a helpers) e retorna o que ele retornar
+        """
+        engine = engine or self.engine
+        patcher = mock.patch.object(views, 'analytics_engine', engine)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        html = self.client.get(reverse('analytics:dashboard')).content.decode()
+        elementos = ElementosDaPagina()
+        elementos.feed(html)
+        self.requisicoes = []
+        self.status = []
+        with tempfile.TemporaryDirectory() as tmp:
+            caminho = os.path.join(tmp, 'pagina.json')
+            with open(caminho, 'w', encoding='utf-8') as f:
+                json.dump({'script': scripts_inline(html)[0], 'elementos': elementos.elementos, 'cenario': cenario}, f)
+            harness = os.path.join(os.path.dirname(__file__), 'dashboard_harness.js')
+            processo = subprocess.Popen(
+                ['node', harness, caminho], stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True
+            )
+            try:
+                for linha in processo.stdout:
+                    mensagem = json.loads(linha)
+                    if 'fetch' not in mensagem:
+                        break
+                    processo.stdin.write(json.dumps(self.responder(mensagem)) + '\n')
+                    processo.stdin.flush()
+            finally:
+                processo.stdin.close()
+                processo.wait(timeout=10)
+        self.assertNotIn('erro', mensagem, mensagem.get('erro'))
+        return mensagem['resultado']
+
+    def responder(self, mensagem):
+        self.requisicoes.append((mensagem['fetch'], json.loads(mensagem['body'])))
+        extras = {}
+        if 'If-None-Match' in mensagem['headers']:
+            extras['HTTP_IF_NONE_MATCH'] = mensagem['headers']['If-None-Match']
+        response = self.client.generic(
+            mensagem['method'], mensagem['fetch'], mensagem['body'], content_type='application/json', **extras
+        )
+        self.status.append(response.status_code)
+        corpo = None if response.status_code == 304 else response.json()
+        return {'status': response.status_code, 'headers': {'etag': response.get('ETag')}, 'body': corpo}
+
+    def test_facetas_nos_filtros(self):
+        filial = self.engine.get_unique_values()['filiais'][0]
+        resultado = self.executar(f"""
+            const campos = ['id_filial', 'serie_turma', 'nome_disciplina', 'tipo_nota_aval', 'status'];
+            const opcoes = () => Object.fromEntries(campos.map(campo => [campo, helpers.opcoes(campo)]));
+            await helpers.carregarPagina();
+            await helpers.selecionar('id_filial', '{filial}');
+            const filtradas = opcoes();
+            clearFilters();
+            await helpers.ocioso();
+            return {{
+                filtradas: filtradas, limpas: opcoes(), graficos: helpers.graficos(),
+                alertas: helpers.alertas(), erros: helpers.erros()
+            }};
+        """)
+        self.assertEqual((resultado['alertas'], resultado['erros']), ([], []))
+        self.assertEqual(len(resultado['graficos']), 1)
+        self.assertIn(('/api/facets/', {
+            'ano': '', 'id_filial': filial, 'serie_turma': '', 'nome_disciplina': '', 'tipo_nota_aval': '', 'status': ''
+        }), self.requisicoes)
+        # Limpar os filtros repete a consulta sem filtros da carga (304, resposta guardada)
+        self.assertEqual(self.status[-1], 304)
+        for filtros, chave in (({'id_filial': filial}, 'filtradas'), ({}, 'limpas')):
+            facetas = self.engine.get_facets(filtros)
+            for campo, opcoes in resultado[chave].items():
+                alunos = dict(zip(facetas[campo]['valores'], facetas[campo]['total_alunos'].tolist()))
+                for opcao in opcoes[1:]:
+                    self.assertEqual(opcao['disabled'], opcao['value'] not in alunos, opcao)
+                    if opcao['value'] in alunos:
+                        self.assertTrue(opcao['text'].endswith(f" ({alunos[opcao['value']]} alunos)"), opcao)
+
+    def test_modo_aproximado_e_impressao_exata(self):
+        with override_settings(ANALYTICS_APPROX_SAMPLE_RATE=0.3, ANALYTICS_APPROX_MIN_STUDENTS=0,
+                               ANALYTICS_SNAPSHOT_DIR=None):
+            engine = BigDataAnalytics()
+        resultado = self.executar("""
+            await helpers.carregarPagina();
+            const exato = helpers.html('statistics');
+            const tooltipExato = helpers.tooltip(0, 0);
+            document.getElementById('approximate').checked = true;
+            await loadChartData();
+            const aproximado = helpers.html('statistics');
+            const tooltips = [helpers.tooltip(0, 0)];
+            await helpers.marcar('chart_media_disciplina');
+            tooltips.push(helpers.tooltip(0, 0));
+            await helpers.marcar('chart_status');
+            tooltips.push(helpers.tooltip(0, 1));
+            await printReport();
+            await helpers.esperar(300);
+            return {
+                exato: exato, aproximado: aproximado, depois: helpers.html('statistics'),
+                tooltipExato: tooltipExato, tooltips: tooltips,
+                impressos: helpers.impressos(), alertas: helpers.alertas(), erros: helpers.erros()
+            };
+        """, engine)
+        self.assertEqual((resultado['alertas'], resultado['erros']), ([], []))
+        self.assertNotIn('±', resultado['exato'])
+        self.assertEqual(resultado['aproximado'].count('±'), 6)
+        # Tooltips do gráfico com a margem de cada valor (um gráfico agrupado e dois simples)
+        self.assertNotIn('±', resultado['tooltipExato'])
+        charts = engine.evaluate({}, ['comparacao_filiais', 'media_por_disciplina', 'status_alunos'], approximate=True)['charts']
+        esperados = [
+            (charts['comparacao_filiais']['datasets'][0]['label'], charts['comparacao_filiais']['datasets'][0]['erro'][0]),
+            (charts['media_por_disciplina']['title'], charts['media_por_disciplina']['erro'][0]),
+            (charts['status_alunos']['labels'][1], charts['status_alunos']['erro'][1]),
+        ]
+        for tooltip, (rotulo, erro) in zip(resultado['tooltips'], esperados):
+            self.assertTrue(tooltip.startswith(f'{rotulo}: '), tooltip)
+            self.assertTrue(tooltip.endswith(f" ± {str(erro).replace('.', ',')}"), (tooltip, erro))
+        # A impressão refaz a consulta exata e mostra os números exatos
+        lotes = [corpo for url, corpo in self.requisicoes if url == '/api/chart-data/batch/']
+        self.assertEqual([corpo['approximate'] for corpo in lotes], [False, True, False])
+        self.assertEqual(resultado['depois'], resultado['exato'])
+        estatisticas = engine.evaluate({}, [])['statistics']
+        self.assertEqual(len(resultado['impressos']), 1)
+        impresso = resultado['impressos'][0]
+        self.assertNotIn('±', impresso)
+        self.assertIn(f"{estatisticas['total_registros']:,}".replace(',', '.'), impresso)
+        self.assertIn(f"<div class=\"stat-value\">{estatisticas['reprovados']}</div>", impresso)
+
+    def test_filtro_de_ano_no_dataset_particionado(self):
+        raiz = os.path.join(self.tmpdir.name, 'particoes-dashboard')
+        particionar_csv(self.csv_path, raiz)
+        self.addCleanup(shutil.rmtree, raiz)
+        with override_settings(ANALYTICS_PARTITION_DIR=raiz):
+            engine = PartitionedAnalytics()
+        resultado = self.executar("""
+            await helpers.carregarPagina();
+            await helpers.selecionar('ano', '2024');
+            await loadChartData();
+            await printReport();
+            await helpers.esperar(300);
+            return {
+                anos: helpers.opcoes('ano'), filiais: helpers.opcoes('id_filial'), estatisticas: helpers.html('statistics'),
+                impressos: helpers.impressos(), alertas: helpers.alertas(), erros: helpers.erros()
+            };
+        """, engine)
+        self.assertEqual((resultado['alertas'], resultado['erros']), ([], []))
+        self.assertEqual([opcao['value'] for opcao in resultado['anos']], ['', '2023', '2024'])
+        self.assertEqual(self.requisicoes[-2][0], '/api/facets/')
+        self.assertEqual(self.requisicoes[-2][1]['ano'], '2024')
+        self.assertEqual(self.requisicoes[-1][0], '/api/chart-data/batch/')
+        self.assertEqual(self.requisicoes[-1][1]['ano'], '2024')
+
+        # Facetas, estatísticas e relatório só com as matrículas de 2024 na filial 1
+        facetas = engine.get_facets({'ano': '2024'})
+        alunos = dict(zip(facetas['id_filial']['valores'], facetas['id_filial']['total_alunos'].tolist()))
+        for opcao in resultado['filiais'][1:]:
+            self.assertTrue(opcao['text'].endswith(f" ({alunos[opcao['value']]} alunos)"), opcao)
+        self.assertLess(alunos['1'], self.engine.get_facets({})['id_filial']['total_alunos'][0])
+        total = engine.evaluate({'ano': '2024'}, [])['statistics']['total_alunos']
+        self.assertIn(f'<p>{total}</p>', resultado['estatisticas'])
+        self.assertIn('<span class="info-label">Ano Letivo:</span> 2024', resultado['impressos'][0])
+
+    def test_largura_das_faixas_da_distribuicao(self):
+        resultado = self.executar("""
+            await helpers.carregarPagina();
+            await helpers.marcar('chart_distribuicao');
+            const padrao = helpers.graficos().pop();
+            await helpers.selecionar('bin_width', '0.5');
+            await printReport();
+            await helpers.esperar(300);
+            return {
+                padrao: padrao, fina: helpers.graficos().pop(), titulo: helpers.texto('chartTitle'),
+                impressos: helpers.impressos(), alertas: helpers.alertas(), erros: helpers.erros()
+            };
+        """)
+        self.assertEqual((resultado['alertas'], resultado['erros']), ([], []))
+        self.assertEqual(resultado['padrao']['labels'], ['0-2', '2-4', '4-6', '6-8', '8-10'])
+        # Trocar a largura refaz a consulta em lote com bin_width
+        self.assertEqual([corpo['bin_width'] for url, corpo in self.requisicoes if url == '/api/chart-data/batch/'], ['2', '0.5'])
+        chart = self.engine.get_chart_payload({}, 'distribuicao_notas', histogram_options=histogram.options('0.5'))['chart_data']
+        self.assertEqual(resultado['fina']['labels'], chart['labels'])
+        self.assertEqual(len(chart['labels']), 20)
+        self.assertEqual(resultado['titulo'], chart['title'])
+        self.assertIn('mediana', resultado['titulo'])
+        self.assertEqual(resultado['impressos'][0].count('<tr><td>'), 20)
+
+    def test_script_sem_erro_de_sintaxe(self):
+        with mock.patch.object(views, 'analytics_engine', self.engine):
+            html = self.client.get(reverse('analytics:dashboard')).content.decode()
+        scripts = scripts_inline(html)
+        self.assertTrue(scripts)
+        with tempfile.TemporaryDirectory() as tmp:
+            for i, script in enumerate(scripts):
+                caminho = os.path.join(tmp, f'script{i}.js')
+                with open(caminho, 'w', encoding='utf-8') as f:
+                    f.write(script)
+                resultado = subprocess.run(['node', '--check', caminho], capture_output=True, text=True)
+                self.assertEqual(resultado.returncode, 0, resultado.stderr)
+
+
+class ExportTests(BigDataAnalyticsTestCase):
+    """
+    Exportação em streaming das linhas filtradas pelo generate_report
+    """
+
+    def setUp(self):
+        for alvo, valor in [('analytics_engine', self.engine), ('EXPORT_BATCH_ROWS', 97)]:
+            patcher = mock.patch.object(views, alvo, valor)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def exportar(self, corpo):
+        async def baixar():
+            response = await AsyncClient().post(
+                reverse('analytics:generate_report'), json.dumps(corpo), content_type='application/json'
+            )
+            blocos = [bloco async for bloco in response.streaming_content]
+            return response, blocos
+        return asyncio.run(baixar())
+
+    def test_csv_igual_a_filter_data(self):
+        for filters in combinacoes_de_filtros(self.engine):
+            response, blocos = self.exportar({**filters, 'export': 'csv'})
+            self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+            esperado = self.engine.filter_data(filters)
+            self.assertGreater(len(blocos), len(esperado) // 97)
+            lido = pd.read_csv(io.BytesIO(b''.join(blocos)), dtype=str, keep_default_na=False)
+            self.assertEqual(list(lido.columns), list(esperado.columns))
+            self.assertEqual(lido['id_nota'].tolist(), esperado['id_nota'].astype(str).tolist())
+            self.assertEqual(lido['status'].tolist(), esperado['status'].astype(str).tolist())
+            np.testing.assert_array_equal(
+                pd.to_numeric(lido['vlr_nota']).to_numpy(dtype=np.float32), esperado['vlr_nota'].to_numpy()
+            )
+
+    def test_ndjson_com_gzip(self):
+        filters = {'nome_disciplina': 'Matemática'}
+        response, blocos = self.exportar({**filters, 'export': 'ndjson', 'gzip': True})
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('relatorio.ndjson.gz', response['Content-Disposition'])
+        linhas = gzip.decompress(b''.join(blocos)).decode('utf-8').splitlines()
+        esperado = self.engine.filter_data(filters)
+        self.assertEqual(len(linhas), len(esperado))
+        primeira = json.loads(linhas[0])
+        self.assertEqual(primeira['id_matricula'], esperado['id_matricula'].iloc[0])
+        self.assertEqual(primeira['vlr_nota'], float(str(esperado['vlr_nota'].iloc[0])))
+
+    def test_wsgi_recebe_gerador_sincrono(self):
+        filters = {'id_filial': self.engine.get_unique_values()['filiais'][0]}
+        lidos = []
+        iter_rows = self.engine.iter_rows
+
+        def contar_lotes(*args):
+            for lote in iter_rows(*args):
+                lidos.append(len(lote))
+                yield lote
+
+        with mock.patch.object(self.engine, 'iter_rows', contar_lotes):
+            response = self.client.post(
+                reverse('analytics:generate_report'), json.dumps({**filters, 'export': 'csv'}),
+                content_type='application/json'
+            )
+            self.assertFalse(response.is_async)
+            blocos = iter(response.streaming_content)
+            # Cabeçalho sem ler linhas; cada bloco seguinte lê um lote
+            cabecalho = next(blocos)
+            self.assertEqual(lidos, [])
+            primeiro = next(blocos)
+            self.assertEqual(len(lidos), 1)
+            corpo = cabecalho + primeiro + b''.join(blocos)
+        self.assertGreater(len(lidos), 1)
+        lido = pd.read_csv(io.BytesIO(corpo), dtype=str, keep_default_na=False)
+        self.assertEqual(len(lido), len(self.engine.filter_data(filters)))
+
+    def test_formato_invalido(self):
+        response = self.client.post(
+            reverse('analytics:generate_report'), json.dumps({'export': 'xml'}), content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.json()['success'])
+
+
+class ResponseEncodingTests(BigDataAnalyticsTestCase):
+    """
+    Serialização dos payloads com arrays NumPy e compressão negociada
+    """
+
+    def setUp(self):
+        patcher = mock.patch.object(views, 'analytics_engine', self.engine)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_arrays_e_nan(self):
+        payload = {'data': np.array([1.5, np.nan]), 'n': np.int64(3), 'labels': ['Matemática']}
+        esperado = {'data': [1.5, None], 'n': 3, 'labels': ['Matemática']}
+        self.assertEqual(json.loads(responses.dumps(payload)), esperado)
+        with mock.patch.object(responses, 'orjson', None):
+            self.assertEqual(json.loads(responses.dumps(payload)), esperado)
+
+    def test_compressao_negociada(self):
+        url = reverse('analytics:chart_data_batch')
+        simples = self.client.post(url, '{}', content_type='application/json')
+        self.assertNotIn('Content-Encoding', simples)
+        self.assertIn('Accept-Encoding', simples['Vary'])
+
+        with mock.patch.object(responses, 'brotli', None):
+            comprimida = self.client.post(
+                url, '{}', content_type='application/json', HTTP_ACCEPT_ENCODING='br;q=1.0, gzip;q=0.5'
+            )
+        self.assertEqual(comprimida['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(comprimida.content)), simples.json())
+        self.assertEqual(comprimida['ETag'], f"W/{simples['ETag']}")
+
+        # O ETag fraco da resposta comprimida também valida o cache do navegador
+        response = self.client.post(
+            url, '{}', content_type='application/json',
+            HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=comprimida['ETag']
+        )
+        self.assertEqual(response.status_code, 304)
+
+
+class MetricsTests(BigDataAnalyticsTestCase):
+    """
+    Tempos por etapa (Server-Timing) e endpoint de métricas do Prometheus
+    """
+
+    def setUp(self):
+        patcher = mock.patch.object(views, 'analytics_engine', self.engine)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.engine.query_cache.clear()
+
+    def consultar(self, **corpo):
+        return self.client.post(reverse('analytics:chart_data'), json.dumps(corpo), content_type='application/json')
+
+    def test_server_timing(self):
+        response = self.consultar(chart_type='status_alunos', id_filial='1')
+        etapas = dict(
+            re.fullmatch(r'(\w+);dur=([\d.]+)', parte).groups()
+            for parte in response['Server-Timing'].split(', ')
+        )
+        self.assertEqual(list(etapas), ['filter', 'aggregate', 'stats', 'total'])
+        self.assertLessEqual(
+            sum(float(etapas[e]) for e in metrics.ETAPAS_CONSULTA), float(etapas['total'])
+        )
+
+        # Resultado do cache: nenhuma etapa de consulta executada
+        response = self.consultar(chart_type='status_alunos', id_filial='1')
+        self.assertRegex(response['Server-Timing'], r'^total;dur=[\d.]+$')
+
+    def test_endpoint_de_metricas(self):
+        chave = {'endpoint': 'chart_data', 'chart_type': 'status_alunos'}
+        antes = metrics.REGISTRY.histogram('analytics_request_duration_seconds', **chave) or (0, 0.0)
+        linhas_antes = metrics.REGISTRY.counter('analytics_rows_scanned_total')
+        self.consultar(chart_type='status_alunos')
+        self.consultar(chart_type='tipo_inexistente')
+
+        self.assertEqual(metrics.REGISTRY.histogram('analytics_request_duration_seconds', **chave)[0], antes[0] + 1)
+        self.assertEqual(
+            metrics.REGISTRY.counter('analytics_rows_scanned_total') - linhas_antes, 2 * len(self.engine.df)
+        )
+
+        response = self.client.get(reverse('analytics:metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        texto = response.content.decode('utf-8')
+        for linha in texto.splitlines():
+            if not linha.startswith('#'):
+                self.assertRegex(linha, r'^[a-z_]+(\{[a-z_]+="[^"]*"(,[a-z_]+="[^"]*")*\})? [-+\w.]+$')
+        self.assertIn(
+            'analytics_request_duration_seconds_bucket{chart_type="outro",endpoint="chart_data",le="+Inf"}', texto
+        )
+        self.assertIn('analytics_load_duration_seconds{stage="total"}', texto)
+        self.assertIn(f'analytics_dataset_rows {len(self.engine.df)}', texto)
+        self.assertIn(f"analytics_query_cache_misses_total {self.engine.query_cache.stats()['misses']}", texto)
+
+    def test_corpo_invalido_rotulado(self):
+        for endpoint, nome in (('chart_data', 'chart_data'), ('batch', 'chart_data_batch'), ('facets', 'facets')):
+            chave = {'endpoint': endpoint, 'chart_type': 'invalid'}
+            antes = (metrics.REGISTRY.histogram('analytics_request_duration_seconds', **chave) or (0, 0.0))[0]
+            url = reverse(f'analytics:{nome}')
+            for corpo in ('{nao e json', '[1, 2]'):
+                response = self.client.post(url, corpo, content_type='application/json')
+                self.assertEqual(response.status_code, 400)
+                self.assertFalse(response.json()['success'])
+            self.assertEqual(
+                metrics.REGISTRY.histogram('analytics_request_duration_seconds', **chave)[0], antes + 2, endpoint
+            )
+            if endpoint != 'facets':
+                # Nenhuma requisição de gráfico fica sem rótulo
+                self.assertIsNone(
+                    metrics.REGISTRY.histogram('analytics_request_duration_seconds', endpoint=endpoint, chart_type='')
+                )
+
+    def test_tempos_e_erro_da_carga(self):
+        self.assertGreater(self.engine.load_timings['total'], 0)
+        self.assertLessEqual(set(self.engine.load_timings), {
+            'read', 'clean', 'parse', 'status', 'index', 'snapshot', 'append', 'save_snapshot', 'cube', 'facets',
+            'histograms', 'sample', 'drilldown', 'total'
+        })
+        self.assertIn('status', self.engine.load_timings)
+
+        erros = metrics.REGISTRY.counter('analytics_load_errors_total')
+        with override_settings(CSV_DATA_PATH=os.path.join(self.tmpdir.name, 'inexistente.csv'),
+                               ANALYTICS_SNAPSHOT_DIR=None), \
+                self.assertLogs('analytics.data_processor', 'ERROR'):
+            engine = BigDataAnalytics()
+        self.assertTrue(engine.df.empty)
+        self.assertEqual(metrics.REGISTRY.counter('analytics_load_errors_total'), erros + 1)
+
+
+class FacetTests(BigDataAnalyticsTestCase):
+    """
+    Opções dos filtros calculadas na carga e facetas em cascata
+    """
+
+    def test_facetas_iguais_ao_pandas(self):
+        df = self.engine.df
+        for filters in combinacoes_de_filtros(self.engine):
+            facetas = como_json(self.engine.get_facets(filters))
+            for coluna in COLUNAS_FILTRO:
+                mascara = np.ones(len(df), dtype=bool)
+                for outra, valor in filters.items():
+                    if outra != coluna:
+                        mascara &= (df[outra] == valor).to_numpy()
+                grupos = df[mascara].groupby(coluna, observed=True)['id_matricula']
+                esperado = {
+                    'valores': [str(v) for v in grupos.size().index],
+                    'total_registros': grupos.size().tolist(),
+                    'total_alunos': grupos.nunique().tolist()
+                }
+                self.assertEqual(facetas[coluna], esperado, (filters, coluna))
+
+    def test_opcoes_calculadas_na_carga(self):
+        self.assertIs(self.engine.get_unique_values(), self.engine.get_unique_values())
+        with mock.patch.object(pd.Series, 'unique', side_effect=AssertionError):
+            self.assertEqual(self.engine.get_unique_values()['tipos_nota'], ['MA', 'Mb1', 'Mb2', 'Mb3', 'Mb4'])
+
+    def test_endpoint_de_facetas(self):
+        filial = self.engine.get_unique_values()['filiais'][0]
+        with mock.patch.object(views, 'analytics_engine', self.engine):
+            response = self.client.post(
+                reverse('analytics:facets'), json.dumps({'id_filial': filial, 'status': 'Aprovado'}),
+                content_type='application/json'
+            )
+        self.assertEqual(response.status_code, 200)
+        facetas = response.json()['facets']
+        self.assertEqual(facetas, como_json(self.engine.get_facets({'id_filial': filial, 'status': 'Aprovado'})))
+        # Todo valor oferecido retorna dados combinado com os demais filtros
+        for valor, registros in zip(facetas['status']['valores'], facetas['status']['total_registros']):
+            df_filtered = self.engine.filter_data({'id_filial': filial, 'status': valor})
+            self.assertEqual(len(df_filtered), registros)
+
+
+class ApproximateModeTests(BigDataAnalyticsTestCase):
+    """
+    Modo aproximado: amostra estratificada de alunos e margens de erro
+    """
+
+    def carregar(self, taxa, minimo=0):
+        with override_settings(ANALYTICS_APPROX_SAMPLE_RATE=taxa, ANALYTICS_APPROX_MIN_STUDENTS=minimo,
+                               ANALYTICS_SNAPSHOT_DIR=None):
+            return BigDataAnalytics()
+
+    def test_amostra_coordenada_e_estratificada(self):
+        engine = self.carregar(0.3, minimo=40)
+        sorteados = engine.sample.indices >= 0
+        # Mesmo sorteio em outra carga (hash do id, não aleatório)
+        np.testing.assert_array_equal(self.carregar(0.3, minimo=40).sample.indices >= 0, sorteados)
+        # Todas as linhas dos alunos sorteados e só elas
+        codigos = engine.df['id_matricula'].array.codes
+        self.assertEqual(len(engine._amostra), np.count_nonzero(sorteados[codigos]))
+        # Cada filial com pelo menos min(40, alunos da filial) alunos esperados
+        filiais = engine.students['id_filial'].array.codes
+        for filial in np.unique(filiais):
+            do_estrato = filiais == filial
+            esperado = max(0.3, 40 / do_estrato.sum())
+            self.assertAlmostEqual(sorteados[do_estrato].mean(), min(1.0, esperado), delta=0.15)
+
+    def test_amostra_completa_igual_ao_exato(self):
+        engine = self.carregar(1.0)
+        np.testing.assert_array_equal(engine.sample.pesos, 1.0)
+        aproximado = como_json(engine.evaluate({}, CHART_TYPES, approximate=True))
+        exato = como_json(engine.evaluate({}, CHART_TYPES))
+        self.assertTrue(aproximado['statistics'].pop('aproximado'))
+        self.assertTrue(all(e in (0, None) for e in aproximado['statistics'].pop('erro').values()))
+        self.assertEqual(aproximado['statistics'], exato['statistics'])
+        for chart_type in CHART_TYPES:
+            chart = aproximado['charts'][chart_type]
+            self.assertTrue(chart.pop('aproximado'))
+            self.assertEqual(chart.pop('erro'), [0] * len(chart['data']))
+            for dataset in chart.get('datasets', []):
+                self.assertEqual(dataset.pop('erro'), [0] * len(chart['data']))
+            self.assertEqual(chart, exato['charts'][chart_type], chart_type)
+
+    def test_margens_cobrem_o_exato(self):
+        engine = self.carregar(0.5)
+        aproximado = engine.evaluate({}, CHART_TYPES, approximate=True)['statistics']
+        exato = self.engine.evaluate({}, CHART_TYPES)['statistics']
+        for chave in ['total_registros', 'total_alunos', 'media_geral', 'aprovados', 'recuperacao', 'reprovados']:
+            erro = aproximado['erro'][chave]
+            self.assertGreater(erro, 0, chave)
+            # Valores e margens arredondados (2 casas) na resposta
+            self.assertLessEqual(abs(aproximado[chave] - exato[chave]), erro + 0.011, chave)
+
+        # Com as mesmas linhas, o caminho aproximado também responde a get_statistics
+        amostra = engine.filter_data({}, approximate=True)
+        self.assertEqual(engine.get_statistics(amostra, approximate=True), aproximado)
+
+    def test_selecao_pequena_usa_o_exato(self):
+        engine = self.carregar(0.5)
+        filters = {'id_filial': engine.get_unique_values()['filiais'][0], 'tipo_nota_aval': 'MA'}
+        self.assertLess(len(engine.filter_data(filters, approximate=True)), 1000)
+        self.assertEqual(
+            como_json(engine.evaluate(filters, CHART_TYPES, approximate=True)),
+            como_json(engine.evaluate(filters, CHART_TYPES))
+        )
+
+    def test_views(self):
+        engine = self.carregar(0.5)
+        url = reverse('analytics:chart_data_batch')
+        with mock.patch.object(views, 'analytics_engine', engine):
+            exato = self.client.post(url, '{}', content_type='application/json')
+            aproximado = self.client.post(url, '{"approximate": true}', content_type='application/json')
+            relatorio = self.client.post(
+                reverse('analytics:generate_report'), '{"approximate": true, "chart_type": "status_alunos"}',
+                content_type='application/json'
+            )
+        self.assertNotIn('aproximado', exato.json()['statistics'])
+        self.assertTrue(aproximado.json()['statistics']['aproximado'])
+        self.assertNotEqual(exato['ETag'], aproximado['ETag'])
+        self.assertNotIn('aproximado', relatorio.json()['report']['estatisticas'])
+
+
+class PartitionTests(BigDataAnalyticsTestCase):
+    """
+    Dataset em partições por filial (a filial 1 também por ano)
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.partition_dir = os.path.join(cls.tmpdir.name, 'particoes')
+        particionar_csv(cls.csv_path, cls.partition_dir)
+
+    def carregar(self, memoria=2048):
+        with override_settings(ANALYTICS_PARTITION_DIR=self.partition_dir, ANALYTICS_PARTITION_MEMORY_MB=memoria):
+            return PartitionedAnalytics()
+
+    def test_resultados_iguais_ao_dataset_unico(self):
+        engine = self.carregar()
+        self.assertEqual(engine.partition_stats()['loaded'], 0)
+        for filters in combinacoes_de_filtros(self.engine):
+            self.assertEqual(
+                como_json(engine.evaluate(filters, CHART_TYPES)),
+                como_json(self.engine.evaluate(filters, CHART_TYPES)),
+                filters
+            )
+            self.assertEqual(como_json(engine.get_facets(filters)), como_json(self.engine.get_facets(filters)), filters)
+        self.assertEqual(engine.dataset_size(), self.engine.dataset_size())
+
+        valores = engine.get_unique_values()
+        self.assertEqual(valores['anos'], ['2023', '2024'])
+        self.assertEqual({k: v for k, v in valores.items() if k != 'anos'}, self.engine.get_unique_values())
+
+    def test_filtro_de_filial_carrega_so_a_particao(self):
+        engine = self.carregar()
+        engine.evaluate({'id_filial': '3', 'status': 'Aprovado'}, CHART_TYPES)
+        self.assertEqual(list(engine._engines), ['id_filial=3/notas'])
+        engine.evaluate({'id_filial': '1', 'ano': '2024'}, CHART_TYPES)
+        self.assertEqual(list(engine._engines), ['id_filial=3/notas', 'id_filial=1/ano=2024/notas'])
+
+        # Ano só seleciona partições: o mesmo que a filial 1 sem as matrículas de 2023
+        matriculas = engine._engines['id_filial=1/ano=2024/notas'].students['id_matricula']
+        estatisticas = engine.evaluate({'id_filial': '1', 'ano': '2024'}, ['status_alunos'])['statistics']
+        self.assertEqual(estatisticas['total_alunos'], len(matriculas))
+        self.assertNotEqual(
+            engine.cache_key({'id_filial': '1', 'ano': '2024'}, 'batch'), engine.cache_key({'id_filial': '1'}, 'batch')
+        )
+
+    def test_orcamento_de_memoria(self):
+        engine = self.carregar(memoria=0)
+        remocoes = metrics.REGISTRY.counter('analytics_partition_evictions_total')
+        resultado = como_json(engine.evaluate({}, CHART_TYPES))
+        self.assertEqual(resultado, como_json(self.engine.evaluate({}, CHART_TYPES)))
+        # Só a partição mais recente fica carregada
+        self.assertEqual(engine.partition_stats()['loaded'], 1)
+        self.assertEqual(metrics.REGISTRY.counter('analytics_partition_evictions_total') - remocoes, 5)
+
+    def test_views(self):
+        engine = self.carregar()
+        with mock.patch.object(views, 'analytics_engine', engine):
+            lote = self.client.post(
+                reverse('analytics:chart_data_batch'), '{"id_filial": "1", "ano": "2023"}',
+                content_type='application/json'
+            )
+            texto = self.client.get(reverse('analytics:metrics')).content.decode()
+        self.assertEqual(lote.status_code, 200)
+        esperado = engine.evaluate({'id_filial': '1', 'ano': '2023'}, ['status_alunos'])['statistics']
+        self.assertEqual(lote.json()['statistics'], como_json(esperado))
+
+        # Ano só entra nos filtros do dataset particionado
+        corpo = '{"id_filial": "1", "ano": "2023", "chart_type": "status_alunos"}'
+        for processador, filtros in ((engine, {'id_filial': '1', 'ano': '2023'}), (self.engine, {'id_filial': '1'})):
+            with mock.patch.object(views, 'analytics_engine', processador):
+                relatorio = self.client.post(reverse('analytics:generate_report'), corpo, content_type='application/json')
+            self.assertEqual(relatorio.json()['report']['filtros_aplicados'], filtros)
+        # Exportação: lotes das partições podadas
+        lotes = list(engine.iter_rows({'id_filial': '2'}, 97))
+        self.assertEqual(sum(len(lote) for lote in lotes), len(self.engine.filter_data({'id_filial': '2'})))
+        self.assertEqual(engine.columns(), self.engine.columns())
+        self.assertIn('analytics_partitions 6', texto)
+        self.assertIn('analytics_partitions_loaded 1', texto)
+
+    def test_detalhamento_carrega_so_as_particoes_do_aluno_e_da_turma(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        override = override_settings(ANALYTICS_SNAPSHOT_DIR=tmp.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        # A primeira instância grava o resumo de cada partição junto do snapshot
+        self.carregar()._maps()
+
+        engine = self.carregar()
+        cargas = metrics.REGISTRY.counter('analytics_partition_loads_total')
+        id_matricula = self.engine.students['id_matricula'][7]
+        self.assertEqual(engine.student_detail(id_matricula), self.engine.student_detail(id_matricula))
+        self.assertIsNone(engine.student_detail('nao-existe'))
+        self.assertEqual(metrics.REGISTRY.counter('analytics_partition_loads_total') - cargas, 1)
+
+        for serie_turma in self.engine.get_unique_values()['series_turmas']:
+            engine = self.carregar()
+            self.assertEqual(
+                engine.class_roster(serie_turma, 'nota_ma', False, None, 500),
+                self.engine.class_roster(serie_turma, 'nota_ma', False, None, 500)
+            )
+            self.assertEqual(set(engine._engines), set(engine._maps()[3][serie_turma]))
+        engine = self.carregar()
+        self.assertEqual(engine.class_roster('nao-existe', 'nota_ma', False, None, 10)['total'], 0)
+        self.assertEqual(engine.partition_stats()['loaded'], 0)
+
+    def test_opcoes_e_facetas_pelos_resumos(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        override = override_settings(ANALYTICS_SNAPSHOT_DIR=tmp.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.carregar().get_unique_values()
+
+        # Com os resumos gravados, opções e facetas por filial/ano não carregam partições
+        engine = self.carregar()
+        self.assertEqual({k: v for k, v in engine.get_unique_values().items() if k != 'anos'}, self.engine.get_unique_values())
+        for filters in ({}, {'id_filial': '3'}):
+            self.assertEqual(como_json(engine.get_facets(filters)), como_json(self.engine.get_facets(filters)), filters)
+        engine.get_facets({'id_filial': '1', 'ano': '2024'})
+        self.assertEqual(engine.partition_stats()['loaded'], 0)
+
+        # Outro filtro: só as partições da filial são carregadas; as demais
+        # entram na faceta de id_filial pelo resumo
+        filters = {'id_filial': '3', 'status': 'Aprovado'}
+        self.assertEqual(como_json(engine.get_facets(filters)), como_json(self.engine.get_facets(filters)))
+        self.assertEqual(list(engine._engines), ['id_filial=3/notas'])
+
+    def test_matricula_em_duas_particoes(self):
+        # Aluno transferido: parte das notas em outra filial, mesma matrícula
+        raiz = os.path.join(self.tmpdir.name, 'particoes-transferencia')
+        self.addCleanup(shutil.rmtree, raiz)
+        bruto = pd.read_csv(self.csv_path, dtype=str, keep_default_na=False)
+        id_matricula = bruto[bruto['id_filial'] == '3']['id_matricula'].iloc[0]
+        for filial, grupo in (('3', bruto[bruto['id_filial'] == '3']), ('9', bruto[bruto['id_matricula'] == id_matricula].assign(id_filial='9'))):
+            os.makedirs(os.path.join(raiz, f'id_filial={filial}'))
+            grupo.to_csv(os.path.join(raiz, f'id_filial={filial}', 'notas.csv'), index=False)
+        with override_settings(ANALYTICS_PARTITION_DIR=raiz):
+            engine = PartitionedAnalytics()
+
+        # Uma partição só: sem soma, sem erro
+        self.assertGreater(engine.evaluate({'id_filial': '3'}, [])['statistics']['total_alunos'], 0)
+        for consulta in (lambda: engine.evaluate({}, []), lambda: engine.get_facets({'status': 'Aprovado'}),
+                         lambda: engine.student_detail(id_matricula)):
+            with self.assertRaisesRegex(ValueError, f'Matrícula {id_matricula} em mais de uma partição'):
+                consulta()
+        with mock.patch.object(views, 'analytics_engine', engine):
+            response = self.client.post(reverse('analytics:chart_data_batch'), '{}', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('id_filial=3/notas, id_filial=9/notas', response.json()['error'])
+
+    def test_api_de_dataframe_nao_se_aplica(self):
+        engine = self.carregar()
+        for chamada in (lambda: engine.filter_data({}), lambda: engine.aggregate_data(None, 'status_alunos'),
+                        lambda: engine.get_statistics(None), lambda: engine.selection({})):
+            with self.assertRaises(NotImplementedError):
+                chamada()
+
+    def test_nova_particao_muda_a_versao(self):
+        engine = self.carregar()
+        engine.evaluate({'id_filial': '2'}, CHART_TYPES)
+        engine._refreshed_at -= engine.reload_interval + 1
+        self.assertIs(engine.refresh(), engine)
+
+        destino = os.path.join(self.partition_dir, 'id_filial=9')
+        os.makedirs(destino)
+        self.addCleanup(lambda: os.remove(os.path.join(destino, 'notas.csv')) or os.rmdir(destino))
+        pd.read_csv(os.path.join(self.partition_dir, 'id_filial=2', 'notas.csv'), dtype=str, keep_default_na=False) \
+            .assign(id_filial='9').to_csv(os.path.join(destino, 'notas.csv'), index=False)
+        engine._refreshed_at -= engine.reload_interval + 1
+        novo = engine.refresh()
+        self.assertNotEqual(novo.dataset_version, engine.dataset_version)
+        # A partição já carregada e inalterada é reaproveitada
+        self.assertIs(novo._engines['id_filial=2/notas'], engine._engines['id_filial=2/notas'])
+        self.assertIn('9', novo.get_unique_values()['filiais'])
+
+
+class HistogramTests(BigDataAnalyticsTestCase):
+    """
+    Gráfico distribuicao_notas a partir dos histogramas finos
+    """
+
+    def setUp(self):
+        self.engine.query_cache.clear()
+        patcher = mock.patch.object(views, 'analytics_engine', self.engine)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_faixas_e_percentis_iguais_ao_pandas(self):
+        opcoes = histogram.options(1, [10, 25, 50, 90, 100])
+        for filters in combinacoes_de_filtros(self.engine):
+            chart = self.engine.get_chart_payload(filters, 'distribuicao_notas', histogram_options=opcoes)['chart_data']
+            df_filtered = self.engine.filter_data(filters)
+            if df_filtered is None or df_filtered.empty:
+                self.assertEqual(chart['data'], [])
+                continue
+            notas = df_filtered['vlr_nota'].dropna().to_numpy(dtype=np.float64)
+            esperado = pd.Series(pd.cut(notas, bins=np.arange(11), include_lowest=True)).value_counts(sort=False)
+            self.assertEqual(chart['labels'][0], '0-1')
+            self.assertEqual(list(chart['data']), esperado.tolist(), filters)
+            percentis = np.percentile(notas, [10, 25, 50, 90, 100], method='inverted_cdf')
+            np.testing.assert_allclose(list(chart['percentis'].values()), percentis, atol=1e-4)
+
+    def test_largura_padrao_e_opcoes_invalidas(self):
+        url = reverse('analytics:chart_data')
+        padrao = self.client.post(url, json.dumps({}), content_type='application/json').json()['chart_data']
+        self.assertEqual(padrao['labels'], ['0-2', '2-4', '4-6', '6-8', '8-10'])
+        self.assertEqual(set(padrao['percentis']), {'p50', 'p90'})
+
+        fina = self.client.post(url, json.dumps({'bin_width': '0.5'}), content_type='application/json').json()
+        self.assertEqual(len(fina['chart_data']['labels']), 20)
+        self.assertEqual(sum(fina['chart_data']['data']), sum(padrao['data']))
+
+        for invalido in ({'bin_width': '0.25'}, {'bin_width': 'x'}, {'percentiles': [150]}):
+            response = self.client.post(url, json.dumps(invalido), content_type='application/json')
+            self.assertEqual(response.status_code, 400, invalido)
+            self.assertFalse(response.json()['success'])
+
+    def test_corpo_decodificado_uma_vez(self):
+        corpo = json.dumps({'bin_width': '0.5', 'approximate': False, 'chart_type': 'distribuicao_notas'})
+        for nome in ('chart_data', 'chart_data_batch', 'generate_report'):
+            with mock.patch.object(views.json, 'loads', wraps=json.loads) as loads:
+                response = self.client.post(reverse(f'analytics:{nome}'), corpo, content_type='application/json')
+            self.assertEqual(response.status_code, 200, nome)
+            self.assertEqual(loads.call_count, 1, nome)
+
+
+class DrilldownTests(BigDataAnalyticsTestCase):
+    """
+    Detalhamento por aluno e lista paginada de alunos por turma
+    """
+
+    def setUp(self):
+        patcher = mock.patch.object(views, 'analytics_engine', self.engine)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def paginas(self, serie_turma, **params):
+        """
+        Todas as páginas da lista pela API, seguindo next_cursor
+        """
+        alunos, cursor = [], None
+        while True:
+            query = dict(params, serie_turma=serie_turma, **({'cursor': cursor} if cursor else {}))
+            response = self.client.get(reverse('analytics:class_roster'), query)
+            self.assertEqual(response.status_code, 200)
+            pagina = response.json()
+            self.assertLessEqual(len(pagina['alunos']), int(params.get('limit', drilldown.LIMITE_PADRAO)))
+            alunos += pagina['alunos']
+            cursor = pagina['next_cursor']
+            if cursor is None:
+                return pagina['total'], alunos
+
+    def test_detalhe_igual_as_linhas_do_aluno(self):
+        df = self.engine.df
+        for id_matricula in self.engine.students['id_matricula'][:20]:
+            response = self.client.get(reverse('analytics:student'), {'id_matricula': id_matricula})
+            self.assertEqual(response.status_code, 200)
+            aluno = response.json()['aluno']
+            linhas = df[df['id_matricula'] == id_matricula]
+            self.assertEqual(aluno['status'], linhas['status'].iloc[0])
+            for disciplina in aluno['notas']:
+                for tipo in data_processor.TIPOS_NOTA:
+                    notas = linhas[
+                        (linhas['nome_disciplina'] == disciplina['nome_disciplina'])
+                        & (linhas['tipo_nota_aval'] == tipo)
+                    ]['vlr_nota'].dropna()
+                    if notas.empty:
+                        self.assertIsNone(disciplina[tipo])
+                    else:
+                        self.assertAlmostEqual(disciplina[tipo], notas.iloc[0], delta=0.006)
+            ma = linhas[linhas['tipo_nota_aval'] == 'MA']['vlr_nota'].dropna()
+            self.assertAlmostEqual(aluno['medias']['MA'], ma.mean(), delta=0.006)
+
+        response = self.client.get(reverse('analytics:student'), {'id_matricula': 'inexistente'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_paginas_iguais_a_ordenacao_completa(self):
+        alunos = self.engine.students
+        serie_turma = self.engine.get_unique_values()['series_turmas'][0]
+        da_turma = alunos[alunos['serie_turma'] == serie_turma]
+        for ordenacao in drilldown.ORDENACOES:
+            for ordem in ('asc', 'desc'):
+                total, pagina = self.paginas(serie_turma, sort=ordenacao, order=ordem, limit=7)
+                self.assertEqual(total, len(da_turma))
+                ids = [aluno['id_matricula'] for aluno in pagina]
+                self.assertEqual(sorted(ids), sorted(da_turma['id_matricula'].astype(str)))
+                chaves = [drilldown.sort_key(aluno, ordenacao, data_processor.STATUS_ALUNO) for aluno in pagina]
+                self.assertEqual(chaves, sorted(chaves, reverse=ordem == 'desc'), (ordenacao, ordem))
+
+    def test_opcoes_invalidas(self):
+        url = reverse('analytics:class_roster')
+        for query in [{}, {'serie_turma': 'x', 'sort': 'nome'}, {'serie_turma': 'x', 'limit': '0'},
+                      {'serie_turma': 'x', 'cursor': '@@'}]:
+            self.assertEqual(self.client.get(url, query).status_code, 400, query)
+        self.assertEqual(self.client.get(url, {'serie_turma': 'inexistente'}).json()['total'], 0)
+
+
+class SqliteTests(BigDataAnalyticsTestCase):
+    """
+    Consultas executadas no SQLite (ANALYTICS_SQLITE_PATH)
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.sqlite_path = os.path.join(cls.tmpdir.name, 'analytics.sqlite3')
+        cls.sql_engine = SqliteAnalytics(cls.sqlite_path)
+
+    def test_resultados_iguais_a_tabela_em_memoria(self):
+        engine = self.sql_engine
+        self.assertIsNone(engine.df)
+        self.assertEqual(engine.dataset_version, self.engine.dataset_version)
+        self.assertEqual(engine.dataset_size(), self.engine.dataset_size())
+        self.assertEqual(engine.get_unique_values(), self.engine.get_unique_values())
+        for filters in combinacoes_de_filtros(self.engine):
+            esperado = como_json(self.engine.evaluate(filters, CHART_TYPES))
+            obtido = como_json(engine.evaluate(filters, CHART_TYPES))
+            for chart_type in CHART_TYPES:
+                self.assertEqual(obtido['charts'][chart_type]['labels'], esperado['charts'][chart_type]['labels'])
+                np.testing.assert_allclose(
+                    obtido['charts'][chart_type]['data'], esperado['charts'][chart_type]['data'], atol=0.011
+                )
+            for chave, valor in esperado['statistics'].items():
+                self.assertAlmostEqual(obtido['statistics'][chave], valor, delta=0.011, msg=chave)
+            self.assertEqual(como_json(engine.get_facets(filters)), como_json(self.engine.get_facets(filters)), filters)
+
+            # API de DataFrame: filter_data materializa, a agregação volta ao banco
+            df_filtered = engine.filter_data(filters)
+            self.assertEqual(len(df_filtered), len(self.engine.filter_data(filters)))
+            self.assertEqual(engine.get_statistics(df_filtered)['total_alunos'], esperado['statistics']['total_alunos'])
+
+    def test_detalhamento_igual_a_tabela_em_memoria(self):
+        for id_matricula in self.engine.students['id_matricula'][:20]:
+            self.assertEqual(self.sql_engine.student_detail(id_matricula), self.engine.student_detail(id_matricula))
+        for serie_turma in self.engine.get_unique_values()['series_turmas']:
+            for ordenacao in drilldown.ORDENACOES:
+                depois = None
+                while True:
+                    esperado = self.engine.class_roster(serie_turma, ordenacao, True, depois, 9)
+                    self.assertEqual(self.sql_engine.class_roster(serie_turma, ordenacao, True, depois, 9), esperado)
+                    if esperado['next_cursor'] is None:
+                        break
+                    depois = drilldown.decode_cursor(esperado['next_cursor'])
+
+    def test_exportacao_e_reimportacao(self):
+        filters = {'id_filial': '2'}
+        esperado = b''.join(export.encode_batches(self.engine.iter_rows(filters, 50), 'csv', self.engine.columns()))
+        obtido = b''.join(export.encode_batches(self.sql_engine.iter_rows(filters, 50), 'csv', self.sql_engine.columns()))
+        self.assertEqual(obtido, esperado)
+
+        # Banco atualizado é reaproveitado; CSV alterado gera nova importação
+        self.assertNotIn('import', SqliteAnalytics(self.sqlite_path).load_timings)
+        with tempfile.TemporaryDirectory() as tmp:
+            csv_path = os.path.join(tmp, 'notas.csv')
+            shutil.copyfile(self.csv_path, csv_path)
+            with override_settings(CSV_DATA_PATH=csv_path):
+                engine = SqliteAnalytics(os.path.join(tmp, 'analytics.sqlite3'))
+                engine._refreshed_at -= engine.reload_interval + 1
+                self.assertIs(engine.refresh(), engine)
+                with open(csv_path, 'a', encoding='utf-8') as f:
+                    f.write('999999,99999,5.0,9,A,1ª Série,Matemática,MA\n')
+                engine._refreshed_at -= engine.reload_interval + 1
+                # A reimportação roda fora da requisição: o banco anterior
+                # responde até o novo ficar pronto
+                self.assertIs(engine.refresh(), engine)
+                engine._reimportacao.join()
+                novo = engine.refresh()
+                self.assertIsNot(novo, engine)
+                self.assertIn('import', novo.load_timings)
+                self.assertEqual(novo.evaluate({'id_filial': '9'}, [])['statistics']['reprovados'], 1)
+
+    def test_importacoes_concorrentes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            caminho = os.path.join(tmp, 'analytics.sqlite3')
+            resultados = []
+            threads = [
+                threading.Thread(target=lambda: resultados.append(sqlstore.ensure_imported(self.csv_path, caminho)))
+                for _ in range(3)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            # Uma importação; as demais esperam a trava e reabrem o banco
+            self.assertEqual(sum('import' in tempos for _, tempos in resultados), 1)
+            self.assertTrue(all(meta == resultados[0][0] for meta, _ in resultados))
+            self.assertEqual(int(resultados[0][0]['rows']), len(self.engine.df))
+            self.assertEqual(sorted(os.listdir(tmp)), ['analytics.sqlite3', 'analytics.sqlite3.lock'])
+
+
+class BenchmarkTests(SimpleTestCase):
+    """
+    Gerador sintético e medições do benchmark (escala mínima)
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.csv_path = os.path.join(self.tmp.name, 'notas.csv')
+
+    def test_gerador_deterministico(self):
+        synthetic.generate_csv(self.csv_path, 1234, seed=7)
+        outro = os.path.join(self.tmp.name, 'outro.csv')
+        synthetic.generate_csv(outro, 1234, seed=7)
+        with open(self.csv_path, 'rb') as a, open(outro, 'rb') as b:
+            self.assertEqual(a.read(), b.read())
+
+        df = pd.read_csv(self.csv_path)
+        self.assertEqual(list(df.columns), synthetic.COLUNAS)
+        self.assertEqual(len(df), 1234)
+        self.assertTrue(df['id_nota'].is_unique)
+        self.assertTrue(df['vlr_nota'].dropna().between(0, 10).all())
+
+    def test_medicoes(self):
+        synthetic.generate_csv(self.csv_path, 3000)
+        resultado = benchmark.run_benchmark(self.csv_path, repeticoes=1)
+        self.assertEqual(resultado['rows'], 3000)
+        self.assertEqual(len(resultado['filter_data']), 2 ** 5)
+        self.assertEqual(resultado['filter_data']['all']['rows'], 3000)
+        self.assertEqual(set(resultado['aggregate_data']['all']), set(CHART_TYPES))
+        self.assertGreater(resultado['peak_rss_mb'], 0)
+        json.dumps(resultado)
+
+        pior = json.loads(json.dumps({'scales': [{'target_rows': 3000, **resultado}]}))
+        pior['scales'][0]['load_data_s'] = resultado['load_data_s'] * 2 + 1
+        pioras = benchmark.compare({'scales': [{'target_rows': 3000, **resultado}]}, pior)
+        self.assertEqual([metrica for _, metrica, _, _ in pioras], ['load_data_s'])
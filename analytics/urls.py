@@ -9,6 +9,11 @@ app_name = 'analytics'
 urlpatterns = [
     path('', views.dashboard, name='dashboard'),
     path('api/chart-data/', views.get_chart_data, name='chart_data'),
+    path('api/chart-data/batch/', views.get_batch_chart_data, name='chart_data_batch'),
     path('api/generate-report/', views.generate_report, name='generate_report'),
+    path('api/facets/', views.get_facets, name='facets'),
+    path('api/students/', views.get_student, name='student'),
+    path('api/classes/roster/', views.get_class_roster, name='class_roster'),
+    path('api/metrics/', views.get_metrics, name='metrics'),
 ]
 
@@ -2,72 +2,233 @@
 Views para o sistema de análise de notas
 Implementa endpoints para dashboard e geração de relatórios
 """
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import parse_etags, quote_etag
 from django.views.decorators.http import require_http_methods
-from .data_processor import BigDataAnalytics
+from asgiref.sync import sync_to_async
+from . import drilldown, export, histogram, metrics, responses
+from .data_processor import BigDataAnalytics, CHART_TYPES, STATUS_ALUNO
+from .executor import BoundedExecutor, Saturated
+from .partitions import PartitionedAnalytics
+from .sqlstore import SqliteAnalytics
+import functools
+import hashlib
 import json
+import threading
 
 
-# Instância global do processador de dados (em produção, usar cache/Redis)
-analytics_engine = BigDataAnalytics()
+# Instância global do processador de dados (em produção, usar cache/Redis);
+# com ANALYTICS_PARTITION_DIR, o dataset particionado por filial/ano; com
+# ANALYTICS_SQLITE_PATH, as consultas executadas no SQLite
+if getattr(settings, 'ANALYTICS_PARTITION_DIR', None):
+    analytics_engine = PartitionedAnalytics()
+elif getattr(settings, 'ANALYTICS_SQLITE_PATH', None):
+    analytics_engine = SqliteAnalytics()
+else:
+    analytics_engine = BigDataAnalytics()
 
+# Apenas um thread por vez verifica/incorpora linhas novas do CSV
+_refresh_lock = threading.Lock()
 
-def dashboard(request):
+# Pool limitado onde roda o trabalho com pandas das views assíncronas: uma
+# agregação lenta não bloqueia o event loop e o excesso de requisições recebe
+# 503 em vez de ficar em uma fila sem limite
+_executor = BoundedExecutor(
+    max_workers=getattr(settings, 'ANALYTICS_EXECUTOR_WORKERS', 4),
+    max_pending=getattr(settings, 'ANALYTICS_EXECUTOR_QUEUE', 16)
+)
+RETRY_AFTER = getattr(settings, 'ANALYTICS_RETRY_AFTER', 1)
+
+# Linhas por lote na exportação (cada lote é codificado e enviado antes do próximo)
+EXPORT_BATCH_ROWS = getattr(settings, 'ANALYTICS_EXPORT_BATCH_ROWS', 10_000)
+
+
+def _engine():
+    """
+    Processador com os dados atuais
+    
+    Se o CSV recebeu linhas novas, uma nova versão é montada e a referência
+    global é trocada de uma vez; requisições em andamento continuam com a
+    versão que já obtiveram. Enquanto um thread atualiza, os demais seguem
+    com a versão atual, sem esperar.
+    """
+    global analytics_engine
+    if _refresh_lock.acquire(blocking=False):
+        try:
+            analytics_engine = analytics_engine.refresh()
+        finally:
+            _refresh_lock.release()
+    return analytics_engine
+
+
+async def _offload(view, request):
+    """
+    Executa a view síncrona no executor limitado; 503 com Retry-After
+    quando todas as vagas estão ocupadas
+    """
+    try:
+        return await _executor.run(view, request)
+    except Saturated:
+        response = JsonResponse({
+            'success': False,
+            'error': 'Servidor ocupado, tente novamente em instantes'
+        }, status=503)
+        response['Retry-After'] = str(RETRY_AFTER)
+        return response
+
+
+def _instrumented(endpoint):
+    """
+    Mede a view síncrona: histograma de latência por endpoint e chart_type
+    (rótulo definido pela view) e cabeçalho Server-Timing com os tempos de
+    filtro, agregação e estatísticas da requisição
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request):
+            with metrics.collect() as timings:
+                response = view(request)
+            metrics.REGISTRY.observe(
+                'analytics_request_duration_seconds', timings.elapsed(),
+                endpoint=endpoint, chart_type=timings.labels.get('chart_type', '')
+            )
+            response['Server-Timing'] = timings.server_timing()
+            return response
+        return wrapper
+    return decorator
+
+
+def _chart_label(chart_type):
+    """
+    Rótulo chart_type das métricas (valores desconhecidos agrupados, para não
+    criar uma série por valor enviado pelo cliente)
+    """
+    return chart_type if chart_type in CHART_TYPES else 'outro'
+
+
+async def dashboard(request):
     """
     View principal do dashboard com filtros e visualização
     """
+    return await _offload(_dashboard, request)
+
+
+@_instrumented('dashboard')
+def _dashboard(request):
     # Obter valores únicos para os filtros
-    unique_values = analytics_engine.get_unique_values()
+    unique_values = _engine().get_unique_values()
     
     context = {
         'filiais': unique_values['filiais'],
         'series_turmas': unique_values['series_turmas'],
         'disciplinas': unique_values['disciplinas'],
         'tipos_nota': unique_values['tipos_nota'],
-        'status_options': ['Aprovado', 'Recuperação', 'Reprovado']
+        'anos': unique_values.get('anos', []),
+        'status_options': STATUS_ALUNO
     }
     
     return render(request, 'analytics/dashboard.html', context)
 
 
+def _parse_request(request, engine):
+    """
+    Extrai filtros (sem os vazios) e tipo de gráfico do corpo JSON; retorna
+    também o corpo decodificado (lido uma vez por requisição) para as demais
+    opções
+    """
+    try:
+        data = json.loads(request.body)
+        if not isinstance(data, dict):
+            raise ValueError('o corpo da requisição deve ser um objeto JSON')
+    except ValueError:
+        # Corpo inválido: a requisição falha antes de saber o gráfico
+        metrics.set_label(chart_type='invalid')
+        raise
+    filters = {
+        'id_filial': data.get('id_filial', ''),
+        'serie_turma': data.get('serie_turma', ''),
+        'nome_disciplina': data.get('nome_disciplina', ''),
+        'tipo_nota_aval': data.get('tipo_nota_aval', ''),
+        'status': data.get('status', '')
+    }
+    # Ano só seleciona partições: nos demais processadores não é aplicado
+    # (nem aparece nos filtros do relatório)
+    if isinstance(engine, PartitionedAnalytics):
+        filters['ano'] = data.get('ano', '')
+    
+    # Remover filtros vazios
+    filters = {k: v for k, v in filters.items() if v}
+    
+    # Tipo de gráfico solicitado
+    chart_type = data.get('chart_type', 'distribuicao_notas')
+    
+    return filters, chart_type, data
+
+
+def _histogram_options(data):
+    """
+    Largura das faixas (bin_width) e percentis do gráfico distribuicao_notas
+    do corpo da requisição; ValueError se inválidos
+    """
+    return histogram.options(data.get('bin_width'), data.get('percentiles'))
+
+
+def _query_etag(engine, endpoint, filters, chart_type, approximate=False, histogram_options=None):
+    """
+    ETag da consulta: depende só da versão do dataset e da chave normalizada,
+    então pode ser comparado antes de qualquer processamento
+    """
+    key = engine.cache_key(filters, chart_type, approximate, histogram_options)
+    return quote_etag(hashlib.md5(repr((endpoint, key)).encode('utf-8')).hexdigest())
+
+
+def _not_modified(request, etag):
+    """
+    Verifica If-None-Match contra o ETag atual
+    """
+    if_none_match = request.headers.get('If-None-Match')
+    if not if_none_match:
+        return False
+    # Comparação fraca (RFC 9110): respostas comprimidas têm ETag W/"..."
+    etags = [e[2:] if e.startswith('W/') else e for e in parse_etags(if_none_match)]
+    return '*' in etags or etag in etags
+
+
 @require_http_methods(["POST"])
-def get_chart_data(request):
+async def get_chart_data(request):
     """
     API endpoint para obter dados do gráfico baseado nos filtros
     Retorna JSON com dados processados usando Big Data Analytics
     """
+    return await _offload(_get_chart_data, request)
+
+
+@_instrumented('chart_data')
+def _get_chart_data(request):
     try:
-        # Obter filtros do request
-        data = json.loads(request.body)
-        filters = {
-            'id_filial': data.get('id_filial', ''),
-            'serie_turma': data.get('serie_turma', ''),
-            'nome_disciplina': data.get('nome_disciplina', ''),
-            'tipo_nota_aval': data.get('tipo_nota_aval', ''),
-            'status': data.get('status', '')
-        }
-        
-        # Remover filtros vazios
-        filters = {k: v for k, v in filters.items() if v}
-        
-        # Tipo de gráfico solicitado
-        chart_type = data.get('chart_type', 'distribuicao_notas')
-        
-        # Filtrar dados
-        df_filtered = analytics_engine.filter_data(filters)
+        engine = _engine()
+        filters, chart_type, data = _parse_request(request, engine)
+        metrics.set_label(chart_type=_chart_label(chart_type))
+        # Modo aproximado (opcional): estimativas sobre a amostra, com margens de erro
+        approximate = bool(data.get('approximate'))
+        opcoes = _histogram_options(data)
         
-        # Agregar dados para o gráfico
-        chart_data = analytics_engine.aggregate_data(df_filtered, chart_type)
+        # Mesma consulta e mesmos dados: o navegador já tem a resposta
+        etag = _query_etag(engine, 'chart_data', filters, chart_type, approximate, opcoes)
+        if _not_modified(request, etag):
+            return HttpResponseNotModified(headers={'ETag': etag})
         
-        # Obter estatísticas
-        statistics = analytics_engine.get_statistics(df_filtered)
+        # Filtrar, agregar e calcular estatísticas (com cache de resultados)
+        payload = engine.get_chart_payload(filters, chart_type, approximate, opcoes)
         
-        return JsonResponse({
+        return responses.json_response(request, {
             'success': True,
-            'chart_data': chart_data,
-            'statistics': statistics
-        })
+            'chart_data': payload['chart_data'],
+            'statistics': payload['statistics']
+        }, etag=etag)
     
     except Exception as e:
         return JsonResponse({
@@ -77,43 +238,181 @@ def get_chart_data(request):
 
 
 @require_http_methods(["POST"])
-def generate_report(request):
+async def generate_report(request):
     """
     Gera dados para relatório em formato JSON
-    
     """
+    return await _offload(_generate_report, request)
+
+
+@_instrumented('generate_report')
+def _generate_report(request):
     try:
-        data = json.loads(request.body)
-        filters = {
-            'id_filial': data.get('id_filial', ''),
-            'serie_turma': data.get('serie_turma', ''),
-            'nome_disciplina': data.get('nome_disciplina', ''),
-            'tipo_nota_aval': data.get('tipo_nota_aval', ''),
-            'status': data.get('status', '')
-        }
+        engine = _engine()
+        filters, chart_type, data = _parse_request(request, engine)
+        metrics.set_label(chart_type=_chart_label(chart_type))
         
-        # Remover filtros vazios
-        filters = {k: v for k, v in filters.items() if v}
+        # Modo exportação: as próprias linhas filtradas, em CSV ou NDJSON
+        if data.get('export'):
+            metrics.set_label(chart_type='export')
+            return _export_response(request, engine, filters, data['export'], bool(data.get('gzip')))
         
-        chart_type = data.get('chart_type', 'distribuicao_notas')
+        opcoes = _histogram_options(data)
+        etag = _query_etag(engine, 'generate_report', filters, chart_type, histogram_options=opcoes)
+        if _not_modified(request, etag):
+            return HttpResponseNotModified(headers={'ETag': etag})
         
-        # Filtrar e agregar dados
-        df_filtered = analytics_engine.filter_data(filters)
-        chart_data = analytics_engine.aggregate_data(df_filtered, chart_type)
-        statistics = analytics_engine.get_statistics(df_filtered)
+        # Filtrar e agregar dados (relatórios são sempre exatos)
+        payload = engine.get_chart_payload(filters, chart_type, histogram_options=opcoes)
         
         # Criar relatório estruturado
         report = {
             'titulo': 'Relatório de Análise de Notas',
             'filtros_aplicados': filters,
-            'grafico': chart_data,
-            'estatisticas': statistics
+            'grafico': payload['chart_data'],
+            'estatisticas': payload['statistics']
         }
         
-        return JsonResponse({
+        return responses.json_response(request, {
             'success': True,
             'report': report
-        })
+        }, etag=etag)
+    
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=400)
+
+
+def _export_response(request, engine, filters, formato, comprimir):
+    """
+    Resposta em streaming com as linhas de filter_data
+    
+    As linhas são lidas do índice e codificadas em lotes de EXPORT_BATCH_ROWS
+    (com gzip opcional) à medida que o cliente consome a resposta, então a
+    memória do servidor não cresce com o tamanho do resultado. Sob ASGI o
+    corpo é um iterador assíncrono; sob WSGI, o próprio gerador síncrono (o
+    Django leria um iterador assíncrono inteiro antes de enviar o primeiro byte).
+    """
+    if formato not in export.FORMATS:
+        raise ValueError(f'Formato de exportação não suportado: {formato}')
+    content_type, extensao = export.FORMATS[formato]
+    
+    blocos = export.encode_batches(
+        engine.iter_rows(filters, EXPORT_BATCH_ROWS), formato, engine.columns()
+    )
+    nome = f'relatorio.{extensao}'
+    if comprimir:
+        blocos = export.gzip_chunks(blocos)
+        content_type, nome = 'application/gzip', f'{nome}.gz'
+    
+    if isinstance(request, ASGIRequest):
+        blocos = _aiter_blocks(blocos)
+    response = StreamingHttpResponse(blocos, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{nome}"'
+    return response
+
+
+async def _aiter_blocks(blocos):
+    """
+    Consome o gerador síncrono um bloco por vez em um thread, sem bloquear o
+    event loop (um iterador síncrono seria lido inteiro pelo Django sob ASGI)
+    """
+    proximo = sync_to_async(next, thread_sensitive=False)
+    while (bloco := await proximo(blocos, None)) is not None:
+        yield bloco
+
+
+@require_http_methods(["POST"])
+async def get_batch_chart_data(request):
+    """
+    API endpoint em lote: todos os tipos de gráfico (ou os listados em
+    'chart_types') e as estatísticas para um conjunto de filtros, em uma
+    única avaliação. O dashboard troca de gráfico sem nova requisição.
+    """
+    return await _offload(_get_batch_chart_data, request)
+
+
+@_instrumented('batch')
+def _get_batch_chart_data(request):
+    try:
+        engine = _engine()
+        filters, _, data = _parse_request(request, engine)
+        metrics.set_label(chart_type='batch')
+        chart_types = tuple(data.get('chart_types') or CHART_TYPES)
+        approximate = bool(data.get('approximate'))
+        opcoes = _histogram_options(data)
+        
+        etag = _query_etag(engine, 'batch', filters, chart_types, approximate, opcoes)
+        if _not_modified(request, etag):
+            return HttpResponseNotModified(headers={'ETag': etag})
+        
+        payload = engine.get_batch_payload(filters, chart_types, approximate, opcoes)
+        
+        return responses.json_response(request, {
+            'success': True,
+            'charts': payload['charts'],
+            'statistics': payload['statistics']
+        }, etag=etag)
+    
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=400)
+
+
+@require_http_methods(["POST"])
+async def get_facets(request):
+    """
+    API endpoint de facetas: para os filtros atuais, os valores de cada
+    dropdown que ainda retornam dados, com registros e alunos de cada um
+    """
+    return await _offload(_get_facets, request)
+
+
+@_instrumented('facets')
+def _get_facets(request):
+    try:
+        engine = _engine()
+        filters, _, _ = _parse_request(request, engine)
+        
+        etag = _query_etag(engine, 'facets', filters, 'facets')
+        if _not_modified(request, etag):
+            return HttpResponseNotModified(headers={'ETag': etag})
+        
+        return responses.json_response(request, {
+            'success': True,
+            'facets': engine.get_facets(filters)
+        }, etag=etag)
+    
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=400)
+
+
+@require_http_methods(["GET"])
+async def get_student(request):
+    """
+    Detalhamento de um aluno (?id_matricula=): notas Mb1-Mb4 e MA de cada
+    disciplina, médias e status
+    """
+    return await _offload(_get_student, request)
+
+
+@_instrumented('student')
+def _get_student(request):
+    try:
+        id_matricula = request.GET.get('id_matricula', '').strip()
+        if not id_matricula:
+            raise ValueError('id_matricula é obrigatório')
+        aluno = _engine().student_detail(id_matricula)
+        if aluno is None:
+            return JsonResponse({'success': False, 'error': 'Aluno não encontrado'}, status=404)
+        return responses.json_response(request, {'success': True, 'aluno': aluno})
     
     except Exception as e:
         return JsonResponse({
@@ -121,3 +420,78 @@ def generate_report(request):
             'error': str(e)
         }, status=400)
 
+
+@require_http_methods(["GET"])
+async def get_class_roster(request):
+    """
+    Lista paginada dos alunos de uma série/turma (?serie_turma=), ordenada
+    por sort (id_matricula, status, nota_ma ou menor_mb) e order (asc ou
+    desc); a próxima página é pedida com cursor=next_cursor
+    """
+    return await _offload(_get_class_roster, request)
+
+
+@_instrumented('class_roster')
+def _get_class_roster(request):
+    try:
+        serie_turma = request.GET.get('serie_turma', '').strip()
+        if not serie_turma:
+            raise ValueError('serie_turma é obrigatório')
+        ordenacao, decrescente, limite, depois = drilldown.options(
+            request.GET.get('sort'), request.GET.get('order'),
+            request.GET.get('limit'), request.GET.get('cursor')
+        )
+        pagina = _engine().class_roster(serie_turma, ordenacao, decrescente, depois, limite)
+        return responses.json_response(request, {'success': True, **pagina})
+    
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=400)
+
+
+@require_http_methods(["GET"])
+async def get_metrics(request):
+    """
+    Métricas no formato texto do Prometheus: latência por endpoint e
+    chart_type, tempo das etapas, linhas lidas, cache, executor e carga
+    
+    Lê só contadores (sem pandas nem verificação do CSV), então responde
+    direto no event loop, mesmo com o executor cheio.
+    """
+    texto = metrics.REGISTRY.render(_engine_metrics(analytics_engine))
+    return HttpResponse(texto, content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def _engine_metrics(engine):
+    """
+    Métricas lidas na hora do processador atual e do executor
+    """
+    cache = engine.query_cache.stats()
+    executor = _executor.stats()
+    linhas, alunos = engine.dataset_size()
+    extras = [
+        ('analytics_dataset_info', 'gauge', [({'version': engine.dataset_version}, 1)]),
+        ('analytics_dataset_rows', 'gauge', [({}, linhas)]),
+        ('analytics_dataset_students', 'gauge', [({}, alunos)]),
+        ('analytics_load_duration_seconds', 'gauge', [
+            ({'stage': etapa}, duracao) for etapa, duracao in sorted(engine.load_timings.items())
+        ]),
+        ('analytics_query_cache_entries', 'gauge', [({}, cache['entries'])]),
+        ('analytics_query_cache_hits_total', 'counter', [({}, cache['hits'])]),
+        ('analytics_query_cache_misses_total', 'counter', [({}, cache['misses'])]),
+        ('analytics_query_cache_evictions_total', 'counter', [({}, cache['evictions'])]),
+        ('analytics_query_coalesced_total', 'counter', [({}, cache['coalesced'])]),
+        ('analytics_executor_active', 'gauge', [({}, executor['active'])]),
+        ('analytics_executor_completed_total', 'counter', [({}, executor['completed'])]),
+        ('analytics_executor_rejected_total', 'counter', [({}, executor['rejected'])]),
+    ]
+    if isinstance(engine, PartitionedAnalytics):
+        particoes = engine.partition_stats()
+        extras += [
+            ('analytics_partitions', 'gauge', [({}, particoes['total'])]),
+            ('analytics_partitions_loaded', 'gauge', [({}, particoes['loaded'])]),
+            ('analytics_partition_memory_bytes', 'gauge', [({}, particoes['memory_bytes'])]),
+        ]
+    return extras
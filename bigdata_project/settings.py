@@ -89,3 +89,75 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # CSV Data Path
 CSV_DATA_PATH = os.path.join(BASE_DIR, 'data-1760299876054.csv')
 
+
+# Snapshot binário colunar da tabela processada (None desativa)
+ANALYTICS_SNAPSHOT_DIR = os.path.join(BASE_DIR, 'snapshot')
+
+# Cache de resultados das consultas do dashboard (LRU com TTL em segundos)
+ANALYTICS_QUERY_CACHE_SIZE = 256
+ANALYTICS_QUERY_CACHE_TTL = 300
+
+# Modo cubo OLAP: pré-agrega as dimensões de filtro na carga e responde o
+# dashboard sem percorrer as linhas (mais memória, latência constante)
+ANALYTICS_CUBE_MODE = False
+
+# Intervalo mínimo (segundos) entre verificações de linhas anexadas ao CSV;
+# as novas linhas são incorporadas sem reiniciar o processo (None desativa)
+ANALYTICS_RELOAD_INTERVAL = 5
+
+# Modo em fluxo para CSVs maiores que a memória: o arquivo é lido em blocos
+# de ANALYTICS_STREAMING_CHUNK_ROWS linhas e apenas agregados parciais por
+# aluno e por grupo ficam em memória (consultas respondidas por um cubo)
+ANALYTICS_STREAMING_MODE = False
+ANALYTICS_STREAMING_CHUNK_ROWS = 500_000
+
+# Processos usados na leitura do CSV (intervalos de bytes lidos em paralelo).
+# Padrão 1 = leitura serial; cada processo aloca os seus próprios buffers, então
+# aumente só onde houver CPUs e memória sobrando (ex.: os.cpu_count())
+ANALYTICS_CSV_WORKERS = 1
+
+# Dataset compartilhado entre os processos do servidor: os workers anexam
+# (memory mapping somente leitura) a versão publicada em ANALYTICS_SNAPSHOT_DIR
+# por 'manage.py publish_dataset --watch' e não leem o CSV
+ANALYTICS_SHARED_DATASET = False
+
+# Views assíncronas (ASGI): o processamento roda em um pool de
+# ANALYTICS_EXECUTOR_WORKERS threads com até ANALYTICS_EXECUTOR_QUEUE
+# requisições aguardando; acima disso a resposta é 503 com Retry-After
+ANALYTICS_EXECUTOR_WORKERS = 4
+ANALYTICS_EXECUTOR_QUEUE = 16
+ANALYTICS_RETRY_AFTER = 1
+
+# Exportação das linhas filtradas (generate_report com "export": "csv" ou
+# "ndjson"): linhas codificadas e enviadas por lote
+ANALYTICS_EXPORT_BATCH_ROWS = 10_000
+
+# Modo aproximado (requisições com "approximate": true): amostra de alunos
+# sorteada na carga, estratificada por filial, com esta taxa e pelo menos
+# ANALYTICS_APPROX_MIN_STUDENTS alunos por filial. Estimativas trazem a margem
+# de erro (95%); None desativa a amostra (tudo exato)
+ANALYTICS_APPROX_SAMPLE_RATE = 0.05
+ANALYTICS_APPROX_MIN_STUDENTS = 200
+
+# Dataset particionado: diretório com um CSV por filial e/ou ano letivo, no
+# layout id_filial=<filial>/ano=<ano>/<arquivo>.csv (None usa CSV_DATA_PATH).
+# As partições são carregadas na primeira consulta que as usa (com snapshot
+# próprio em ANALYTICS_SNAPSHOT_DIR/particoes) e removidas, das usadas há mais
+# tempo, quando a memória das carregadas passa de ANALYTICS_PARTITION_MEMORY_MB
+# (None = sem limite). Filtros por id_filial ou ano leem só as partições
+# correspondentes
+ANALYTICS_PARTITION_DIR = None
+ANALYTICS_PARTITION_MEMORY_MB = 2048
+
+# Agregação paralela (map-reduce): seleções com ao menos
+# ANALYTICS_PARALLEL_MIN_ROWS linhas são divididas por filial do aluno entre
+# ANALYTICS_PARALLEL_WORKERS processos, que mapeiam o snapshot (ou leem o CSV)
+# uma vez e devolvem somas parciais; 1 = agregação no próprio processo
+ANALYTICS_PARALLEL_WORKERS = 1
+ANALYTICS_PARALLEL_MIN_ROWS = 1_000_000
+
+# Armazenamento em SQLite para instâncias com pouca memória: o CSV é importado
+# (uma vez, e de novo quando muda) para este arquivo, com índices nas colunas
+# de filtro, e as consultas do dashboard viram agregações SQL; nenhuma linha
+# fica em memória (None usa a tabela em memória)
+ANALYTICS_SQLITE_PATH = None